@@ -0,0 +1,297 @@
+# async_engine.py
+"""
+asyncio fetch engine built on one pooled aiohttp client.
+
+All fetches share a single TCPConnector with a global connection limit, a per-host
+limit, a DNS cache and HTTP keep-alive, so one process can keep thousands of fetches
+in flight. Parsing and classification are blocking, so each fetched page is handed
+to a small thread pool.
+"""
+
+import asyncio
+import concurrent.futures
+import time
+import aiohttp
+import fetcher
+from metrics import metrics
+from error_logger import ErrorCollector
+from fetcher import (Page, fetch_counter, is_html_content_type, declared_length, header_value, skip_dead_host,
+                     record_host_failure, check_parked, previous_record, request_timeout, download_deadline)
+from tail_latency import alternate_urls, deadline_remaining, get_latency_tracker
+
+
+class AsyncFetcher:
+    """
+    Pooled aiohttp client with global and per-host concurrency limits.
+    """
+    def __init__(self, concurrency=1000, per_host=8, dns_ttl=300, keepalive=30):
+        """
+        Args:
+            concurrency (int): Maximum number of open connections across all hosts
+            per_host (int): Maximum number of open connections to a single host
+            dns_ttl (int): Seconds to cache DNS lookups
+            keepalive (int): Seconds to keep idle connections open for reuse
+
+        Byte budget, deadline and socket timeouts come from fetcher.fetch_limits.
+        """
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.dns_ttl = dns_ttl
+        self.keepalive = keepalive
+        self.session = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.concurrency,
+            limit_per_host=self.per_host,
+            use_dns_cache=True,
+            ttl_dns_cache=self.dns_ttl,
+            keepalive_timeout=self.keepalive,
+        )
+        limits = fetcher.fetch_limits
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=limits.timeout, sock_read=limits.timeout),
+            trace_configs=[_timing_trace()],
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.session.close()
+
+    async def fetch_page(self, url, error_logger=None):
+        """
+        Fetch a URL exactly once and return a Page, or None on connection failure.
+        The body is streamed and reading stops early for non-HTML content types,
+        once max_bytes have been read, or when the deadline passes. Hosts cached as
+        dead are not contacted, and parked-domain pages are marked as skipped.
+        """
+        if skip_dead_host(url, error_logger):
+            return None
+        with metrics.span("fetch", url, cpu=False):
+            if get_latency_tracker().hedge:
+                return await self._hedged_fetch(url, error_logger)
+            return await self._fetch_page(url, error_logger)
+
+    async def _hedged_fetch(self, url, error_logger):
+        """
+        While no page has arrived after the host's p95 latency, race the fetch
+        against the next alternate URL. The first page to arrive wins and the
+        other attempts are cancelled.
+        """
+        tracker = get_latency_tracker()
+        delay = tracker.hedge_delay_for(url, fetcher.fetch_limits.timeout)
+        alternates = alternate_urls(url)
+        # task -> (errors collected by the attempt, True for a hedge)
+        attempts = {}
+
+        def start(request_url, hedge):
+            collector = ErrorCollector()
+            task = asyncio.ensure_future(self._fetch_page(url, collector, request_url, hedge))
+            attempts[task] = (collector, hedge)
+
+        start(url, False)
+        winner = None
+        try:
+            while winner is None:
+                pending = {task for task in attempts if not task.done()}
+                if not pending:
+                    break
+                done, _ = await asyncio.wait(pending, timeout=delay if alternates else None,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Still waiting after the delay: race the next alternate. Failed attempts are not retried.
+                    tracker.record_hedge()
+                    start(alternates.pop(0), True)
+                winner = next((task for task in done if task.result() is not None), None)
+        finally:
+            for task in attempts:
+                task.cancel()
+
+        if winner is None:
+            # Every attempt failed; report the first attempt's errors
+            collector, _ = next(iter(attempts.values()))
+            page = None
+        else:
+            collector, hedge = attempts[winner]
+            page = winner.result()
+            if hedge:
+                tracker.record_hedge_win()
+        if error_logger:
+            for error in collector.errors:
+                error_logger.log_error(*error)
+        return page
+
+    async def _fetch_page(self, url, error_logger, request_url=None, hedge=False):
+        request_url = request_url or url
+        if deadline_remaining() == 0:
+            # The run deadline passed; the run labels the URL 'i'
+            return None
+        fetch_counter.record(url)
+        limits = fetcher.fetch_limits
+        deadline = download_deadline()
+        started = time.monotonic()
+        previous = previous_record(url)
+        timeout = request_timeout(request_url)
+        headers_received = False
+        try:
+            async with self.session.get(
+                request_url, headers=previous.request_headers() if previous else None,
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout),
+            ) as response:
+                metrics.observe("fetch_headers", time.monotonic() - started, url)
+                get_latency_tracker().observe_fetch(request_url, time.monotonic() - started)
+                headers_received = True
+                headers = dict(response.headers)
+                if response.status == 304 and previous is not None:
+                    metrics.inc("not_modified")
+                    return Page(url, 304, str(response.url), headers, b'', previous=previous)
+                length = declared_length(headers)
+                if not is_html_content_type(headers):
+                    reason = f"Skipped non-HTML content type: {header_value(headers, 'Content-Type')}"
+                    if error_logger:
+                        error_logger.log_error("content", url, reason)
+                    fetch_counter.record_body(0, length or 0, skipped_page=True)
+                    return Page(url, response.status, str(response.url), headers, b'', skipped_reason=reason)
+
+                chunks = []
+                size = 0
+                truncated = False
+                while size < limits.max_bytes:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        truncated = True
+                        break
+                    try:
+                        chunk = await asyncio.wait_for(response.content.read(limits.chunk_size), remaining)
+                    except asyncio.TimeoutError:
+                        truncated = True
+                        break
+                    if not chunk:
+                        break
+                    chunks.append(chunk)
+                    size += len(chunk)
+                else:
+                    truncated = not response.content.at_eof()
+                content = b''.join(chunks)[:limits.max_bytes]
+                skipped = max(0, length - len(content)) if length is not None and truncated else 0
+                fetch_counter.record_body(len(content), skipped, truncated=truncated)
+                return check_parked(Page(
+                    url=url,
+                    status_code=response.status,
+                    final_url=str(response.url),
+                    headers=headers,
+                    content=content,
+                    truncated=truncated,
+                    previous=previous,
+                ), error_logger)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            if not headers_received:
+                get_latency_tracker().observe_fetch(request_url, time.monotonic() - started)
+            if not hedge:
+                record_host_failure(url, e, timeout)
+            if error_logger:
+                error_logger.log_error("connection", url, f"Connection error: {e or type(e).__name__}")
+            return None
+
+
+def _timing_trace():
+    """aiohttp hooks recording DNS resolution and connection setup times."""
+    trace = aiohttp.TraceConfig()
+
+    async def start(session, context, params):
+        context.started = time.monotonic()
+
+    def finish(name):
+        async def end(session, context, params):
+            metrics.observe(name, time.monotonic() - context.started)
+        return end
+
+    trace.on_dns_resolvehost_start.append(start)
+    trace.on_dns_resolvehost_end.append(finish("dns"))
+    trace.on_connection_create_start.append(start)
+    trace.on_connection_create_end.append(finish("connect"))
+    return trace
+
+
+async def _run(urls, handle_page, on_result, error_logger, concurrency, per_host, max_workers, window, deadline):
+    loop = asyncio.get_running_loop()
+    in_flight = asyncio.Semaphore(concurrency)
+    # Bounds the number of URLs pulled from the iterator but not yet finished
+    backlog = asyncio.Semaphore(window)
+    pending = set()
+    timed_out = False
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        async with AsyncFetcher(concurrency=concurrency, per_host=per_host) as fetcher:
+
+            async def process(url):
+                # No error may escape: gather() in dispatch() would abort the whole run
+                try:
+                    labels = None
+                    try:
+                        async with in_flight:
+                            page = await fetcher.fetch_page(url, error_logger)
+                    except Exception as e:
+                        # e.g. an invalid URL or a host name IDNA cannot encode
+                        if error_logger:
+                            error_logger.log_error("connection", url, f"Connection error: {e or type(e).__name__}")
+                    else:
+                        try:
+                            labels = await loop.run_in_executor(executor, handle_page, url, page)
+                        except Exception as e:
+                            if error_logger:
+                                error_logger.log_error("executor", url, f"Task execution error: {e}")
+                    try:
+                        on_result(url, labels)
+                    except Exception as e:
+                        if error_logger:
+                            error_logger.log_error("executor", url, f"Result handling error: {e}")
+                finally:
+                    backlog.release()
+
+            async def dispatch():
+                for url in urls:
+                    await backlog.acquire()
+                    task = asyncio.create_task(process(url))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+
+                if pending:
+                    await asyncio.gather(*pending)
+
+            try:
+                await asyncio.wait_for(dispatch(), None if deadline is None else max(0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                # The run deadline passed; the caller labels the stragglers
+                timed_out = True
+                stragglers = list(pending)
+                for task in stragglers:
+                    task.cancel()
+                await asyncio.gather(*stragglers, return_exceptions=True)
+    finally:
+        # Do not wait for pages still being labeled when the deadline cut the run off
+        executor.shutdown(wait=not timed_out, cancel_futures=True)
+
+
+def run_async(urls, handle_page, on_result, error_logger=None, concurrency=1000, per_host=8, max_workers=20,
+              window=None, deadline=None):
+    """
+    Fetch URLs on the event loop and label each page in a worker thread.
+
+    Args:
+        urls (iterable): URLs to process (already carrying a scheme), read lazily
+        handle_page (callable): handle_page(url, page) -> labels, run in a worker thread
+        on_result (callable): on_result(url, labels), called as each URL completes;
+            labels is None if handle_page raised
+        error_logger (ErrorLogger): Optional error logger
+        concurrency (int): Global limit on fetches in flight
+        per_host (int): Per-host connection limit
+        max_workers (int): Threads used for parsing and classification
+        window (int): Maximum URLs read from the iterator but not yet finished
+        deadline (float): time.monotonic() at which to stop waiting for URLs in flight, or None
+    """
+    window = window or concurrency * 2
+    asyncio.run(_run(urls, handle_page, on_result, error_logger, concurrency, per_host, max_workers, window,
+                     deadline))
@@ -0,0 +1,129 @@
+# batcher.py
+"""
+Collects classification requests from many worker threads into size- and
+token-bounded batches so several pages are classified with one model request.
+
+Workers block on a future while their page waits in a batch. A batch is sent
+when it reaches max_batch_size pages, when adding a page would exceed
+max_batch_tokens, or when its oldest page has waited flush_timeout seconds.
+"""
+
+import concurrent.futures
+import queue
+import threading
+import time
+from tokens import estimate_tokens
+from metrics import metrics
+
+
+class _Item:
+    def __init__(self, content, topics, url_type, url):
+        self.content = content
+        self.topics = topics
+        self.url_type = url_type
+        self.url = url
+        self.tokens = estimate_tokens(content)
+        self.future = concurrent.futures.Future()
+        self.enqueued_at = time.monotonic()
+
+
+class ClassificationBatcher:
+    """
+    Groups pages by (topics, url_type) and sends each group with send_batch.
+    """
+    def __init__(self, send_batch, max_batch_size=20, max_batch_tokens=100_000, flush_timeout=0.5,
+                 max_concurrent_batches=4):
+        """
+        Args:
+            send_batch (callable): send_batch(contents, topics, url_type, urls) -> list with one
+                {topic: label} dict (or None if the model gave no verdict) per page
+            max_batch_size (int): Maximum pages per request
+            max_batch_tokens (int): Maximum estimated content tokens per request
+            flush_timeout (float): Seconds a page may wait before a partial batch is sent
+            max_concurrent_batches (int): Batches that may be in flight at once
+        """
+        self.send_batch = send_batch
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.flush_timeout = flush_timeout
+        self.batches_sent = 0
+        self.pages_sent = 0
+        self._queue = queue.Queue()
+        self._groups = {}
+        self._senders = concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrent_batches)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, content, topics, url_type, url=None):
+        """Queue a page and return a future resolving to its {topic: label} dict."""
+        item = _Item(content, tuple(topics), url_type, url)
+        self._queue.put(item)
+        return item.future
+
+    def classify(self, content, topics, url_type, url=None):
+        """Queue a page and block until its batch has been classified."""
+        return self.submit(content, topics, url_type, url).result()
+
+    def close(self):
+        """Send any partial batches and stop the background thread."""
+        self._queue.put(None)
+        self._thread.join()
+        self._senders.shutdown(wait=True)
+
+    def get_summary(self):
+        """Return a one-line summary of batching."""
+        average = self.pages_sent / self.batches_sent if self.batches_sent else 0.0
+        return f"Batched {self.pages_sent} pages into {self.batches_sent} requests ({average:.1f} pages/request)"
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self._next_deadline())
+            except queue.Empty:
+                item = False
+            if item is None:
+                for key in list(self._groups):
+                    self._flush(key)
+                return
+            if item:
+                self._add(item)
+            # Send partial batches whose oldest page has waited long enough
+            now = time.monotonic()
+            for key, items in list(self._groups.items()):
+                if now - items[0].enqueued_at >= self.flush_timeout:
+                    self._flush(key)
+
+    def _next_deadline(self):
+        if not self._groups:
+            return None
+        oldest = min(items[0].enqueued_at for items in self._groups.values())
+        return max(0.0, oldest + self.flush_timeout - time.monotonic())
+
+    def _add(self, item):
+        key = (item.topics, item.url_type)
+        items = self._groups.get(key)
+        if items and sum(i.tokens for i in items) + item.tokens > self.max_batch_tokens:
+            self._flush(key)
+        self._groups.setdefault(key, []).append(item)
+        if len(self._groups[key]) >= self.max_batch_size:
+            self._flush(key)
+
+    def _flush(self, key):
+        items = self._groups.pop(key, None)
+        if items:
+            self.batches_sent += 1
+            self.pages_sent += len(items)
+            metrics.inc("batches_sent")
+            metrics.inc("batched_pages", len(items))
+            self._senders.submit(self._send, key, items)
+
+    def _send(self, key, items):
+        topics, url_type = key
+        try:
+            results = self.send_batch([i.content for i in items], list(topics), url_type, [i.url for i in items])
+        except Exception as e:
+            for item in items:
+                item.future.set_exception(e)
+            return
+        for item, labels in zip(items, results):
+            item.future.set_result(labels)
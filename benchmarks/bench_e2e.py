@@ -0,0 +1,221 @@
+# benchmarks/bench_e2e.py
+"""
+End-to-end throughput benchmark of process_file against local HTTP and model stubs.
+
+A synthetic corpus server (benchmarks/corpus_server.py) and the fake Gemini endpoint
+(benchmarks/fake_gemini.py) run in this process; each engine and worker count is
+measured in a fresh child process running the real process_file, so peak RSS and
+CPU are per run. Reports URLs/sec, p50/p95/p99 per-URL latency (first span start to
+last span end, from the metrics trace), peak RSS, and CPU per stage. Results are
+written as JSON; pass a previous result file with --baseline to compare commits.
+
+Usage:
+    python -m benchmarks.bench_e2e [--urls 2000] [--workers 10,50] [--engines threads,async]
+        [--output bench_e2e.json] [--baseline previous.json]
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from benchmarks.corpus_server import start_corpus_server
+from benchmarks.fake_gemini import start_fake_gemini
+
+
+def percentiles(values, quantiles=(0.5, 0.95, 0.99)):
+    """Nearest-rank percentiles of a list of values."""
+    if not values:
+        return {f"p{round(q * 100)}": 0.0 for q in quantiles}
+    values = sorted(values)
+    return {f"p{round(q * 100)}": round(values[min(len(values) - 1, int(q * len(values)))], 6)
+            for q in quantiles}
+
+
+def url_latencies(trace_file):
+    """Per-URL latency from the first span start to the last span end in a metrics trace."""
+    spans = {}
+    with open(trace_file, "r", encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            start = record["ts"] - record["seconds"]
+            first, last = spans.get(record["url"], (start, record["ts"]))
+            spans[record["url"]] = (min(first, start), max(last, record["ts"]))
+    return [last - first for first, last in spans.values()]
+
+
+def run_child(config):
+    """Run process_file once in this process and write the measurements to config["result_file"]."""
+    import main
+    from metrics import get_metrics
+    from rate_limiter import configure_rate_limiter
+
+    configure_rate_limiter(config["rpm"], 100_000_000, config["max_retries"])
+    metrics = get_metrics()
+    metrics.start_trace(config["trace_file"])
+    start = time.perf_counter()
+    main.process_file(config["input_file"], "p", config["workers"], engine=config["engine"],
+                      concurrency=config["workers"], per_host=config["workers"],
+                      batch_size=config["batch_size"], stats_file=config["stats_file"])
+    seconds = time.perf_counter() - start
+    metrics.close()
+
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    with open(os.path.splitext(config["input_file"])[0] + "_labeled.txt", "r", encoding="utf-8") as f:
+        labels = Counter(line.rsplit(" ", 1)[-1].strip() for line in f if line.strip())
+    snapshot = metrics.snapshot()
+    result = {
+        "seconds": round(seconds, 3),
+        "urls_per_sec": round(config["urls"] / seconds, 2),
+        "latency": percentiles(url_latencies(config["trace_file"])),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": round(max(own.ru_maxrss, children.ru_maxrss) / 1024, 1),
+        "cpu_seconds": {
+            "user": round(own.ru_utime + children.ru_utime, 3),
+            "system": round(own.ru_stime + children.ru_stime, 3),
+            "child_processes": round(children.ru_utime + children.ru_stime, 3),
+            "by_stage": snapshot["cpu_seconds"],
+        },
+        "labels": dict(labels),
+        "stage_latency": {name: {key: histogram[key] for key in ("count", "p50", "p95", "p99")}
+                          for name, histogram in snapshot["histograms"].items()},
+        "counters": snapshot["counters"],
+    }
+    with open(config["result_file"], "w", encoding="utf-8") as f:
+        json.dump(result, f)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(runs, baseline_file):
+    """Print URLs/sec and p95 latency changes against a previous result file."""
+    with open(baseline_file, "r", encoding="utf-8") as f:
+        baseline = {(run["engine"], run["workers"]): run for run in json.load(f)["runs"]}
+    print()
+    print(f"Compared with {baseline_file}:")
+    print(f"{'engine':<10}{'workers':>8}{'urls/sec':>12}{'change':>9}{'p95 (s)':>10}{'change':>9}")
+    for run in runs:
+        before = baseline.get((run["engine"], run["workers"]))
+        if before is None:
+            continue
+        speed = run["urls_per_sec"] / before["urls_per_sec"] - 1 if before["urls_per_sec"] else 0.0
+        p95 = run["latency"]["p95"] / before["latency"]["p95"] - 1 if before["latency"]["p95"] else 0.0
+        print(f"{run['engine']:<10}{run['workers']:>8}{run['urls_per_sec']:>12.1f}{speed:>+9.1%}"
+              f"{run['latency']['p95']:>10.3f}{p95:>+9.1%}")
+
+
+def main_bench(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--urls", type=int, default=2000)
+    parser.add_argument("--workers", default="10,50", help="Comma-separated worker counts")
+    parser.add_argument("--engines", default="threads,async", help="Comma-separated engines")
+    parser.add_argument("--page-size", type=int, default=20_000, help="Approximate page size in characters")
+    parser.add_argument("--latency", type=float, default=0.05, help="Corpus server latency per request (s)")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Extra random corpus latency of up to (s)")
+    parser.add_argument("--error-rate", type=float, default=0.02, help="Fraction of pages failing with HTTP errors")
+    parser.add_argument("--encodings", default="utf-8,gbk,big5", help="Comma-separated page encodings")
+    parser.add_argument("--gemini-latency", type=float, default=0.1, help="Fake Gemini latency per request (s)")
+    parser.add_argument("--throttle-rate", type=float, default=0.01, help="Fraction of Gemini requests given 429")
+    parser.add_argument("--rpm", type=float, default=600_000, help="Rate limiter requests/minute")
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_e2e.json", help="Result file (default: bench_e2e.json)")
+    parser.add_argument("--baseline", help="Previous result file to compare against")
+    parser.add_argument("--verbose", action="store_true", help="Show the output of each run")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        with open(args.child, "r", encoding="utf-8") as f:
+            return run_child(json.load(f))
+
+    corpus, corpus_state, corpus_url = start_corpus_server(
+        page_size=args.page_size, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        encodings=tuple(args.encodings.split(",")), seed=args.seed,
+    )
+    gemini, gemini_state, gemini_url = start_fake_gemini(latency=args.gemini_latency,
+                                                         throttle_rate=args.throttle_rate, answer="p")
+    env = dict(os.environ, GEMINI_BASE_URL=gemini_url, GOOGLE_API_KEY=os.environ.get("GOOGLE_API_KEY", "fake"))
+    output = None if args.verbose else subprocess.DEVNULL
+
+    runs = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for engine in args.engines.split(","):
+            for workers in (int(count) for count in args.workers.split(",")):
+                run_dir = os.path.join(tmp, f"{engine}-{workers}")
+                os.makedirs(run_dir)
+                input_file = os.path.join(run_dir, "drugs.txt")
+                with open(input_file, "w", encoding="utf-8") as f:
+                    for i in range(args.urls):
+                        f.write(f"{corpus_url}/page/{i}\n")
+                config = {
+                    "engine": engine, "workers": workers, "urls": args.urls, "input_file": input_file,
+                    "rpm": args.rpm, "max_retries": args.max_retries, "batch_size": args.batch_size,
+                    "trace_file": os.path.join(run_dir, "trace.jsonl"),
+                    "stats_file": os.path.join(run_dir, "stats.json"),
+                    "result_file": os.path.join(run_dir, "result.json"),
+                }
+                config_file = os.path.join(run_dir, "config.json")
+                with open(config_file, "w", encoding="utf-8") as f:
+                    json.dump(config, f)
+
+                gemini_before = (gemini_state.requests, gemini_state.throttled)
+                fetches_before = corpus_state.requests
+                subprocess.run([sys.executable, "-m", "benchmarks.bench_e2e", "--child", config_file],
+                               env=env, check=True, stdout=output, stderr=output)
+                with open(config["result_file"], "r", encoding="utf-8") as f:
+                    result = json.load(f)
+                result["corpus_requests"] = corpus_state.requests - fetches_before
+                result["gemini_requests"] = gemini_state.requests - gemini_before[0]
+                result["gemini_throttled"] = gemini_state.throttled - gemini_before[1]
+                runs.append({"engine": engine, "workers": workers, **result})
+                print(f"{engine:<10}{workers:>8} workers: {result['urls_per_sec']:.1f} URLs/sec, "
+                      f"p95 {result['latency']['p95']:.3f}s")
+    corpus.shutdown()
+    gemini.shutdown()
+
+    report = {
+        "commit": git_commit(),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "settings": {key: value for key, value in vars(args).items()
+                     if key not in ("output", "baseline", "verbose", "child")},
+        "runs": runs,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print()
+    print(f"{'engine':<10}{'workers':>8}{'urls/sec':>10}{'p50 (s)':>9}{'p95 (s)':>9}{'p99 (s)':>9}"
+          f"{'RSS MB':>8}{'CPU s':>8}")
+    for run in runs:
+        latency = run["latency"]
+        cpu = run["cpu_seconds"]
+        print(f"{run['engine']:<10}{run['workers']:>8}{run['urls_per_sec']:>10.1f}{latency['p50']:>9.3f}"
+              f"{latency['p95']:>9.3f}{latency['p99']:>9.3f}{run['peak_rss_mb']:>8.1f}"
+              f"{cpu['user'] + cpu['system']:>8.2f}")
+        stages = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in sorted(cpu["by_stage"].items()))
+        print(f"{'':<18}CPU by stage: {stages or 'none recorded'}")
+    print(f"Results written to {args.output}")
+    if args.baseline:
+        compare(runs, args.baseline)
+
+
+if __name__ == "__main__":
+    main_bench()
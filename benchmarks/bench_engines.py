@@ -0,0 +1,58 @@
+# benchmarks/bench_engines.py
+"""
+Compare URLs/sec of the thread-per-URL executor against the async engine.
+
+Fetches are served by a local stub HTTP server and classification is stubbed out,
+so only fetching, extraction and scheduling are measured.
+
+Usage:
+    python -m benchmarks.bench_engines [--urls 2000] [--latency 0.05] [--workers 20]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import main
+from benchmarks.stub_server import start_stub_server
+
+
+def stub_classify(content, topic, url_type="-", url=None, error_logger=None):
+    return 'u'
+
+
+def run_engine(engine, input_file, workers, concurrency):
+    start = time.perf_counter()
+    main.process_file(input_file, "p", workers, engine=engine, concurrency=concurrency, per_host=concurrency)
+    return time.perf_counter() - start
+
+
+def main_bench(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--urls", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub server latency per request (s)")
+    parser.add_argument("--workers", type=int, default=20, help="Executor threads")
+    parser.add_argument("--concurrency", type=int, default=500, help="Async engine in-flight limit")
+    args = parser.parse_args(argv)
+
+    main.classify_website = stub_classify
+    server, base_url = start_stub_server(latency=args.latency)
+    with tempfile.TemporaryDirectory() as tmp:
+        input_file = os.path.join(tmp, "drugs.txt")
+        with open(input_file, "w", encoding="utf-8") as f:
+            for i in range(args.urls):
+                f.write(f"{base_url}/page/{i}\n")
+
+        timings = {}
+        for engine in ("threads", "async"):
+            timings[engine] = run_engine(engine, input_file, args.workers, args.concurrency)
+    server.shutdown()
+
+    print()
+    print(f"{'engine':<10}{'seconds':>10}{'urls/sec':>12}")
+    for engine, seconds in timings.items():
+        print(f"{engine:<10}{seconds:>10.2f}{args.urls / seconds:>12.1f}")
+
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,81 @@
+# benchmarks/bench_extractors.py
+"""
+Compare extraction time and output of each HTML extraction backend against the
+original BeautifulSoup implementation over a corpus of saved pages.
+
+Pass a directory of saved .html files with --corpus; without it a synthetic
+corpus of large, deeply nested mixed Chinese/English pages is generated.
+
+Usage:
+    python -m benchmarks.bench_extractors [--corpus saved_pages/] [--repeat 3]
+"""
+
+import argparse
+import os
+import random
+import time
+from extractors import BeautifulSoupExtractor, available_extractors, make_extractor
+
+
+def synthetic_corpus(count=40, seed=0):
+    """Generate pages with nested spans, scripts, navigation and long bodies."""
+    rng = random.Random(seed)
+    words = ["casino", "betting", "poker", "news", "weather", "shop", "赌博", "博彩", "彩票", "新闻", "天气", "商店"]
+    pages = []
+    for i in range(count):
+        blocks = []
+        for _ in range(rng.randint(200, 2000)):
+            sentence = " ".join(rng.choice(words) for _ in range(rng.randint(5, 30)))
+            blocks.append(f"<div><p>{sentence} <span>{sentence[:40]} <span>{sentence[:10]}</span></span></p></div>")
+        pages.append(
+            f"<html><head><title>Page {i}</title><script>{'var x=1;' * 2000}</script>"
+            f"<style>{'p{color:red}' * 500}</style></head><body>"
+            f"<nav>{'<a href=#>Home</a>' * 200}</nav>{''.join(blocks)}"
+            f"<footer>{'Copyright ' * 100}</footer></body></html>"
+        )
+    return pages
+
+
+def load_corpus(directory):
+    pages = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith((".html", ".htm")):
+            with open(os.path.join(directory, name), "rb") as f:
+                pages.append(f.read().decode("utf-8", errors="replace"))
+    return pages
+
+
+def word_overlap(a, b):
+    """Jaccard similarity of the word sets of two texts."""
+    a, b = set(a.split()), set(b.split())
+    return len(a & b) / len(a | b) if a | b else 1.0
+
+
+def main_bench(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--corpus", help="Directory of saved .html pages")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    pages = load_corpus(args.corpus) if args.corpus else synthetic_corpus()
+    total_mb = sum(len(page) for page in pages) / 1e6
+    print(f"Corpus: {len(pages)} pages, {total_mb:.1f} MB")
+
+    reference = [BeautifulSoupExtractor().extract(page) for page in pages]
+    print(f"{'backend':<13}{'seconds':>9}{'ms/page':>10}{'MB/s':>8}{'avg chars':>11}{'overlap vs bs4':>16}")
+    for name in available_extractors():
+        extractor = make_extractor(name)
+        best = None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            outputs = [extractor.extract(page) for page in pages]
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        chars = sum(len(text) for text in outputs) / len(pages)
+        overlap = sum(word_overlap(a, b) for a, b in zip(outputs, reference)) / len(pages)
+        print(f"{name:<13}{best:>9.3f}{1000 * best / len(pages):>10.1f}{total_mb / best:>8.1f}"
+              f"{chars:>11.0f}{overlap:>16.2f}")
+
+
+if __name__ == "__main__":
+    main_bench()
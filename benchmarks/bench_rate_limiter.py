@@ -0,0 +1,54 @@
+# benchmarks/bench_rate_limiter.py
+"""
+Exercise the adaptive rate limiter against a local fake Gemini endpoint that
+throttles requests beyond a requests/second quota and injects 503 errors.
+
+Reports throughput, how many requests the endpoint throttled, how many retries
+the limiter made, and how many calls gave up with the distinct error label.
+
+Usage:
+    python -m benchmarks.bench_rate_limiter [--calls 400] [--threads 50] [--quota 20]
+"""
+
+import argparse
+import concurrent.futures
+import os
+import time
+from collections import Counter
+from benchmarks.fake_gemini import start_fake_gemini
+
+
+def main_bench(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--threads", type=int, default=50)
+    parser.add_argument("--quota", type=int, default=20, help="Fake endpoint requests/second before 429")
+    parser.add_argument("--error-rate", type=float, default=0.05, help="Fraction of requests failing with 503")
+    parser.add_argument("--rpm", type=float, default=6000, help="Limiter's configured requests/minute")
+    parser.add_argument("--max-retries", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    server, state, base_url = start_fake_gemini(quota_per_second=args.quota, error_rate=args.error_rate, answer="p")
+    os.environ["GEMINI_BASE_URL"] = base_url
+    os.environ.setdefault("GOOGLE_API_KEY", "fake")
+    import main
+    from rate_limiter import configure_rate_limiter
+    limiter = configure_rate_limiter(args.rpm, 100_000_000, args.max_retries)
+    limiter.base_delay = 0.2
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.threads) as executor:
+        labels = Counter(executor.map(
+            lambda i: main.classify_website(f"page {i} 示例", "drugs", "p"), range(args.calls)
+        ))
+    seconds = time.perf_counter() - start
+    server.shutdown()
+
+    print(f"calls:           {args.calls} in {seconds:.1f}s ({args.calls / seconds:.1f}/s, quota {args.quota}/s)")
+    print(f"labels:          {dict(labels)}")
+    print(f"endpoint:        {state.requests} requests, {state.throttled} throttled, {state.errors} errors")
+    print(limiter.get_summary())
+
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,120 @@
+# benchmarks/corpus_server.py
+"""
+Local HTTP server serving a reproducible synthetic corpus of HTML pages.
+
+Every path maps to one page chosen deterministically from the path and seed, so
+repeated runs see exactly the same corpus. Page size, per-request latency (with
+jitter), the share of requests failing with HTTP errors and the mix of character
+encodings are configurable. Pages mix English and Chinese text, navigation and
+footer boilerplate, scripts and styles like real sites.
+"""
+
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+WORDS = ["casino", "betting", "poker", "news", "weather", "shop", "travel", "health", "sports", "music",
+         "赌博", "博彩", "彩票", "新闻", "天气", "商店", "旅游", "健康", "体育", "音乐"]
+
+ERROR_STATUSES = (404, 500, 503)
+
+# Distinct pages generated per encoding; paths are spread over them
+PAGES_PER_ENCODING = 32
+
+
+def make_page(rng, page_size, index):
+    """Generate one HTML page of roughly page_size characters."""
+    head = (f"<html><head><title>Synthetic page {index}</title>"
+            f"<meta name=\"description\" content=\"{' '.join(rng.choice(WORDS) for _ in range(12))}\">"
+            f"<script>{'var x=1;' * 50}</script><style>{'p{color:red}' * 20}</style></head><body>"
+            f"<nav>{'<a href=#>Home</a><a href=#>About</a>' * 10}</nav>")
+    tail = f"<footer>{'Copyright Example Ltd. ' * 5}</footer></body></html>"
+    blocks = []
+    size = len(head) + len(tail)
+    while size < page_size:
+        sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 30)))
+        block = f"<h2>{sentence[:30]}</h2><div><p>{sentence}</p></div>"
+        blocks.append(block)
+        size += len(block)
+    return head + "".join(blocks) + tail
+
+
+class CorpusState:
+    """Corpus settings, pre-encoded pages and request counters shared by all handler threads."""
+    def __init__(self, page_size=20_000, latency=0.0, jitter=0.0, error_rate=0.0, encodings=("utf-8",), seed=0):
+        """
+        Args:
+            page_size (int): Approximate page size in characters
+            latency (float): Seconds to wait before answering
+            jitter (float): Extra random latency of up to this many seconds
+            error_rate (float): Fraction of paths answered with 404/500/503
+            encodings (tuple): Character encodings pages are served in, picked per path
+            seed (int): Seed making the corpus and the failing paths reproducible
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.seed = seed
+        self.pages = {}
+        rng = random.Random(seed)
+        for encoding in encodings:
+            self.pages[encoding] = [
+                make_page(rng, page_size, i)
+                .replace("<head>", f"<head><meta charset=\"{encoding}\">", 1)
+                .encode(encoding, errors="xmlcharrefreplace")
+                for i in range(PAGES_PER_ENCODING)
+            ]
+        self.encodings = list(encodings)
+        self.requests = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+
+    def response_for(self, path):
+        """Return (status, encoding, body, delay) for a path, the same on every run."""
+        rng = random.Random(zlib.crc32(f"{self.seed}:{path}".encode("utf-8")))
+        delay = self.latency + rng.random() * self.jitter
+        if rng.random() < self.error_rate:
+            return rng.choice(ERROR_STATUSES), "utf-8", b"<html><body>Error</body></html>", delay
+        encoding = rng.choice(self.encodings)
+        return 200, encoding, rng.choice(self.pages[encoding]), delay
+
+
+class CorpusHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None
+
+    def do_GET(self):
+        state = self.state
+        status, encoding, body, delay = state.response_for(self.path)
+        if delay:
+            time.sleep(delay)
+        with state._lock:
+            state.requests += 1
+            state.errors += status != 200
+            state.bytes_sent += len(body)
+        self.send_response(status)
+        self.send_header("Content-Type", f"text/html; charset={encoding}")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class CorpusServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def start_corpus_server(host="127.0.0.1", port=0, **settings):
+    """Start the corpus server in a background thread and return (server, state, base_url)."""
+    state = CorpusState(**settings)
+    handler = type("Handler", (CorpusHandler,), {"state": state})
+    server = CorpusServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state, f"http://{host}:{server.server_address[1]}"
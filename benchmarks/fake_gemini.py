@@ -0,0 +1,142 @@
+# benchmarks/fake_gemini.py
+"""
+Local fake of the Gemini generateContent API for benchmarks and manual testing.
+
+Point the classifier at it with GEMINI_BASE_URL. Responses follow the request's
+response schema: a single character for text prompts, a JSON object of false
+verdicts for multi-topic prompts and a JSON array for batched prompts. The server
+can add latency, throttle requests beyond a requests/second quota with 429, and
+fail a fraction of requests with 503. Context caches can be created and are
+counted; they expire after their TTL like real ones, and requests referencing an
+expired or unknown cache are rejected with 404.
+"""
+
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        state = self.state
+        if self.path.split("?")[0].endswith("/cachedContents"):
+            request = json.loads(body or b"{}")
+            ttl = float(str(request.get("ttl", "3600s")).rstrip("s"))
+            with state._lock:
+                state.context_caches += 1
+                name = f"cachedContents/fake-{state.context_caches}"
+                state.cache_expiry[name] = time.monotonic() + ttl
+            return self._send_json(200, {"name": name, **request})
+        cached = json.loads(body or b"{}").get("cachedContent")
+        if cached and state.cache_expiry.get(cached, 0) <= time.monotonic():
+            with state._lock:
+                state.missing_caches += 1
+            return self._send_json(404, {"error": {"code": 404, "message": f"CachedContent not found: {cached}",
+                                                   "status": "NOT_FOUND"}})
+        if state.latency:
+            time.sleep(state.latency)
+        status = state.admit()
+        if status != 200:
+            return self._send_json(status, {"error": {"code": status, "message": "injected", "status": "UNAVAILABLE"
+                                                     if status == 503 else "RESOURCE_EXHAUSTED"}})
+
+        request = json.loads(body or b"{}")
+        text = self._answer(request)
+        payload = {
+            "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP",
+                            "index": 0}],
+            "usageMetadata": {"promptTokenCount": len(body) // 4, "candidatesTokenCount": 1},
+        }
+        if ":streamGenerateContent" in self.path:
+            data = f"data: {json.dumps(payload)}\r\n\r\n".encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        else:
+            self._send_json(200, payload)
+
+    def _answer(self, request):
+        config = request.get("generationConfig", {})
+        schema = config.get("responseSchema") or config.get("responseJsonSchema") or {}
+        prompt = " ".join(part.get("text", "") for content in request.get("contents", [])
+                          for part in content.get("parts", []))
+        schema_type = str(schema.get("type", "")).upper()
+        if schema_type == "ARRAY":
+            properties = schema.get("items", {}).get("properties", {})
+            count = len(re.findall(r"WEBSITE (\d+) CONTENT", prompt))
+            return json.dumps([{**{name: False for name in properties if name != "index"}, "index": i}
+                               for i in range(1, count + 1)])
+        if schema_type == "OBJECT":
+            return json.dumps({name: False for name in schema.get("properties", {})})
+        return self.state.answer
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeGeminiState:
+    """Counters and fault-injection settings shared by all handler threads."""
+    def __init__(self, latency=0.0, quota_per_second=None, error_rate=0.0, throttle_rate=0.0, answer="u"):
+        self.latency = latency
+        self.quota_per_second = quota_per_second
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.answer = answer
+        self.requests = 0
+        self.context_caches = 0
+        # cache name -> time.monotonic() at which it expires
+        self.cache_expiry = {}
+        self.missing_caches = 0
+        self.throttled = 0
+        self.errors = 0
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        self._lock = threading.Lock()
+
+    def admit(self):
+        """Return the HTTP status for the next request."""
+        with self._lock:
+            self.requests += 1
+            now = time.monotonic()
+            if now - self._window_start >= 1.0:
+                self._window_start, self._window_count = now, 0
+            self._window_count += 1
+            over_quota = self.quota_per_second is not None and self._window_count > self.quota_per_second
+            if over_quota or random.random() < self.throttle_rate:
+                self.throttled += 1
+                return 429
+            if random.random() < self.error_rate:
+                self.errors += 1
+                return 503
+            return 200
+
+
+class FakeGeminiServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def start_fake_gemini(host="127.0.0.1", port=0, **settings):
+    """Start the fake endpoint in a background thread and return (server, state, base_url)."""
+    state = FakeGeminiState(**settings)
+    handler = type("Handler", (FakeGeminiHandler,), {"state": state})
+    server = FakeGeminiServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state, f"http://{host}:{server.server_address[1]}"
@@ -0,0 +1,126 @@
+# benchmarks/load_service.py
+"""
+Load-test the classification service against a local corpus server and a stubbed model.
+
+The corpus server and fake Gemini endpoint run in this process; service.py runs
+as a child process in a temporary directory, so its caches start cold. Clients send
+single-URL requests at a fixed concurrency, drawing from a pool of distinct URLs so
+that repeats exercise request coalescing and the warm caches. Reports requests/sec
+and p50/p95/p99 latency as seen by the clients.
+
+Usage:
+    python -m benchmarks.load_service [--requests 2000] [--concurrency 50] [--distinct-urls 500]
+"""
+
+import argparse
+import concurrent.futures
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import requests
+from benchmarks.bench_e2e import percentiles
+from benchmarks.corpus_server import start_corpus_server
+from benchmarks.fake_gemini import start_fake_gemini
+
+
+def wait_for_service(base_url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(base_url + "/health", timeout=1).ok:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Service at {base_url} did not start")
+
+
+def run_load(base_url, urls, total, concurrency, seed=0):
+    """Send total requests from concurrency client threads; returns (seconds, latencies, statuses)."""
+    rng = random.Random(seed)
+    plan = [rng.choice(urls) for _ in range(total)]
+    local = threading.local()
+
+    def request(url):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        started = time.perf_counter()
+        response = session.get(base_url + "/classify", params={"url": url}, timeout=120)
+        return time.perf_counter() - started, response.status_code
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(request, plan))
+    seconds = time.perf_counter() - start
+    return seconds, [latency for latency, _ in results], [status for _, status in results]
+
+
+def main_bench(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50, help="Client threads")
+    parser.add_argument("--distinct-urls", type=int, default=500, help="Pool of URLs requests are drawn from")
+    parser.add_argument("--warmup", type=int, default=50, help="Unmeasured requests sent first")
+    parser.add_argument("--latency", type=float, default=0.02, help="Corpus server latency per request (s)")
+    parser.add_argument("--page-size", type=int, default=20_000, help="Approximate page size in characters")
+    parser.add_argument("--gemini-latency", type=float, default=0.05, help="Fake Gemini latency per request (s)")
+    parser.add_argument("--port", type=int, default=18080, help="Service port")
+    parser.add_argument("--service-args", default="", help="Extra service.py options, e.g. '--batch-size 1'")
+    parser.add_argument("--output", default=None, help="Also write the results as JSON")
+    args = parser.parse_args(argv)
+
+    corpus, _, corpus_url = start_corpus_server(page_size=args.page_size, latency=args.latency)
+    gemini, gemini_state, gemini_url = start_fake_gemini(latency=args.gemini_latency, answer="p")
+    env = dict(os.environ, GEMINI_BASE_URL=gemini_url, GOOGLE_API_KEY=os.environ.get("GOOGLE_API_KEY", "fake"))
+    service_script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "service.py")
+    base_url = f"http://127.0.0.1:{args.port}"
+    urls = [f"{corpus_url}/page/{i}" for i in range(args.distinct_urls)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        service = subprocess.Popen(
+            [sys.executable, service_script, "--port", str(args.port), "--topics", "drugs", *args.service_args.split()],
+            cwd=tmp, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            wait_for_service(base_url)
+            if args.warmup:
+                run_load(base_url, urls, args.warmup, min(args.concurrency, args.warmup), seed=1)
+            gemini_before = gemini_state.requests
+            seconds, latencies, statuses = run_load(base_url, urls, args.requests, args.concurrency)
+            health = requests.get(base_url + "/health", timeout=5).json()
+        finally:
+            service.terminate()
+            service.wait(timeout=60)
+    corpus.shutdown()
+    gemini.shutdown()
+
+    result = {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "distinct_urls": args.distinct_urls,
+        "seconds": round(seconds, 3),
+        "requests_per_sec": round(args.requests / seconds, 1),
+        "latency": percentiles(latencies),
+        "errors": sum(status != 200 for status in statuses),
+        "model_requests": gemini_state.requests - gemini_before,
+        "coalesced": health["coalesced"],
+    }
+    print(f"requests:        {args.requests} in {seconds:.1f}s ({result['requests_per_sec']}/s, "
+          f"concurrency {args.concurrency}, {args.distinct_urls} distinct URLs)")
+    print(f"latency:         p50 {result['latency']['p50'] * 1000:.1f}ms, p95 {result['latency']['p95'] * 1000:.1f}ms, "
+          f"p99 {result['latency']['p99'] * 1000:.1f}ms")
+    print(f"model requests:  {result['model_requests']}, {result['coalesced']} requests coalesced, "
+          f"{result['errors']} errors")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main_bench()
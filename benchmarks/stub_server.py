@@ -0,0 +1,47 @@
+# benchmarks/stub_server.py
+"""
+Local stub HTTP server for benchmarks. Serves a small HTML page for every path,
+with an optional artificial latency, over HTTP/1.1 keep-alive.
+"""
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+PAGE = (
+    "<html><head><title>Stub page</title></head><body>"
+    "<h1>Stub page {path}</h1><p>Lorem ipsum dolor sit amet, consectetur adipiscing elit.</p>"
+    "<p>示例文本 用于基准测试</p></body></html>"
+)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        body = PAGE.format(path=self.path).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def start_stub_server(latency=0.0, host="127.0.0.1", port=0):
+    """Start the stub server in a background thread and return (server, base_url)."""
+    handler = type("Handler", (StubHandler,), {"latency": latency})
+    server = StubServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
@@ -0,0 +1,146 @@
+# classification_cache.py
+"""
+Persistent, content-addressed cache of classification labels.
+
+Labels are keyed by a hash of the normalized page text together with the topic,
+url_type, prompt version and model name, so identical pages (mirrors, parked
+domains, CDN error pages, re-runs) are only sent to the model once. Entries are
+evicted by age and, beyond a maximum entry count, least recently used first.
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from metrics import metrics
+
+
+DEFAULT_CACHE_FILE = "classification_cache.sqlite"
+
+
+def content_hash(text):
+    """Hash the page text after collapsing whitespace and case."""
+    normalized = ' '.join(text.split()).lower()
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+class ClassificationCache:
+    """
+    Thread-safe SQLite cache of (content hash, topic, url_type, prompt version, model) -> label.
+    """
+    def __init__(self, cache_file=DEFAULT_CACHE_FILE, max_entries=1_000_000, max_age_days=30):
+        """
+        Args:
+            cache_file (str): Path of the SQLite cache file, shared across runs
+            max_entries (int): Maximum number of cached labels to keep
+            max_age_days (float): Entries older than this are discarded
+        """
+        self.cache_file = cache_file
+        self.max_entries = max_entries
+        self.max_age = max_age_days * 86400
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(cache_file, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS labels ("
+            " content_hash TEXT NOT NULL,"
+            " topic TEXT NOT NULL,"
+            " url_type TEXT NOT NULL,"
+            " prompt_version TEXT NOT NULL,"
+            " model TEXT NOT NULL,"
+            " label TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (content_hash, topic, url_type, prompt_version, model))"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS labels_last_used ON labels (last_used)")
+        self.evict()
+
+    def get(self, text, topic, url_type, prompt_version, model):
+        """Return the cached label for the page text, or None on a miss."""
+        key = (content_hash(text), topic, url_type, prompt_version, model)
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT label, created_at FROM labels WHERE content_hash = ? AND topic = ?"
+                " AND url_type = ? AND prompt_version = ? AND model = ?",
+                key,
+            ).fetchone()
+            if row is None or time.time() - row[1] > self.max_age:
+                self.misses += 1
+                metrics.inc("cache_misses")
+                return None
+            self.conn.execute(
+                "UPDATE labels SET last_used = ? WHERE content_hash = ? AND topic = ?"
+                " AND url_type = ? AND prompt_version = ? AND model = ?",
+                (time.time(), *key),
+            )
+            self.hits += 1
+            metrics.inc("cache_hits")
+            return row[0]
+
+    def put(self, text, topic, url_type, prompt_version, model, label):
+        """Store a label for the page text."""
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO labels VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (content_hash(text), topic, url_type, prompt_version, model, label, now, now),
+            )
+            self._puts += 1
+            if self._puts % 100 == 0:
+                self._evict()
+                self.conn.commit()
+
+    def evict(self):
+        """Drop expired entries and trim the cache to max_entries."""
+        with self._lock:
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        self.conn.execute("DELETE FROM labels WHERE created_at < ?", (time.time() - self.max_age,))
+        self.conn.execute(
+            "DELETE FROM labels WHERE rowid IN ("
+            " SELECT rowid FROM labels ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def commit(self):
+        """Make pending cache writes durable."""
+        with self._lock:
+            self.conn.commit()
+
+    def reset_stats(self):
+        """Reset the hit and miss counters at the start of a run."""
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def get_summary(self):
+        """Return a one-line summary of cache hits and misses."""
+        lookups = self.hits + self.misses
+        rate = 100.0 * self.hits / lookups if lookups else 0.0
+        return f"Classification cache: {self.hits} hits, {self.misses} misses ({rate:.1f}% hit rate)"
+
+    def close(self):
+        with self._lock:
+            self._evict()
+            self.conn.commit()
+            self.conn.close()
+
+
+# Create a global cache to share across worker threads; None disables caching
+label_cache = None
+
+def configure_cache(cache_file=DEFAULT_CACHE_FILE, max_entries=1_000_000, max_age_days=30):
+    """Open the global classification cache."""
+    global label_cache
+    label_cache = ClassificationCache(cache_file, max_entries, max_age_days)
+    return label_cache
+
+def get_cache():
+    """Return the global classification cache, or None if caching is disabled."""
+    return label_cache
@@ -15,7 +15,7 @@ organize_files() {
 
       if [[ $file == *labeled.txt ]]; then
         mv "$file" results/
-      elif [[ $file == *.log ]]; then
+      elif [[ $file == *.log || $file == *_stats.json || $file == *_errors.jsonl ]]; then
         mv "$file" log/
       elif [[ $file == *.txt ]]; then
         mv "$file" raw/
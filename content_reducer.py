@@ -0,0 +1,165 @@
+# content_reducer.py
+"""
+Token-budgeted reduction of extracted page text before classification.
+
+Pages repeat the same menu, footer and boilerplate lines many times, and a blind
+character cut can spend the whole prompt on them. reduce_blocks drops repeated
+blocks (whole paragraphs, list items, cells...). A page that then fits the token
+budget is kept in document order; otherwise the title, meta description and
+headings are chosen first and longer text blocks before short ones, up to the
+budget measured with the local estimate from tokens.py, and the chosen blocks are
+sent in document order.
+"""
+
+import threading
+from tokens import estimate_tokens
+from metrics import metrics
+
+
+# Default content tokens sent per page; 0 disables the budget
+DEFAULT_TOKEN_BUDGET = 4000
+
+# Text blocks shorter than this are usually menu items, buttons or labels
+MIN_INFORMATIVE_TOKENS = 8
+
+# Blocks are packed in this order; document order is kept within a rank
+KIND_RANK = {'title': 0, 'meta': 0, 'heading': 1}
+
+
+def _truncate_to_tokens(text, tokens):
+    """Cut text to at most the given number of estimated tokens."""
+    cut = len(text) * tokens // max(1, estimate_tokens(text))
+    while cut > 0 and estimate_tokens(text[:cut]) > tokens:
+        cut = cut * 9 // 10
+    return text[:cut]
+
+
+def reduce_blocks(blocks, token_budget=DEFAULT_TOKEN_BUDGET):
+    """
+    Deduplicate (kind, text) blocks and, if they exceed token_budget tokens, keep the
+    highest ranked ones that fit. Blocks are returned in document order.
+
+    Returns (text, tokens_before, tokens_after), where tokens_before is the estimate
+    for the blocks as extracted.
+    """
+    seen = set()
+    unique = []
+    tokens_before = 0
+    for position, (kind, text) in enumerate(blocks):
+        tokens = estimate_tokens(text)
+        tokens_before += tokens
+        key = ' '.join(text.lower().split())
+        if key in seen:
+            continue
+        seen.add(key)
+        unique.append((position, kind, text, tokens))
+
+    # One extra token per block for the separating newline
+    if not token_budget or sum(tokens + 1 for *_, tokens in unique) <= token_budget:
+        text = '\n'.join(text for _, _, text, _ in unique)
+        return text, tokens_before, estimate_tokens(text)
+
+    ranked = sorted(unique, key=lambda block: (
+        KIND_RANK.get(block[1], 2 if block[3] >= MIN_INFORMATIVE_TOKENS else 3), block[0]))
+    chosen = []
+    used = 0
+    for position, _, text, tokens in ranked:
+        if used + tokens + 1 > token_budget:
+            remaining = token_budget - used - 1
+            if remaining >= MIN_INFORMATIVE_TOKENS:
+                text = _truncate_to_tokens(text, remaining)
+                chosen.append((position, text))
+                used += estimate_tokens(text) + 1
+            break
+        chosen.append((position, text))
+        used += tokens + 1
+    text = '\n'.join(text for _, text in sorted(chosen))
+    return text, tokens_before, estimate_tokens(text)
+
+
+class ReductionStats:
+    """
+    Thread-safe totals of content tokens before and after reduction, and optionally
+    each URL's counts until they are recorded with its result.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Keep url -> (tokens_before, tokens_after) for pop(); only enabled while they are consumed
+        self.track_urls = False
+        self.urls = {}
+        self.pages = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+        self.max_after = 0
+
+    def record(self, tokens_before, tokens_after, url=None):
+        with self._lock:
+            if url is not None and self.track_urls:
+                self.urls[url] = (tokens_before, tokens_after)
+            self.pages += 1
+            self.tokens_before += tokens_before
+            self.tokens_after += tokens_after
+            self.max_after = max(self.max_after, tokens_after)
+        metrics.inc("content_tokens_extracted", tokens_before)
+        metrics.inc("content_tokens_sent", tokens_after)
+
+    def drain(self):
+        """Return the totals as a tuple and reset them; used to ship stats out of worker processes."""
+        with self._lock:
+            totals = (self.pages, self.tokens_before, self.tokens_after, self.max_after)
+            self.pages = self.tokens_before = self.tokens_after = self.max_after = 0
+        return totals
+
+    def merge(self, totals, url=None):
+        """Add totals returned by drain() in another process, for one page if url is given."""
+        pages, tokens_before, tokens_after, max_after = totals
+        with self._lock:
+            if url is not None and pages and self.track_urls:
+                self.urls[url] = (tokens_before, tokens_after)
+            self.pages += pages
+            self.tokens_before += tokens_before
+            self.tokens_after += tokens_after
+            self.max_after = max(self.max_after, max_after)
+        metrics.inc("content_tokens_extracted", tokens_before)
+        metrics.inc("content_tokens_sent", tokens_after)
+
+    def pop(self, url):
+        """Return and forget a URL's (tokens_before, tokens_after), or (None, None)."""
+        with self._lock:
+            return self.urls.pop(url, (None, None))
+
+    def reset(self):
+        self.drain()
+        with self._lock:
+            self.urls.clear()
+
+    def get_summary(self):
+        """Return a one-line summary of content tokens per URL."""
+        if not self.pages:
+            return "Content reduction: no pages reduced"
+        before = self.tokens_before / self.pages
+        after = self.tokens_after / self.pages
+        saved = 1 - self.tokens_after / self.tokens_before if self.tokens_before else 0.0
+        return (f"Content reduction: {self.pages} pages, {before:.0f} tokens per URL extracted, "
+                f"{after:.0f} sent (max {self.max_after}), {saved:.0%} saved")
+
+
+# Global budget and stats shared by all extraction workers
+token_budget = DEFAULT_TOKEN_BUDGET
+reduction_stats = ReductionStats()
+
+def configure_reducer(budget=DEFAULT_TOKEN_BUDGET):
+    """Set the global content token budget; 0 disables the budget but still deduplicates."""
+    global token_budget
+    token_budget = budget
+    return token_budget
+
+def get_token_budget():
+    """Return the global content token budget."""
+    return token_budget
+
+def reduce_content(blocks, url=None):
+    """Reduce extracted blocks with the global budget and record the token counts, per URL if given."""
+    text, tokens_before, tokens_after = reduce_blocks(blocks, token_budget)
+    reduction_stats.record(tokens_before, tokens_after, url)
+    return text
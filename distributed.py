@@ -0,0 +1,568 @@
+# distributed.py
+"""
+Coordinator/worker mode for classifying one input file on many machines.
+
+The coordinator normalizes and deduplicates the input like process_file, shards
+it into work units of unit_size URLs and stores them in a durable SQLite queue
+next to the input (WorkQueue; any store implementing add_units, lease, extend,
+complete and requeue_expired can replace it). It serves the queue over HTTP:
+workers lease a unit, process its URLs with the usual engines and post the labels
+and errors back. Leases are extended by a heartbeat while a worker is busy; a
+lease that expires is requeued for another worker, and a unit whose leases expire
+max_attempts times is labeled 'i'. Labels are merged into the run's journal, so
+the coordinator writes the standard _labeled.txt and error logs at the end and an
+interrupted run continues with --resume.
+
+Usage:
+    python distributed.py coordinator <input_file.txt> <url_type> [--topics ...] [--port 8765]
+    python distributed.py worker http://<coordinator>:8765 [max_workers] [main.py run options]
+"""
+
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+from tqdm import tqdm
+from error_logger import ErrorLogger, ErrorCollector
+from journal import Journal
+from results_store import DEFAULT_RESULTS_FILE, configure_results_store, get_results_store
+from streaming import iter_urls
+from url_normalizer import normalize_url
+
+
+DEFAULT_PORT = 8765
+
+# URLs per work unit
+DEFAULT_UNIT_SIZE = 500
+
+# Seconds a worker may hold a unit without a heartbeat
+DEFAULT_LEASE_SECONDS = 300
+
+# Expired leases after which a unit's URLs are labeled 'i'
+DEFAULT_MAX_ATTEMPTS = 5
+
+
+class WorkQueue:
+    """
+    Durable SQLite queue of leased work units.
+    """
+    def __init__(self, queue_file, lease_seconds=DEFAULT_LEASE_SECONDS, max_attempts=DEFAULT_MAX_ATTEMPTS,
+                 resume=False):
+        """
+        Args:
+            queue_file (str): SQLite file holding the units
+            lease_seconds (float): Seconds a lease lasts unless extended
+            max_attempts (int): Leases a unit may let expire before it is given up
+            resume (bool): Keep the units of a previous run; leased units are requeued
+        """
+        self.queue_file = queue_file
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.requeued = 0
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(queue_file, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS units ("
+            " id INTEGER PRIMARY KEY,"
+            " urls TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " state TEXT NOT NULL,"
+            " worker TEXT,"
+            " lease_expires REAL,"
+            " attempts INTEGER NOT NULL DEFAULT 0)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS units_state ON units (state, id)")
+        if resume:
+            # Workers of the previous run are gone; their leases will never complete
+            self.conn.execute("UPDATE units SET state = 'pending', worker = NULL WHERE state = 'leased'")
+        else:
+            self.conn.execute("DELETE FROM units")
+        self.conn.commit()
+
+    def add_units(self, units):
+        """Queue lists of URLs as pending units."""
+        with self._lock:
+            self.conn.executemany(
+                "INSERT INTO units (urls, size, state) VALUES (?, ?, 'pending')",
+                [("\n".join(urls), len(urls)) for urls in units],
+            )
+            self.conn.commit()
+
+    def lease(self, worker):
+        """Lease the oldest pending unit to a worker. Returns (unit_id, urls) or None."""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT id, urls FROM units WHERE state = 'pending' ORDER BY id LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute(
+                "UPDATE units SET state = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1"
+                " WHERE id = ?",
+                (worker, time.time() + self.lease_seconds, row[0]),
+            )
+            self.conn.commit()
+        return row[0], row[1].split("\n")
+
+    def extend(self, unit_id, worker):
+        """Renew a worker's lease. Returns False if the lease expired and was requeued."""
+        with self._lock:
+            cursor = self.conn.execute(
+                "UPDATE units SET lease_expires = ? WHERE id = ? AND state = 'leased' AND worker = ?",
+                (time.time() + self.lease_seconds, unit_id, worker),
+            )
+            self.conn.commit()
+        return cursor.rowcount == 1
+
+    def complete(self, unit_id):
+        """
+        Mark a unit done. Results are accepted from any worker that processed the unit,
+        even after its lease was requeued; returns False if the unit was already done.
+        """
+        with self._lock:
+            cursor = self.conn.execute(
+                "UPDATE units SET state = 'done', worker = NULL WHERE id = ? AND state NOT IN ('done', 'failed')",
+                (unit_id,),
+            )
+            self.conn.commit()
+        return cursor.rowcount == 1
+
+    def requeue_expired(self):
+        """
+        Requeue units whose lease expired, or fail them after max_attempts leases.
+        Returns a list of (unit_id, worker, urls, failed).
+        """
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT id, worker, urls, attempts FROM units WHERE state = 'leased' AND lease_expires < ?",
+                (time.time(),),
+            ).fetchall()
+            expired = []
+            for unit_id, worker, urls, attempts in rows:
+                failed = attempts >= self.max_attempts
+                self.conn.execute("UPDATE units SET state = ?, worker = NULL WHERE id = ?",
+                                  ('failed' if failed else 'pending', unit_id))
+                expired.append((unit_id, worker, urls.split("\n"), failed))
+            self.conn.commit()
+            self.requeued += sum(not failed for *_, failed in expired)
+        return expired
+
+    def counts(self):
+        """Return {state: units}."""
+        with self._lock:
+            return dict(self.conn.execute("SELECT state, COUNT(*) FROM units GROUP BY state").fetchall())
+
+    def remaining(self):
+        """Number of units not yet done or failed."""
+        with self._lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM units WHERE state IN ('pending', 'leased')"
+            ).fetchone()[0]
+
+    def url_count(self):
+        """Number of URLs in units not yet done or failed."""
+        with self._lock:
+            return self.conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM units WHERE state IN ('pending', 'leased')"
+            ).fetchone()[0]
+
+    def get_summary(self):
+        """Return a one-line summary of the queue."""
+        counts = self.counts()
+        return (f"Work queue: {counts.get('done', 0)} units done, {counts.get('failed', 0)} failed, "
+                f"{self.requeued} expired leases requeued")
+
+    def close(self):
+        with self._lock:
+            self.conn.commit()
+            self.conn.close()
+
+
+class Coordinator:
+    """
+    Shards an input file into a WorkQueue, serves it to workers and merges their results.
+    """
+    def __init__(self, input_file, url_type="-", topics=None, unit_size=DEFAULT_UNIT_SIZE,
+                 lease_seconds=DEFAULT_LEASE_SECONDS, max_attempts=DEFAULT_MAX_ATTEMPTS, resume=False,
+                 fold_www=False):
+        """
+        Args:
+            input_file (str): Text file with one URL per line
+            url_type (str): Label for related URLs (h/p)
+            topics (list): Topics to classify; defaults to the topic named by the input file
+            unit_size (int): URLs per work unit
+            lease_seconds (float): Seconds a worker may hold a unit without a heartbeat
+            max_attempts (int): Expired leases after which a unit's URLs are labeled 'i'
+            resume (bool): Continue a previous run from its journal and queue
+            fold_www (bool): Treat www.example.com and example.com as the same URL
+        """
+        self.input_file = input_file
+        self.url_type = url_type
+        self.multi_topic = topics is not None
+        self.topics = topics or [os.path.splitext(os.path.basename(input_file))[0]]
+        self.unit_size = unit_size
+        self.fold_www = fold_www
+        self.resume = resume
+        self.workers = set()
+        self.error_logger = ErrorLogger(input_file)
+        self.journal = Journal(input_file, self.topics, resume=resume)
+        queue_file = os.path.splitext(input_file)[0] + "_queue.sqlite"
+        resume_queue = resume and os.path.exists(queue_file)
+        self.queue = WorkQueue(queue_file, lease_seconds, max_attempts, resume=resume_queue)
+        self.progress = None
+        self._lock = threading.Lock()
+        self.results_run = None
+        if not resume_queue or not self.queue.remaining():
+            self.shard()
+
+    def shard(self):
+        """Queue the input's canonical URLs that are not done yet, unit_size per unit."""
+        units = []
+        unit = []
+        duplicates = 0
+        for line in iter_urls(self.input_file):
+            url = normalize_url(line)
+            key = normalize_url(url, self.fold_www)
+            if self.journal.is_done(key):
+                continue
+            if not self.journal.claim(key):
+                duplicates += 1
+                continue
+            unit.append(url)
+            if len(unit) >= self.unit_size:
+                units.append(unit)
+                unit = []
+                # Bound memory on very large inputs
+                if len(units) >= 100:
+                    self.queue.add_units(units)
+                    units = []
+        if unit:
+            units.append(unit)
+        self.queue.add_units(units)
+        self.journal.commit()
+        if duplicates:
+            print(f"Deduplicated {duplicates} input lines that normalize to an already queued URL")
+
+    def lease(self, worker):
+        """Return the lease response for a worker."""
+        with self._lock:
+            self.workers.add(worker)
+        leased = self.queue.lease(worker)
+        if leased is not None:
+            unit_id, urls = leased
+            return {"unit": unit_id, "urls": urls, "topics": self.topics, "url_type": self.url_type,
+                    "lease_seconds": self.queue.lease_seconds}
+        if self.queue.remaining():
+            # Everything is leased; wait in case a lease expires
+            return {"wait": min(30, self.queue.lease_seconds / 4)}
+        return {"done": True}
+
+    def complete(self, unit_id, labels, errors):
+        """Merge a unit's {url: {topic: label}} results and errors; duplicates are ignored."""
+        if not self.queue.complete(unit_id):
+            return False
+        for url, url_labels in labels.items():
+            self.journal.record(normalize_url(url, self.fold_www), url_labels)
+        self.journal.commit()
+        first_errors = {}
+        for error in errors:
+            self.error_logger.log_error(*error)
+            first_errors.setdefault(error[1], error[0])
+        results = get_results_store()
+        if results and self.results_run is not None:
+            # Latency is only known to the worker
+            for url, url_labels in labels.items():
+                results.record(self.results_run, normalize_url(url, self.fold_www), url_labels,
+                               error=first_errors.get(url))
+            results.commit()
+        if self.progress is not None:
+            self.progress.update(len(labels))
+        return True
+
+    def expire_leases(self):
+        """Requeue expired leases and label the URLs of units that ran out of attempts."""
+        for unit_id, worker, urls, failed in self.queue.requeue_expired():
+            if failed:
+                results = get_results_store()
+                for url in urls:
+                    key = normalize_url(url, self.fold_www)
+                    self.journal.record(key, {topic: 'i' for topic in self.topics})
+                    self.error_logger.log_error("lease", url, f"Gave up after {self.queue.max_attempts} expired leases")
+                    if results and self.results_run is not None:
+                        results.record(self.results_run, key, {topic: 'i' for topic in self.topics}, error="lease")
+                self.journal.commit()
+                if results and self.results_run is not None:
+                    results.commit()
+                if self.progress is not None:
+                    self.progress.update(len(urls))
+            else:
+                self.error_logger.log_error("lease", f"unit {unit_id}",
+                                            f"Lease held by {worker} expired; requeued")
+
+    def serve(self, host="0.0.0.0", port=DEFAULT_PORT):
+        """Serve the queue until every unit is done, then write the outputs."""
+        from main import output_file_for, start_results_run, write_output_in_order
+
+        self.results_run = start_results_run(self.input_file, self.topics, self.url_type, "distributed", self.fold_www,
+                                             resume=self.resume)
+        handler = type("Handler", (_CoordinatorHandler,), {"coordinator": self})
+        server = ThreadingHTTPServer((host, port), handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"Coordinator serving {self.queue.remaining()} units at http://{socket.gethostname()}:{port}")
+        try:
+            with tqdm(total=self.queue.url_count(), desc="Processing URLs", unit="url") as self.progress:
+                while self.queue.remaining():
+                    self.expire_leases()
+                    time.sleep(1)
+        finally:
+            server.shutdown()
+            server.server_close()
+            self.progress = None
+            if self.results_run is not None:
+                get_results_store().finish_run(self.results_run, completed=not self.queue.remaining())
+
+        self.journal.commit()
+        for topic in self.topics:
+            output_file = output_file_for(self.input_file, topic, self.multi_topic)
+            write_output_in_order(self.input_file, output_file, self.journal, topic, fold_www=self.fold_www)
+            print(f"Results written to {output_file}")
+        print(f"{len(self.workers)} workers took part")
+        print(self.queue.get_summary())
+        self.error_logger.write_log()
+
+    def close(self):
+        self.queue.close()
+        self.journal.close()
+
+
+class _CoordinatorHandler(BaseHTTPRequestHandler):
+    coordinator = None
+
+    def do_GET(self):
+        if self.path != "/status":
+            return self._send_json(404, {"error": "not found"})
+        self._send_json(200, {"units": self.coordinator.queue.counts(), "workers": len(self.coordinator.workers)})
+
+    def do_POST(self):
+        coordinator = self.coordinator
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if not isinstance(request, dict):
+                raise ValueError("request body must be a JSON object")
+            if self.path == "/lease":
+                return self._send_json(200, coordinator.lease(request["worker"]))
+            if self.path == "/extend":
+                return self._send_json(200, {"ok": coordinator.queue.extend(request["unit"], request["worker"])})
+            if self.path == "/complete":
+                accepted = coordinator.complete(request["unit"], request["labels"], request.get("errors", []))
+                return self._send_json(200, {"ok": accepted})
+        except (ValueError, KeyError) as e:
+            # Bad JSON, a body that is not a JSON object or a missing field
+            return self._send_json(400, {"error": f"malformed request: {type(e).__name__}: {e}"})
+        self._send_json(404, {"error": "not found"})
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class QueueClient:
+    """
+    Worker-side client of the coordinator's HTTP queue.
+    """
+    def __init__(self, coordinator_url, worker=None, retries=5):
+        self.coordinator_url = coordinator_url.rstrip("/")
+        self.worker = worker or f"{socket.gethostname()}-{os.getpid()}"
+        self.retries = retries
+        self.session = requests.Session()
+
+    def _post(self, path, payload):
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.post(self.coordinator_url + path, json={"worker": self.worker, **payload},
+                                             timeout=60)
+                response.raise_for_status()
+                return response.json()
+            except requests.RequestException:
+                if attempt == self.retries:
+                    raise
+                time.sleep(2 ** attempt)
+
+    def lease(self):
+        return self._post("/lease", {})
+
+    def extend(self, unit_id):
+        return self._post("/extend", {"unit": unit_id})["ok"]
+
+    def complete(self, unit_id, labels, errors):
+        return self._post("/complete", {"unit": unit_id, "labels": labels, "errors": errors})["ok"]
+
+
+def _heartbeat(client, unit_id, interval, stop):
+    """Extend the lease on a unit every interval seconds until stopped."""
+    while not stop.wait(interval):
+        try:
+            if not client.extend(unit_id):
+                print(f"Lease on unit {unit_id} was lost; its results may be discarded")
+                return
+        except requests.RequestException as e:
+            print(f"Heartbeat for unit {unit_id} failed: {e}")
+
+
+def run_worker(coordinator_url, max_workers=20, engine="threads", **engine_options):
+    """
+    Lease units from a coordinator and process them until the queue is drained.
+
+    Args:
+        coordinator_url (str): Base URL of the coordinator
+        max_workers (int): Worker threads per unit
+        engine (str): "threads", "async" or "pipeline", as in process_file
+        engine_options: Further run_engine options (concurrency, per_host, window, ...)
+    """
+    from main import run_engine
+
+    client = QueueClient(coordinator_url)
+    units = urls_done = 0
+    while True:
+        try:
+            lease = client.lease()
+        except requests.RequestException as e:
+            print(f"Coordinator unreachable, stopping: {e}")
+            break
+        if lease.get("done"):
+            break
+        if "unit" not in lease:
+            time.sleep(lease.get("wait", 5))
+            continue
+
+        unit_id, topics = lease["unit"], lease["topics"]
+        labels = {}
+        collector = ErrorCollector()
+
+        def on_result(url, url_labels):
+            labels[url] = url_labels or {topic: 'i' for topic in topics}
+
+        stop = threading.Event()
+        heartbeat = threading.Thread(target=_heartbeat, args=(client, unit_id, lease["lease_seconds"] / 3, stop),
+                                     daemon=True)
+        heartbeat.start()
+        try:
+            run_engine(lease["urls"], topics, lease["url_type"], on_result, collector, engine=engine,
+                       max_workers=max_workers, **engine_options)
+        finally:
+            stop.set()
+            heartbeat.join()
+        try:
+            client.complete(unit_id, labels, collector.errors)
+        except requests.RequestException as e:
+            # The lease expires and the unit is processed again
+            print(f"Could not return unit {unit_id}: {e}")
+            continue
+        units += 1
+        urls_done += len(labels)
+        print(f"Unit {unit_id}: {len(labels)} URLs, {len(collector.errors)} errors")
+    print(f"Worker {client.worker} processed {units} units ({urls_done} URLs)")
+
+
+def coordinator_main(argv=None):
+    from main import parse_topics
+
+    parser = argparse.ArgumentParser(description="Shard an input file into leased work units and serve them.")
+    parser.add_argument("input_file", help="Text file with one URL per line; its name is the topic")
+    parser.add_argument("url_type", help="Label to assign to related URLs (h/p)")
+    parser.add_argument("--topics", default=None,
+                        help="Comma-separated topics, or 'all', instead of the topic named by the input file")
+    parser.add_argument("--unit-size", type=int, default=DEFAULT_UNIT_SIZE,
+                        help=f"URLs per work unit (default: {DEFAULT_UNIT_SIZE})")
+    parser.add_argument("--lease-seconds", type=float, default=DEFAULT_LEASE_SECONDS,
+                        help=f"Seconds a worker may hold a unit without a heartbeat (default: {DEFAULT_LEASE_SECONDS})")
+    parser.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS,
+                        help=f"Expired leases before a unit's URLs are labeled 'i' (default: {DEFAULT_MAX_ATTEMPTS})")
+    parser.add_argument("--host", default="0.0.0.0", help="Address to listen on (default: 0.0.0.0)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Port to listen on (default: {DEFAULT_PORT})")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue a previous run from its journal and work queue")
+    parser.add_argument("--fold-www", action="store_true",
+                        help="Treat www.example.com and example.com as the same URL when deduplicating")
+    parser.add_argument("--results-file", default=DEFAULT_RESULTS_FILE,
+                        help=f"Queryable store of every run's results (default: {DEFAULT_RESULTS_FILE})")
+    parser.add_argument("--no-results-store", action="store_true",
+                        help="Do not record results beyond the _labeled.txt files")
+    args = parser.parse_args(argv)
+
+    if not args.no_results_store:
+        configure_results_store(args.results_file)
+    coordinator = Coordinator(args.input_file, args.url_type, parse_topics(args.topics), args.unit_size,
+                              args.lease_seconds, args.max_attempts, args.resume, args.fold_www)
+    try:
+        coordinator.serve(args.host, args.port)
+    finally:
+        coordinator.close()
+        results = get_results_store()
+        if results:
+            results.close()
+
+
+def worker_main(argv=None):
+    import main
+
+    parser = argparse.ArgumentParser(description="Process work units leased from a coordinator.")
+    parser.add_argument("coordinator", help="Coordinator URL, e.g. http://host:8765")
+    parser.add_argument("max_workers", nargs="?", type=int, default=20, help="Worker threads (default: 20)")
+    main.add_run_arguments(parser)
+    # Results are recorded by the coordinator
+    parser.set_defaults(no_results_store=True)
+    args = parser.parse_args(argv)
+
+    main.configure()
+    main.apply_run_arguments(args)
+    exporter = main.start_metrics_exporter(args)
+    if args.batch_size > 1:
+        main.configure_batcher(args.batch_size, args.batch_tokens, args.batch_timeout)
+    try:
+        run_worker(
+            args.coordinator, args.max_workers, engine=args.engine, concurrency=args.concurrency,
+            per_host=args.per_host, window=args.window, parse_workers=args.parse_workers,
+            classify_workers=args.classify_workers, queue_size=args.queue_size,
+        )
+    finally:
+        main.close_batcher()
+        cache = main.get_cache()
+        if cache:
+            cache.commit()
+        host_cache = main.get_host_cache()
+        if host_cache:
+            host_cache.commit()
+        page_store = main.get_page_store()
+        if page_store:
+            page_store.commit()
+            print(page_store.get_summary())
+        print(main.get_metrics().get_summary())
+        if exporter:
+            exporter.close()
+        main.get_metrics().close()
+
+
+if __name__ == '__main__':
+    commands = {"coordinator": coordinator_main, "worker": worker_main}
+    if len(sys.argv) < 2 or sys.argv[1] not in commands:
+        print("Usage: python distributed.py coordinator <input_file.txt> <url_type> [options]\n"
+              "       python distributed.py worker <coordinator_url> [max_workers] [options]")
+        sys.exit(1)
+    commands[sys.argv[1]](sys.argv[2:])
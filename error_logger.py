@@ -1,72 +1,151 @@
 # error_logger.py
 import os
-from collections import defaultdict
+import json
+import threading
 import datetime
 
+# Distinct messages aggregated per error type; further messages are only counted
+MAX_MESSAGES_PER_TYPE = 1000
+
+# URLs kept per message for the summary
+SAMPLE_URLS = 5
+
 class ErrorLogger:
     """
     A class for collecting, categorizing, and summarizing errors during processing.
+
+    Every error is written to a JSON lines file, and flushed, as it is logged, so the
+    records survive a killed run and can be tailed during one; memory only holds
+    per-message counts and a few sample URLs, so it stays bounded on large runs.
     """
-    def __init__(self, base_filename):
-        """Initialize error logger with categorized error tracking."""
+    def __init__(self, base_filename, max_messages=MAX_MESSAGES_PER_TYPE, sample_urls=SAMPLE_URLS):
+        """
+        Initialize error logger with categorized error tracking.
+
+        Args:
+            base_filename (str): Input file name the log file names are derived from
+            max_messages (int): Distinct messages aggregated per error type
+            sample_urls (int): URLs kept per message for the summary
+        """
         self.base_filename = base_filename
         self.error_log_file = os.path.splitext(base_filename)[0] + "_error_messages.log"
-        self.errors_by_type = defaultdict(list)
+        self.error_records_file = os.path.splitext(base_filename)[0] + "_errors.jsonl"
+        self.max_messages = max_messages
+        self.sample_urls = sample_urls
+        # {error_type: {error_message: [count, [sample urls]]}}
+        self.errors_by_type = {}
+        self.type_counts = {}
+        # Errors whose message did not fit in max_messages, per type
+        self.overflow_counts = {}
         self.total_errors = 0
-        
+        self._records = None
+        self._records_opened = False
+        self._lock = threading.Lock()
+
     def log_error(self, error_type, url, error_message):
         """
         Log an error with its type, affected URL, and message.
-        
+
         Args:
             error_type (str): Category of error (e.g., 'connection', 'api', 'parsing')
             url (str): The URL where the error occurred
             error_message (str): Description of the error
         """
-        self.errors_by_type[error_type].append((url, str(error_message)))
-        self.total_errors += 1
-        
+        error_message = str(error_message)
+        record = json.dumps({
+            "ts": round(datetime.datetime.now().timestamp(), 3),
+            "type": error_type,
+            "url": url,
+            "message": error_message,
+        }, ensure_ascii=False)
+        with self._lock:
+            if self._records is None:
+                # Opened on the first error so clean runs leave no empty file behind; line
+                # buffered, so each record reaches the file when it is logged
+                mode = 'a' if self._records_opened else 'w'
+                self._records = open(self.error_records_file, mode, encoding='utf-8', buffering=1)
+                self._records_opened = True
+            self._records.write(record + "\n")
+            self.total_errors += 1
+            self.type_counts[error_type] = self.type_counts.get(error_type, 0) + 1
+            messages = self.errors_by_type.setdefault(error_type, {})
+            entry = messages.get(error_message)
+            if entry is None:
+                if len(messages) >= self.max_messages:
+                    self.overflow_counts[error_type] = self.overflow_counts.get(error_type, 0) + 1
+                    return
+                entry = messages[error_message] = [0, []]
+            entry[0] += 1
+            if len(entry[1]) < self.sample_urls:
+                entry[1].append(url)
+
     def get_summary(self):
         """Generate a formatted summary of all logged errors."""
-        summary = f"Error Summary Report - {datetime.datetime.now()}\n"
-        summary += "=" * 80 + "\n\n"
-        summary += f"Total errors: {self.total_errors}\n\n"
-        
-        for error_type, errors in self.errors_by_type.items():
-            summary += f"{error_type.upper()} ERRORS ({len(errors)}):\n"
-            summary += "-" * 40 + "\n"
-            
-            # Group similar errors to avoid repetition
-            error_counts = defaultdict(list)
-            for url, error_msg in errors:
-                error_counts[error_msg].append(url)
-            
-            # Add each unique error with affected URLs
-            for error_msg, urls in error_counts.items():
-                summary += f"Error: {error_msg}\n"
-                summary += f"Occurred in {len(urls)} URLs:\n"
-                # Show all URLs if 5 or fewer, otherwise show first 3 and count
-                if len(urls) <= 5:
-                    for url in urls:
-                        summary += f"  - {url}\n"
-                else:
-                    for url in urls[:3]:
-                        summary += f"  - {url}\n"
-                    summary += f"  - ... and {len(urls) - 3} more URLs\n"
-                summary += "\n"
-            
-            summary += "\n"
-            
-        return summary
-    
+        with self._lock:
+            lines = [
+                f"Error Summary Report - {datetime.datetime.now()}",
+                "=" * 80,
+                "",
+                f"Total errors: {self.total_errors}",
+                "",
+            ]
+            if self._records_opened:
+                lines += [f"Every error is listed in {self.error_records_file}", ""]
+
+            for error_type, messages in self.errors_by_type.items():
+                lines.append(f"{error_type.upper()} ERRORS ({self.type_counts[error_type]}):")
+                lines.append("-" * 40)
+
+                # Add each unique error with affected URLs
+                for error_msg, (count, urls) in messages.items():
+                    lines.append(f"Error: {error_msg}")
+                    lines.append(f"Occurred in {count} URLs:")
+                    # Show all URLs if 5 or fewer, otherwise show first 3 and count
+                    if count <= len(urls):
+                        lines += [f"  - {url}" for url in urls]
+                    else:
+                        lines += [f"  - {url}" for url in urls[:3]]
+                        lines.append(f"  - ... and {count - 3} more URLs")
+                    lines.append("")
+
+                overflow = self.overflow_counts.get(error_type)
+                if overflow:
+                    lines.append(f"... and {overflow} more errors with other messages "
+                                 f"(over {self.max_messages} distinct), see {self.error_records_file}")
+                    lines.append("")
+                lines.append("")
+
+        return "\n".join(lines) + "\n"
+
+    def close(self):
+        """Flush and close the JSON lines error records."""
+        with self._lock:
+            if self._records is not None:
+                self._records.close()
+                self._records = None
+
     def write_log(self):
         """Write the error summary to the log file."""
         if self.total_errors == 0:
             with open(self.error_log_file, 'w') as f:
                 f.write("No errors were recorded during processing.\n")
             return
-            
+
+        summary = self.get_summary()
+        self.close()
         with open(self.error_log_file, 'w') as f:
-            f.write(self.get_summary())
-            
+            f.write(summary)
+
         print(f"Error summary written to {self.error_log_file}")
+
+
+class ErrorCollector:
+    """
+    Stands in for ErrorLogger where errors must be shipped elsewhere, e.g. from worker
+    processes or distributed workers; the collected errors are replayed with log_error.
+    """
+    def __init__(self):
+        self.errors = []
+
+    def log_error(self, error_type, url, error_message):
+        self.errors.append((error_type, url, str(error_message)))
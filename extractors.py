@@ -0,0 +1,273 @@
+# extractors.py
+"""
+Pluggable HTML text extraction backends.
+
+The streaming backends make a single pass over the document with an event-driven
+parser: text inside script/style/nav and similar boilerplate is dropped, each text
+node is emitted exactly once (so nested tags do not repeat text), and parsing stops
+as soon as the character budget is reached.
+
+extract_blocks returns the same text as a list of (kind, text) blocks, one per
+block-level element (paragraph, list item, table cell, heading, title...), with the
+text of inline tags such as links kept in place. kind is 'title', 'meta' (the meta
+description), 'heading' or 'text', so that content_reducer can rank and pack them.
+
+Backends:
+- lxml: lxml's C parser driven through a parser target (used by "auto" when installed)
+- html.parser: the standard library parser, always available
+- bs4: the original BeautifulSoup find_all implementation, kept for comparison
+"""
+
+from html.parser import HTMLParser
+from bs4 import BeautifulSoup
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+
+# Only the first MAX_TEXT_CHARS characters of page text are sent to the classifier
+MAX_TEXT_CHARS = 40000
+
+# Elements whose text is never useful for classification
+SKIP_TAGS = frozenset([
+    'script', 'style', 'noscript', 'template', 'nav', 'footer', 'aside',
+    'svg', 'iframe', 'object', 'canvas', 'select', 'button',
+])
+
+# Characters fed to the streaming parsers at a time, so parsing can stop early
+CHUNK_SIZE = 16384
+
+HEADING_TAGS = frozenset(['h1', 'h2', 'h3', 'h4', 'h5', 'h6'])
+
+# Elements that start and end a text block; text of any other (inline) element joins the open block
+BLOCK_TAGS = HEADING_TAGS | SKIP_TAGS | frozenset([
+    'title', 'p', 'div', 'li', 'ul', 'ol', 'dl', 'dt', 'dd', 'td', 'th', 'tr', 'table', 'caption',
+    'section', 'article', 'header', 'main', 'blockquote', 'pre', 'figcaption', 'form', 'body', 'br', 'hr',
+])
+
+
+class _TextCollector:
+    """Accumulates visible text from parser events, one block per block-level element."""
+    def __init__(self, max_chars):
+        self.max_chars = max_chars
+        self.parts = []
+        self.kinds = []
+        self.size = 0
+        self.skip_depth = 0
+        self.title_depth = 0
+        self.heading_depth = 0
+        self.done = False
+        # Text nodes of the block-level element being read, and the block's kind
+        self._block = []
+        self._block_kind = None
+
+    def start(self, tag, attrs=None):
+        if tag in BLOCK_TAGS:
+            self._flush()
+        if tag in SKIP_TAGS:
+            self.skip_depth += 1
+        elif tag == 'title':
+            self.title_depth += 1
+        elif tag in HEADING_TAGS:
+            self.heading_depth += 1
+        elif tag == 'meta' and attrs and (attrs.get('name') or '').lower() == 'description':
+            self._add('meta', attrs.get('content') or '')
+
+    def end(self, tag):
+        if tag in BLOCK_TAGS:
+            self._flush()
+        if tag in SKIP_TAGS and self.skip_depth:
+            self.skip_depth -= 1
+        elif tag == 'title' and self.title_depth:
+            self.title_depth -= 1
+        elif tag in HEADING_TAGS and self.heading_depth:
+            self.heading_depth -= 1
+
+    def data(self, text):
+        if self.skip_depth or self.done:
+            return
+        text = ' '.join(text.split())
+        if not text:
+            return
+        if not self._block:
+            self._block_kind = 'title' if self.title_depth else 'heading' if self.heading_depth else 'text'
+        self._block.append(text)
+        self.size += len(text) + 1
+        if self.size >= self.max_chars:
+            self.done = True
+            self._flush()
+
+    def _flush(self):
+        """Close the open block."""
+        if self._block:
+            self.parts.append(' '.join(self._block))
+            self.kinds.append(self._block_kind)
+            self._block = []
+
+    def _add(self, kind, text):
+        if self.done:
+            return
+        text = ' '.join(text.split())
+        if text:
+            self._flush()
+            self.parts.append(text)
+            self.kinds.append(kind)
+            self.size += len(text) + 1
+            if self.size >= self.max_chars:
+                self.done = True
+
+    def result(self):
+        self._flush()
+        return ' '.join(self.parts)[:self.max_chars]
+
+    def blocks(self):
+        self._flush()
+        return list(zip(self.kinds, self.parts))
+
+
+class Extractor:
+    """
+    Base class for extraction backends.
+    """
+    name = None
+
+    def extract(self, html, max_chars=MAX_TEXT_CHARS):
+        """Return up to max_chars of visible text from the HTML document."""
+        raise NotImplementedError
+
+    def extract_blocks(self, html, max_chars=MAX_TEXT_CHARS):
+        """Return up to max_chars of visible text as a list of (kind, text) blocks."""
+        text = self.extract(html, max_chars)
+        return [('text', text)] if text else []
+
+
+class _StdlibParser(HTMLParser):
+    def __init__(self, collector):
+        super().__init__(convert_charrefs=True)
+        self.collector = collector
+
+    def handle_starttag(self, tag, attrs):
+        self.collector.start(tag, dict(attrs))
+
+    def handle_endtag(self, tag):
+        self.collector.end(tag)
+
+    def handle_data(self, data):
+        self.collector.data(data)
+
+
+class StdlibExtractor(Extractor):
+    """Single streaming pass with the standard library HTML parser."""
+    name = "html.parser"
+
+    def _collect(self, html, max_chars):
+        collector = _TextCollector(max_chars)
+        parser = _StdlibParser(collector)
+        for offset in range(0, len(html), CHUNK_SIZE):
+            parser.feed(html[offset:offset + CHUNK_SIZE])
+            if collector.done:
+                break
+        else:
+            parser.close()
+        return collector
+
+    def extract(self, html, max_chars=MAX_TEXT_CHARS):
+        return self._collect(html, max_chars).result()
+
+    def extract_blocks(self, html, max_chars=MAX_TEXT_CHARS):
+        return self._collect(html, max_chars).blocks()
+
+
+class _LxmlTarget:
+    def __init__(self, collector):
+        self.collector = collector
+
+    def start(self, tag, attrib):
+        self.collector.start(tag, attrib)
+
+    def end(self, tag):
+        self.collector.end(tag)
+
+    def data(self, data):
+        self.collector.data(data)
+
+    def close(self):
+        return None
+
+
+class LxmlExtractor(Extractor):
+    """Single streaming pass with lxml's C HTML parser."""
+    name = "lxml"
+
+    def _collect(self, html, max_chars):
+        collector = _TextCollector(max_chars)
+        parser = etree.HTMLParser(target=_LxmlTarget(collector), recover=True)
+        for offset in range(0, len(html), CHUNK_SIZE):
+            parser.feed(html[offset:offset + CHUNK_SIZE])
+            if collector.done:
+                break
+        else:
+            parser.close()
+        return collector
+
+    def extract(self, html, max_chars=MAX_TEXT_CHARS):
+        return self._collect(html, max_chars).result()
+
+    def extract_blocks(self, html, max_chars=MAX_TEXT_CHARS):
+        return self._collect(html, max_chars).blocks()
+
+
+class BeautifulSoupExtractor(Extractor):
+    """The original implementation: text of p/span/h1-h4 tags, else the whole body."""
+    name = "bs4"
+
+    def extract(self, html, max_chars=MAX_TEXT_CHARS):
+        soup = BeautifulSoup(html, 'html.parser')
+
+        # Extract text from common tags
+        texts = []
+        for tag in soup.find_all(['p', 'span', 'h1', 'h2', 'h3', 'h4']):
+            texts.append(tag.get_text(separator=' ', strip=True))
+        combined_text = ' '.join(texts)
+        if combined_text:
+            return combined_text[:max_chars]
+
+        # Fallback: extract from the entire body
+        if soup.body:
+            return soup.body.get_text(separator=' ', strip=True)[:max_chars]
+        return ''
+
+
+EXTRACTORS = {
+    LxmlExtractor.name: LxmlExtractor,
+    StdlibExtractor.name: StdlibExtractor,
+    BeautifulSoupExtractor.name: BeautifulSoupExtractor,
+}
+
+def available_extractors():
+    """Names of the backends usable in this environment."""
+    return [name for name in EXTRACTORS if name != LxmlExtractor.name or etree is not None]
+
+def make_extractor(name="auto"):
+    """Create an extractor by name; "auto" picks the fastest available backend."""
+    if name == "auto":
+        name = LxmlExtractor.name if etree is not None else StdlibExtractor.name
+    if name not in available_extractors():
+        raise ValueError(f"Extractor backend not available: {name}")
+    return EXTRACTORS[name]()
+
+
+# Create a global extractor shared by all workers
+extractor = make_extractor()
+
+def configure_extractor(name="auto"):
+    """Select the global extraction backend."""
+    global extractor
+    extractor = make_extractor(name)
+    return extractor
+
+def get_extractor():
+    """Return the global extraction backend."""
+    return extractor
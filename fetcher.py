@@ -0,0 +1,461 @@
+# fetcher.py
+"""
+Fetches each page once through a shared, pooled requests session.
+
+fetch_page downloads the body in chunks within a byte budget and a per-page deadline,
+skips non-HTML responses, and returns a Page that the accessibility check and the
+text extractor share. Hosts recorded as dead in the host cache are not contacted,
+requests are conditional when the page store holds validators from a previous run,
+and with hedging a slow request is raced against an alternate URL of the same page.
+Bodies are decoded with detect_encoding, so every engine reads a page the same way.
+Every fetch is counted so runs can report that no page was downloaded twice.
+"""
+
+import codecs
+import concurrent.futures
+import re
+import threading
+import time
+from collections import Counter
+import requests
+from requests.adapters import HTTPAdapter
+from error_logger import ErrorCollector
+from host_cache import classify_connection_error, get_host_cache, parked_url
+from page_store import body_hash, get_page_store
+from metrics import metrics
+from tail_latency import alternate_urls, deadline_remaining, get_latency_tracker
+
+try:
+    from charset_normalizer import from_bytes
+except ImportError:
+    from_bytes = None
+
+
+# Bytes at the start of a body searched for a <meta> charset declaration
+META_SCAN_BYTES = 4096
+
+_META_CHARSET = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([a-z0-9_.:-]+)', re.IGNORECASE)
+
+_BOMS = ((codecs.BOM_UTF8, 'utf-8-sig'), (codecs.BOM_UTF16_LE, 'utf-16'), (codecs.BOM_UTF16_BE, 'utf-16'))
+
+# Declared charsets that pages routinely exceed, decoded as their superset like browsers do
+_SUPERSETS = {'gb2312': 'gb18030', 'gbk': 'gb18030', 'latin-1': 'cp1252', 'iso8859-1': 'cp1252', 'ascii': 'cp1252'}
+
+
+def _codec(name):
+    """Python codec name for a declared charset, or None if it is unknown."""
+    try:
+        name = codecs.lookup(name.strip().strip('"\'')).name
+    except LookupError:
+        return None
+    return _SUPERSETS.get(name, name)
+
+
+def header_value(headers, name, default=None):
+    """Case-insensitive lookup of a response header in a plain dict."""
+    name = name.lower()
+    return next((value for key, value in headers.items() if key.lower() == name), default)
+
+def detect_encoding(headers, content):
+    """
+    Return the encoding of a page body: a byte order mark, else the Content-Type
+    charset, else a <meta> charset near the start of the body, else UTF-8 if the
+    body decodes as UTF-8, else charset_normalizer's guess, falling back to UTF-8.
+    """
+    for bom, encoding in _BOMS:
+        if content.startswith(bom):
+            return encoding
+    content_type = header_value(headers, 'Content-Type', '')
+    for param in content_type.split(';')[1:]:
+        key, _, value = param.partition('=')
+        if key.strip().lower() == 'charset' and _codec(value):
+            return _codec(value)
+    match = _META_CHARSET.search(content[:META_SCAN_BYTES])
+    if match and _codec(match.group(1).decode('ascii')):
+        return _codec(match.group(1).decode('ascii'))
+    try:
+        # Not final, so a multi-byte character cut off by truncation still counts as UTF-8
+        codecs.getincrementaldecoder('utf-8')().decode(content, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    guess = from_bytes(content[:65536]).best() if from_bytes is not None else None
+    return _codec(guess.encoding) if guess is not None and _codec(guess.encoding) else 'utf-8'
+
+
+class Page:
+    """
+    A single fetched HTTP response, shared by the accessibility check and the text extractor.
+    """
+    def __init__(self, url, status_code, final_url, headers, content, encoding=None, truncated=False,
+                 skipped_reason=None, previous=None):
+        """Store the response fields needed by the rest of the pipeline."""
+        self.url = url
+        self.status_code = status_code
+        self.final_url = final_url
+        self.headers = headers
+        self.content = content
+        self.encoding = encoding or detect_encoding(headers or {}, content)
+        # True if the body was cut off by the byte budget or the deadline
+        self.truncated = truncated
+        # Set when the body was not downloaded, e.g. for non-HTML content
+        self.skipped_reason = skipped_reason
+        # The page store's record from the previous run, if the request was conditional
+        self.previous = previous
+        # Hash of the body, set when the page store is enabled
+        self.body_hash = body_hash(content) if previous is not None or get_page_store() else None
+
+    @property
+    def text(self):
+        """Decode the body with the encoding from detect_encoding."""
+        return self.content.decode(self.encoding, errors='replace')
+
+    @property
+    def ok(self):
+        """True if the website responded successfully with usable content."""
+        return self.status_code == 200 and self.skipped_reason is None
+
+    @property
+    def not_modified(self):
+        """True if a conditional request was answered with 304 Not Modified."""
+        return self.status_code == 304 and self.previous is not None
+
+    def without_body(self):
+        """Copy of the page without its body, for keeping metadata once the text is extracted."""
+        page = Page(self.url, self.status_code, self.final_url, self.headers, b'', self.encoding, self.truncated,
+                    self.skipped_reason, self.previous)
+        page.body_hash = self.body_hash
+        return page
+
+
+class FetchLimits:
+    """
+    Bounds on a single page download.
+    """
+    def __init__(self, max_bytes=2_000_000, deadline=30, timeout=10, chunk_size=65536):
+        """
+        Args:
+            max_bytes (int): Stop reading the body after this many bytes
+            deadline (float): Total wall-clock seconds allowed for one fetch
+            timeout (float): Per-socket connect/read timeout in seconds
+            chunk_size (int): Bytes read from the socket at a time
+        """
+        self.max_bytes = max_bytes
+        self.deadline = deadline
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+
+
+# Only these content types are downloaded; anything else is skipped after the headers
+HTML_CONTENT_TYPES = ('text/html', 'application/xhtml+xml', 'text/plain')
+
+def is_html_content_type(headers):
+    """True if the Content-Type is HTML-like or missing."""
+    content_type = header_value(headers, 'Content-Type', '').split(';')[0].strip().lower()
+    return not content_type or content_type in HTML_CONTENT_TYPES
+
+def declared_length(headers):
+    """Return the Content-Length header as an int, or None."""
+    try:
+        return int(header_value(headers, 'Content-Length'))
+    except (TypeError, ValueError):
+        return None
+
+
+class FetchCounter:
+    """
+    Thread-safe count of network fetches per URL, used to verify each page is fetched once.
+    """
+    def __init__(self, track_urls=True):
+        """
+        Args:
+            track_urls (bool): Count fetches per URL; when False (e.g. in a long-running
+                service) only the totals are kept, so memory does not grow with every URL seen
+        """
+        self._lock = threading.Lock()
+        self.track_urls = track_urls
+        self.counts = Counter()
+        self.fetches = 0
+        self.bytes_downloaded = 0
+        self.bytes_skipped = 0
+        self.truncated = 0
+        self.skipped = 0
+
+    def record(self, url):
+        """Record one fetch of the given URL."""
+        with self._lock:
+            self.fetches += 1
+            if self.track_urls:
+                self.counts[url] += 1
+        metrics.inc("fetches")
+
+    def record_body(self, downloaded, skipped=0, truncated=False, skipped_page=False):
+        """Record bytes read and bytes left unread (when the server declared a length)."""
+        with self._lock:
+            self.bytes_downloaded += downloaded
+            self.bytes_skipped += skipped
+            self.truncated += truncated
+            self.skipped += skipped_page
+        metrics.inc("bytes_downloaded", downloaded)
+        metrics.inc("bytes_skipped", skipped)
+
+    def reset(self):
+        """Forget all recorded fetches."""
+        with self._lock:
+            self.counts.clear()
+            self.fetches = 0
+            self.bytes_downloaded = self.bytes_skipped = self.truncated = self.skipped = 0
+
+    @property
+    def total(self):
+        return self.fetches
+
+    @property
+    def max_per_url(self):
+        return max(self.counts.values(), default=0)
+
+    def get_summary(self):
+        """Return a one-line summary of fetch counts."""
+        per_url = f" for {len(self.counts)} URLs (max fetches per URL: {self.max_per_url})" if self.track_urls else ""
+        return (f"Fetched {self.total} pages{per_url}; "
+                f"{self.bytes_downloaded / 1e6:.1f} MB downloaded, {self.bytes_skipped / 1e6:.1f} MB skipped, "
+                f"{self.truncated} bodies truncated, {self.skipped} non-HTML pages skipped")
+
+
+# Global counter shared by all worker threads
+fetch_counter = FetchCounter()
+
+# Global download limits shared by all fetchers
+fetch_limits = FetchLimits()
+
+def configure_fetch_limits(max_bytes=2_000_000, deadline=30, timeout=10):
+    """Set the byte budget, wall-clock deadline and socket timeout for every fetch."""
+    global fetch_limits
+    fetch_limits = FetchLimits(max_bytes, deadline, timeout)
+    return fetch_limits
+
+# Create a global pooled session to reuse connections across worker threads
+session = None
+
+# Threads running hedged fetch attempts; None unless hedging is enabled
+hedge_executor = None
+
+def configure_session(pool_size=50):
+    """Create the shared keep-alive session, sized for the number of worker threads."""
+    global session, hedge_executor
+    if get_latency_tracker().hedge:
+        # A fetch may run its first attempt and two hedges at once
+        hedge_executor = concurrent.futures.ThreadPoolExecutor(max_workers=pool_size * 3,
+                                                               thread_name_prefix="hedge")
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def skip_dead_host(url, error_logger=None):
+    """True if the URL's host is in the host cache as dead or parked, so it should not be fetched."""
+    cache = get_host_cache()
+    entry = cache.lookup(url) if cache else None
+    if entry:
+        metrics.inc("host_cache_skips")
+        if error_logger:
+            error_logger.log_error("host", url, f"Skipped: host cached as {entry[0]} ({entry[1]})")
+    return entry is not None
+
+def record_host_failure(url, error, timeout=None):
+    """
+    Add the URL's host to the host cache if the fetch error is host-level. A connect
+    timeout under a shortened adaptive timeout is not, as the full timeout might
+    have succeeded.
+    """
+    cache = get_host_cache()
+    if cache is None:
+        return
+    if timeout is not None and timeout < fetch_limits.timeout and classify_connection_error(error) == 'timeout':
+        return
+    cache.record_error(url, error)
+
+def request_timeout(url):
+    """
+    Socket timeout for a request to the URL: adaptive per host if enabled, else the
+    fixed timeout, and never past the run deadline.
+    """
+    timeout = get_latency_tracker().timeout_for(url, fetch_limits.timeout)
+    remaining = deadline_remaining()
+    return timeout if remaining is None else min(timeout, remaining)
+
+def download_deadline():
+    """time.monotonic() by which one download must end: the fetch deadline, or the run deadline if sooner."""
+    seconds = fetch_limits.deadline
+    remaining = deadline_remaining()
+    return time.monotonic() + (seconds if remaining is None else min(seconds, remaining))
+
+def previous_record(url):
+    """The page store's record for the URL, if it can be fetched conditionally."""
+    store = get_page_store()
+    return store.lookup(url) if store else None
+
+def check_parked(page, error_logger=None):
+    """Mark a parked-domain page as skipped and cache the parked host."""
+    cache = get_host_cache()
+    parked = parked_url(page) if cache and page.status_code == 200 else None
+    if parked:
+        page.skipped_reason = "Parked domain"
+        cache.record(parked, 'parked', page.final_url)
+        if error_logger:
+            error_logger.log_error("host", page.url, "Skipped: parked domain")
+    return page
+
+def _iter_body(response, chunk_size):
+    """
+    Yield body chunks as soon as they arrive. iter_content blocks until a full
+    chunk is read, which would let a slowly trickling server overrun the deadline.
+    """
+    read1 = getattr(response.raw, 'read1', None)
+    if read1 is None:
+        yield from response.iter_content(chunk_size)
+        return
+    try:
+        while True:
+            chunk = read1(chunk_size, decode_content=True)
+            if not chunk:
+                return
+            yield chunk
+    except Exception as e:
+        # Surface urllib3 errors the same way iter_content would
+        raise requests.ConnectionError(e) from e
+
+def fetch_page(url, error_logger=None):
+    """
+    Fetch a URL exactly once and return a Page, or None on connection failure.
+    The body is streamed and reading stops early for non-HTML content types,
+    once max_bytes have been read, or when the deadline passes. Hosts cached as
+    dead are not contacted, and parked-domain pages are marked as skipped.
+    """
+    if skip_dead_host(url, error_logger):
+        return None
+    with metrics.span("fetch", url):
+        if hedge_executor is not None:
+            return _hedged_fetch(url, error_logger)
+        return _fetch_page(url, error_logger)
+
+def _hedged_fetch(url, error_logger):
+    """
+    Fetch the URL in a background thread; while no page has arrived after the host's
+    p95 latency, race it against the next alternate URL. Returns the first page to
+    arrive (losing attempts finish in the background and are discarded), or None
+    with the first attempt's errors if every attempt failed.
+    """
+    tracker = get_latency_tracker()
+    delay = tracker.hedge_delay_for(url, fetch_limits.timeout)
+    alternates = alternate_urls(url)
+    # future -> (errors collected by the attempt, True for a hedge)
+    attempts = {}
+
+    def start(request_url, hedge):
+        collector = ErrorCollector()
+        attempts[hedge_executor.submit(_fetch_page, url, collector, request_url, hedge)] = (collector, hedge)
+
+    start(url, False)
+    winner = None
+    while winner is None:
+        pending = {future for future in attempts if not future.done()}
+        if not pending:
+            break
+        done, _ = concurrent.futures.wait(pending, timeout=delay if alternates else None,
+                                          return_when=concurrent.futures.FIRST_COMPLETED)
+        if not done:
+            # Still waiting after the delay: race the next alternate. Failed attempts are not retried.
+            tracker.record_hedge()
+            start(alternates.pop(0), True)
+        winner = next((future for future in done if future.result() is not None), None)
+
+    if winner is None:
+        # Every attempt failed; report the first attempt's errors
+        collector, _ = next(iter(attempts.values()))
+        page = None
+    else:
+        collector, hedge = attempts[winner]
+        page = winner.result()
+        if hedge:
+            tracker.record_hedge_win()
+    if error_logger:
+        for error in collector.errors:
+            error_logger.log_error(*error)
+    return page
+
+def _fetch_page(url, error_logger, request_url=None, hedge=False):
+    """
+    Fetch one attempt at a URL. request_url is the address actually requested (an
+    alternate for hedged attempts, which count as fetches of url but leave the host
+    cache alone).
+    """
+    request_url = request_url or url
+    if deadline_remaining() == 0:
+        # The run deadline passed; the run labels the URL 'i'
+        return None
+    fetch_counter.record(url)
+    limits = fetch_limits
+    deadline = download_deadline()
+    previous = previous_record(url)
+    timeout = request_timeout(request_url)
+    started = time.monotonic()
+    try:
+        # DNS, connect and time to first byte; the body download is timed separately
+        with metrics.span("fetch_headers", url):
+            response = (session or configure_session()).get(
+                request_url, timeout=timeout, stream=True, headers=previous.request_headers() if previous else None
+            )
+    except requests.RequestException as e:
+        get_latency_tracker().observe_fetch(request_url, time.monotonic() - started)
+        if not hedge:
+            record_host_failure(url, e, timeout)
+        if error_logger:
+            error_logger.log_error("connection", url, f"Connection error: {e}")
+        return None
+    get_latency_tracker().observe_fetch(request_url, time.monotonic() - started)
+
+    with response:
+        headers = dict(response.headers)
+        if response.status_code == 304 and previous is not None:
+            metrics.inc("not_modified")
+            return Page(url, 304, response.url, headers, b'', previous=previous)
+        length = declared_length(headers)
+        if not is_html_content_type(headers):
+            reason = f"Skipped non-HTML content type: {header_value(headers, 'Content-Type')}"
+            if error_logger:
+                error_logger.log_error("content", url, reason)
+            fetch_counter.record_body(0, length or 0, skipped_page=True)
+            return Page(url, response.status_code, response.url, headers, b'', skipped_reason=reason)
+
+        chunks = []
+        size = 0
+        truncated = False
+        try:
+            for chunk in _iter_body(response, limits.chunk_size):
+                chunks.append(chunk)
+                size += len(chunk)
+                if size >= limits.max_bytes or time.monotonic() >= deadline:
+                    truncated = True
+                    break
+        except requests.RequestException as e:
+            # Keep whatever arrived before the connection failed
+            if not chunks:
+                if error_logger:
+                    error_logger.log_error("connection", url, f"Connection error: {e}")
+                return None
+            truncated = True
+        content = b''.join(chunks)[:limits.max_bytes]
+
+    skipped = max(0, length - len(content)) if length is not None and truncated else 0
+    fetch_counter.record_body(len(content), skipped, truncated=truncated)
+    return check_parked(Page(
+        url=url,
+        status_code=response.status_code,
+        final_url=response.url,
+        headers=headers,
+        content=content,
+        truncated=truncated,
+        previous=previous,
+    ), error_logger)
@@ -0,0 +1,230 @@
+# host_cache.py
+"""
+Persistent cache of host-level failures, shared across runs and topics.
+
+When a fetch fails because the host does not resolve, refuses connections, fails the
+TLS handshake or times out, or when the page is a known parked-domain placeholder,
+the host is recorded with a TTL for that kind of failure. Until the entry expires,
+every other URL on the host is labeled 'i' without touching the network.
+"""
+
+import re
+import socket
+import sqlite3
+import ssl
+import threading
+import time
+from urllib.parse import urlparse
+
+
+# Seconds each kind of host failure is remembered
+DEFAULT_TTLS = {
+    'dns': 24 * 3600,
+    'refused': 6 * 3600,
+    'tls': 24 * 3600,
+    'timeout': 3600,
+    'parked': 7 * 24 * 3600,
+}
+
+DEFAULT_HOST_CACHE_FILE = "host_cache.sqlite"
+
+# Lower-cased phrases found on parking and domain-sale placeholder pages
+PARKED_PHRASES = (
+    'this domain is for sale',
+    'this domain may be for sale',
+    'buy this domain',
+    'domain is parked',
+    'parked free, courtesy of',
+    '域名出售',
+    '此域名正在出售',
+    '该域名出售',
+)
+
+# Parking services and domain marketplaces that parked domains redirect to
+PARKED_DOMAINS = (
+    'sedoparking.com',
+    'parkingcrew.net',
+    'bodis.com',
+    'afternic.com',
+    'hugedomains.com',
+    'dan.com',
+)
+
+# Phrases are only looked for on pages no larger than this; real sites that merely
+# mention a domain sale are much bigger than a parking placeholder
+PARKED_MAX_BYTES = 16384
+
+_META_REFRESH = re.compile(rb'<meta[^>]+http-equiv=["\']?refresh[^>]*url=([^"\'>\s;]+)', re.IGNORECASE)
+
+
+def host_of(url):
+    """Return the lower-cased hostname of a URL, with the port if one is given explicitly."""
+    parsed = urlparse(url)
+    host = (parsed.hostname or '').lower()
+    try:
+        port = parsed.port
+    except ValueError:
+        port = None
+    return f"{host}:{port}" if host and port else host
+
+
+def _exception_chain(error):
+    """Yield the error and everything it wraps (causes, contexts, args and reasons)."""
+    seen = set()
+    stack = [error]
+    while stack:
+        current = stack.pop()
+        if current is None or id(current) in seen or not isinstance(current, BaseException):
+            continue
+        seen.add(id(current))
+        yield current
+        stack.extend([current.__cause__, current.__context__, getattr(current, 'reason', None),
+                      getattr(current, '_reason', None), getattr(current, 'os_error', None), *current.args])
+
+
+def classify_connection_error(error):
+    """
+    Map a fetch exception to a host failure kind, or None if it is not host-level.
+
+    A resolver error is host-level only when the name does not exist (NXDOMAIN,
+    EAI_NONAME), whether raised directly or wrapped by urllib3 (NameResolutionError)
+    or aiohttp (ClientConnectorDNSError). Temporary failures such as EAI_AGAIN or
+    SERVFAIL are not cached.
+    """
+    for e in _exception_chain(error):
+        name = type(e).__name__
+        if isinstance(e, socket.gaierror):
+            return 'dns' if e.errno == socket.EAI_NONAME else None
+        if isinstance(e, ssl.SSLError) or name in ('SSLError', 'ClientConnectorCertificateError', 'ClientSSLError'):
+            return 'tls'
+        if isinstance(e, ConnectionRefusedError):
+            return 'refused'
+        # Only connect timeouts count; a slow response body says nothing about the host
+        if name in ('ConnectTimeout', 'ConnectTimeoutError', 'ConnectionTimeoutError'):
+            return 'timeout'
+    return None
+
+
+def _is_parking_service(url):
+    """True if the URL's host is a parking service or domain marketplace."""
+    host = urlparse(url).hostname or ''
+    return any(host == domain or host.endswith('.' + domain) for domain in PARKED_DOMAINS)
+
+
+def parked_url(page):
+    """
+    Return the URL whose host is a parked placeholder, or None.
+
+    A page redirected (by HTTP or a meta refresh) to a parking service marks the
+    requested URL's host. A short page showing a domain-sale phrase marks the host
+    it was served from.
+    """
+    if page.final_url and _is_parking_service(page.final_url):
+        return page.url
+    if page.truncated or len(page.content) > PARKED_MAX_BYTES:
+        return None
+    refresh = _META_REFRESH.search(page.content)
+    if refresh and _is_parking_service(refresh.group(1).decode('ascii', errors='replace')):
+        return page.final_url or page.url
+    text = page.content.decode(page.encoding, errors='replace').lower()
+    if any(phrase in text for phrase in PARKED_PHRASES):
+        return page.final_url or page.url
+    return None
+
+
+class HostCache:
+    """
+    Thread-safe SQLite cache of host -> (failure kind, expiry).
+    """
+    def __init__(self, cache_file=DEFAULT_HOST_CACHE_FILE, ttls=None):
+        """
+        Args:
+            cache_file (str): Path of the SQLite file, shared across runs and topics
+            ttls (dict): Seconds to remember each failure kind; missing kinds use DEFAULT_TTLS
+        """
+        self.cache_file = cache_file
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.skipped = 0
+        self.recorded = 0
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(cache_file, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS hosts ("
+            " host TEXT PRIMARY KEY,"
+            " kind TEXT NOT NULL,"
+            " reason TEXT,"
+            " expires_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        self.conn.execute("DELETE FROM hosts WHERE expires_at < ?", (time.time(),))
+        self.conn.commit()
+
+    def lookup(self, url):
+        """Return (kind, reason) if the URL's host is known to be dead or parked, else None."""
+        host = host_of(url)
+        if not host:
+            return None
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT kind, reason, expires_at FROM hosts WHERE host = ?", (host,)
+            ).fetchone()
+            if row is None or row[2] < time.time():
+                return None
+            self.skipped += 1
+            return row[0], row[1]
+
+    def record(self, url, kind, reason=None):
+        """Remember a host-level failure for the TTL of its kind."""
+        host = host_of(url)
+        if not host or kind not in self.ttls:
+            return
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO hosts VALUES (?, ?, ?, ?, ?)",
+                (host, kind, reason, now + self.ttls[kind], now),
+            )
+            self.recorded += 1
+            if self.recorded % 100 == 0:
+                self.conn.commit()
+
+    def record_error(self, url, error):
+        """Record a fetch exception if it is a host-level failure. Returns the kind or None."""
+        kind = classify_connection_error(error)
+        if kind:
+            self.record(url, kind, str(error)[:200])
+        return kind
+
+    def commit(self):
+        with self._lock:
+            self.conn.commit()
+
+    def reset_stats(self):
+        with self._lock:
+            self.skipped = 0
+            self.recorded = 0
+
+    def get_summary(self):
+        """Return a one-line summary of host cache activity."""
+        return (f"Host cache: {self.skipped} URLs skipped on dead or parked hosts, "
+                f"{self.recorded} host failures recorded")
+
+    def close(self):
+        with self._lock:
+            self.conn.commit()
+            self.conn.close()
+
+
+# Create a global host cache shared by all fetchers; None disables it
+host_cache = None
+
+def configure_host_cache(cache_file=DEFAULT_HOST_CACHE_FILE, ttls=None):
+    """Open the global host cache."""
+    global host_cache
+    host_cache = HostCache(cache_file, ttls)
+    return host_cache
+
+def get_host_cache():
+    """Return the global host cache, or None if it is disabled."""
+    return host_cache
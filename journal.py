@@ -0,0 +1,108 @@
+# journal.py
+"""
+Durable checkpoint journal of completed (url, topic, label) entries.
+
+Entries are stored in SQLite so a killed run can be resumed without refetching or
+reclassifying finished URLs, and so the final _labeled.txt can be rewritten in input
+order by looking labels up one line at a time.
+
+The journal also holds the run's dedup index: each canonical URL is claimed once,
+so duplicates in the input are skipped without keeping every URL in memory.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+
+class Journal:
+    """
+    Append-only record of completed URLs for a single input file.
+    """
+    def __init__(self, input_file, topics, resume=False):
+        """
+        Args:
+            input_file (str): The input file being processed; the journal is stored next to it
+            topics (list): Topics labeled in this run; a URL is done once it has a label for each
+            resume (bool): Keep entries from a previous run instead of starting fresh
+        """
+        self.journal_file = os.path.splitext(input_file)[0] + "_journal.sqlite"
+        self.topics = list(topics)
+        self._topic_params = ", ".join("?" * len(self.topics))
+        # Lookups may come from a feeder thread while results are recorded from another
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.journal_file, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " url TEXT NOT NULL,"
+            " topic TEXT NOT NULL,"
+            " label TEXT NOT NULL,"
+            " completed_at REAL NOT NULL,"
+            " PRIMARY KEY (topic, url))"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS entries_url ON entries (url)")
+        # URLs handed to the engine in this run; unfinished claims from a killed run are dropped
+        self.conn.execute("CREATE TABLE IF NOT EXISTS claimed (url TEXT PRIMARY KEY)")
+        self.conn.execute("DELETE FROM claimed")
+        if not resume:
+            self.conn.execute(f"DELETE FROM entries WHERE topic IN ({self._topic_params})", self.topics)
+        self.conn.commit()
+
+    def is_done(self, url):
+        """Check whether the URL already has a label for every topic in the journal."""
+        with self._lock:
+            row = self.conn.execute(
+                f"SELECT COUNT(*) FROM entries WHERE url = ? AND topic IN ({self._topic_params})",
+                (url, *self.topics),
+            ).fetchone()
+        return row[0] == len(self.topics)
+
+    def claim(self, url):
+        """Mark the URL as taken for this run. Returns False if it was already claimed."""
+        with self._lock:
+            cursor = self.conn.execute("INSERT OR IGNORE INTO claimed (url) VALUES (?)", (url,))
+        return cursor.rowcount == 1
+
+    def get_label(self, url, topic):
+        """Return the journaled label for the URL and topic, or None."""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT label FROM entries WHERE topic = ? AND url = ?", (topic, url)
+            ).fetchone()
+        return row[0] if row else None
+
+    def record(self, url, labels):
+        """Record a completed URL's {topic: label} dict. Call commit() to make it durable."""
+        now = time.time()
+        with self._lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO entries (url, topic, label, completed_at) VALUES (?, ?, ?, ?)",
+                [(url, topic, label, now) for topic, label in labels.items()],
+            )
+
+    def commit(self):
+        with self._lock:
+            self.conn.commit()
+
+    def count(self):
+        """Number of URLs completed for every topic."""
+        with self._lock:
+            return self.conn.execute(
+                f"SELECT COUNT(*) FROM (SELECT url FROM entries WHERE topic IN ({self._topic_params})"
+                " GROUP BY url HAVING COUNT(*) = ?)",
+                (*self.topics, len(self.topics)),
+            ).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self.conn.commit()
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -5,239 +5,1029 @@ This script processes a list of URLs, validates their accessibility, extracts te
 and classifies the content based on a specified topic using the Gemini AI model.
 
 Features:
+- Fetches each URL once and shares the response between validation and extraction.
+- Streams page bodies, skipping non-HTML content and stopping at a byte budget or deadline.
 - Validates website URLs for accessibility.
-- Extracts text content from HTML pages.
+- Extracts text content from HTML pages in a single streaming pass (lxml or html.parser).
+- Labels pages with clear keyword evidence locally and sends only uncertain ones to Gemini (--prefilter).
+- Deduplicates page text and packs the title, description, headings and longest blocks into a token budget.
 - Classifies website content into predefined topics using the Gemini AI model.
+- Compiles each prompt's static instructions once and sends only page content per request.
 - Logs errors encountered during processing.
 - Supports parallel processing of URLs for improved performance.
+- Streams URLs from the input and appends labels to the output as they complete.
+- Caches labels by page content hash, topic, prompt version and model across runs.
+- Remembers dead and parked hosts across runs and labels their URLs 'i' without fetching.
+- Re-crawls incrementally: conditional requests and page fingerprints reuse labels of unchanged pages.
+- Classifies each page against several topics in one request with --topics.
+- Batches pages from many workers into one model request with --batch-size.
+- Rate limits Gemini calls, adapting to 429s, and retries transient errors with backoff.
+- Journals completed URLs so interrupted runs can be resumed with --resume.
+- Records per-stage latency histograms and counters, exported as Prometheus text and a JSON stats file.
+- Records every run's labels, hosts, latencies and errors in a queryable store (see results_store.py).
+- Normalizes URLs and processes each canonical URL once, fanning labels back out to every input line.
+- Bounds tail latency with adaptive per-host timeouts, hedged fetches and a run deadline.
+- Scales out over many machines with a coordinator and leased work units (see distributed.py).
+- Serves single-URL verdicts over HTTP/JSON from a warm, long-running process (see service.py).
 
 Usage:
-    python main.py <input_file.txt> [max_workers]
+    python main.py <input_file.txt> <url_type> [max_workers] [--engine threads|async]
+    python main.py <directory or 'glob*.txt'> <url_type> [max_workers] [options]
 
 Arguments:
-    input_file.txt: A text file where each line is a URL to process.
-    max_workers: (Optional) The number of threads to use for parallel processing. Default is 10.
+    input_file.txt: A text file where each line is a URL to process. A directory or glob of
+        <topic>.txt files is processed through one shared pool, fetching each URL once (see multi_file.py).
+    url_type: The label assigned to URLs related to the topic (h/p).
+    max_workers: (Optional) The number of threads to use for parallel processing. Default is 20.
+    --engine: (Optional) "threads" (default), "async" for the pooled asyncio fetch engine, or
+        "pipeline" for separately sized fetch/extract/classify stages.
+    --concurrency, --per-host: (Optional) Global and per-host limits for the async engine.
+    --topics: (Optional) Comma-separated topics, or "all", classified in one pass.
+    --prompt-detail: (Optional) Topic description detail: small, medium (default) or max.
+    --context-cache-ttl: (Optional) Cache the static prompt prefix with Gemini context caching.
+    --batch-size, --batch-tokens, --batch-timeout: (Optional) Classify several pages per request.
+    --token-budget: (Optional) Estimated content tokens sent per page (default 4000).
+    --stats-file, --metrics-file, --metrics-port, --trace-file: (Optional) Stage timings and counters.
+    --prefilter: (Optional) Label confident pages locally from topic keywords (and an optional model).
+    --rpm, --tpm, --max-retries: (Optional) Gemini quotas and retry budget.
+    --host-cache-file, --no-host-cache, --host-ttl: (Optional) Dead/parked host cache settings.
+    --page-store-file, --no-page-store: (Optional) Incremental re-crawl store settings.
+    --results-file, --no-results-store: (Optional) Queryable store of every run's results.
+    --fold-www: (Optional) Treat www.example.com and example.com as the same URL.
+    --adaptive-timeouts, --min-timeout, --hedge: (Optional) Per-host timeouts and hedged fetches.
+    --run-deadline: (Optional) Label URLs still unfinished after this many seconds 'i'.
 
 Dependencies:
     - requests
-    - BeautifulSoup (from bs4)
+    - BeautifulSoup (from bs4), or lxml when installed
     - dotenv
     - tqdm
     - concurrent.futures
+    - aiohttp (async engine)
     - Gemini AI SDK (google.genai)
 """
 
 import os
 import sys
-import base64
-import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urlparse
-from openai import OpenAI
+import argparse
+import json
+import time
 from google import genai
 from google.genai import types
 from dotenv import load_dotenv
 from tqdm import tqdm
 import concurrent.futures
 from error_logger import ErrorLogger
-from topics import topic_dict_small, topic_dict_medium, topic_dict_max
+from fetcher import fetch_page, fetch_counter, configure_session, configure_fetch_limits
+from streaming import iter_urls, count_urls, ResultWriter
+from url_normalizer import ensure_scheme, normalize_url
+from journal import Journal
+from classification_cache import DEFAULT_CACHE_FILE, configure_cache, content_hash, get_cache
+from host_cache import DEFAULT_HOST_CACHE_FILE, DEFAULT_TTLS, configure_host_cache, get_host_cache
+from page_store import DEFAULT_PAGE_STORE_FILE, configure_page_store, get_page_store
+from results_store import DEFAULT_RESULTS_FILE, ErrorTap, configure_results_store, get_results_store
+from batcher import ClassificationBatcher
+from rate_limiter import configure_rate_limiter, get_rate_limiter
+from tokens import estimate_tokens
+from content_reducer import DEFAULT_TOKEN_BUDGET, configure_reducer, get_token_budget, reduce_content, reduction_stats
+from preclassifier import configure_preclassifier, get_preclassifier
+from metrics import MetricsExporter, get_metrics
+from tail_latency import RunDeadline, configure_latency, get_latency_tracker
+from extractors import available_extractors, configure_extractor, get_extractor
+from prompts import DETAIL_LEVELS, configure_prompts, get_prompt_registry, is_missing_cache_error
 
 
 # Create a global Gemini client to reuse
 client = None
 
+MODEL_NAME = "gemini-2.0-flash"
+
+# Label for pages whose classification failed, e.g. after exhausting API retries
+ERROR_LABEL = 'e'
+
+# Create a global batcher when batching is enabled; None sends one page per request
+batcher = None
+
 def configure():
     load_dotenv()
 
-def is_valid_website(url, error_logger=None):
-    """Check if the website responds successfully."""
-    try:
-        response = requests.get(url, timeout=10)
-        return response.status_code == 200
-    except requests.RequestException as e:
-        if error_logger:
-            error_logger.log_error("connection", url, f"Connection error: {e}")
-        return False
+def is_valid_website(page):
+    """Check if the fetched page responded successfully."""
+    return page is not None and page.ok
+
+def configure_extraction(parser="auto", token_budget=DEFAULT_TOKEN_BUDGET):
+    """Select the extraction backend and content token budget, e.g. in an extraction worker process."""
+    configure_extractor(parser)
+    configure_reducer(token_budget)
 
-def extract_text(url, error_logger=None):
-    """Extracts text content from a website."""
+def extract_text(page, error_logger=None):
+    """
+    Extracts text content from a fetched page, deduplicated, ranked and packed
+    into the content token budget.
+    """
     try:
-        response = requests.get(url, timeout=10)
-        if not response.encoding:
-            response.encoding = 'utf-8'
-        soup = BeautifulSoup(response.text, 'html.parser')
-
-        # Extract text from common tags
-        texts = []
-        for tag in soup.find_all(['p', 'span', 'h1', 'h2', 'h3', 'h4']):
-            texts.append(tag.get_text(separator=' ', strip=True))
-        combined_text = ' '.join(texts)
-        if combined_text:
-            return combined_text[:40000]
-
-        # Fallback: extract from the entire body
-        if soup.body:
-            text = soup.body.get_text(separator=' ', strip=True)
-            return text[:40000]
-    except requests.RequestException as e:
-        if error_logger:
-            error_logger.log_error("parsing", url, f"Content extraction error: {e}")
-        return None
+        with get_metrics().span("extract", page.url):
+            return reduce_content(get_extractor().extract_blocks(page.text), page.url) or None
     except Exception as e:
         if error_logger:
-            error_logger.log_error("parsing", url, f"HTML parsing error: {e}")
+            error_logger.log_error("parsing", page.url, f"HTML parsing error: {e}")
         return None
-    return None
 
 def initialize_client():
     global client
     if client is None:
-        client = genai.Client(api_key=os.environ.get("GOOGLE_API_KEY"))
+        # GEMINI_BASE_URL points the client at a local stand-in endpoint for testing
+        base_url = os.environ.get("GEMINI_BASE_URL")
+        http_options = types.HttpOptions(base_url=base_url) if base_url else None
+        client = genai.Client(api_key=os.environ.get("GOOGLE_API_KEY"), http_options=http_options)
     return client
 
+def call_model(template, client, send, tokens, update=None):
+    """
+    Call send(config) with the template's request config through the rate limiter.
+    If the request's context cache has expired or was deleted, the cache is dropped
+    and the request is sent again with the inline instructions.
+
+    Args:
+        tokens (int): Estimated tokens of the request, for the quota
+        update (dict): Config fields overridden for this request
+    """
+    prompts = get_prompt_registry()
+    config = None
+
+    def attempt():
+        nonlocal config
+        # Resolved at send time, after any wait for quota, so a refreshed cache is picked up
+        config = prompts.request_config(template, client, MODEL_NAME)
+        if update:
+            config = config.model_copy(update=update)
+        return send(config)
+
+    try:
+        return get_rate_limiter().call(attempt, tokens)
+    except Exception as e:
+        if config is None or not config.cached_content or not is_missing_cache_error(e):
+            raise
+        prompts.drop_cache(template, config.cached_content)
+        inline = template.config.model_copy(update=update) if update else template.config
+        return get_rate_limiter().call(lambda: send(inline), tokens)
+
 def classify_website(content, topic, url_type="-", url=None, error_logger=None):
     """Uses the Gemini model to classify website content."""
 
-    topics_dict = topic_dict_medium
+    prompts = get_prompt_registry()
 
-    if topic not in topics_dict:
+    if topic not in prompts.topics:
         if error_logger and url:
             error_logger.log_error("configuration", url, f"Unknown topic: {topic}")
         return 'u'  # Default to 'unrelated'
 
-    prompt = f"""
-    You are a specialized content classifier analyzing website content for sensitive or restricted topics.
-
-    CLASSIFICATION TASK:
-    Determine if the website content relates to: {topics_dict.get(topic)}
-
-    INSTRUCTIONS:
-    - Analyze the entire content including titles, headings, links, text, and metadata
-    - Pay special attention to both explicit mentions and implicit references
-    - Consider both English and Chinese language content (including Simplified and Traditional Chinese)
-    - Look for cultural-specific terms and euphemisms commonly used in Chinese websites
-    - Evaluate images based on their descriptions or surrounding context if available
+    # The instruction prefix is compiled once per topic and url_type; only the content varies
+    template = prompts.single(topic, url_type)
+    version = template.label_versions[topic]
 
-    RESPONSE FORMAT:
-    Reply with EXACTLY ONE character:
-    - "{url_type}" if the content IS related to the topic
-    - "u" if the content is NOT related to the topic
-
-    WEBSITE CONTENT:
-    {content}
-    """
+    # Identical page text is only classified once
+    cache = get_cache()
+    if cache:
+        label = cache.get(content, topic, url_type, version, MODEL_NAME)
+        if label:
+            return label
 
     client = initialize_client()
-    model = "gemini-2.0-flash"
+    model = MODEL_NAME
     contents = [
         types.Content(
             role="user",
             parts=[
-                types.Part.from_text(text=prompt),
+                types.Part.from_text(text=f"WEBSITE CONTENT:\n{content}"),
             ],
         ),
     ]
-    generate_content_config = types.GenerateContentConfig(
-        temperature=0.1,
-        max_output_tokens=1,
-        response_mime_type="text/plain",
-    )
 
-    try:
+    def generate(generate_content_config):
         for chunk in client.models.generate_content_stream(
             model=model,
             contents=contents,
             config=generate_content_config,
         ):
-            result = chunk.text.strip().lower()
+            result = (chunk.text or '').strip().lower()
             if result and result[0] in ['h', 'u', 'i', 'p']:
                 return result[0]
+        return 'u'
+
+    try:
+        label = call_model(template, client, generate, template.prefix_tokens + estimate_tokens(content) + 1)
     except Exception as e:
         if error_logger and url:
             error_logger.log_error("api", url, f"Gemini API error: {e}")
-        return 'u'  # Default to 'unrelated' in case of an error
+        return ERROR_LABEL  # Distinct from 'unrelated' so failures are not silent false negatives
 
-    return 'u'
+    # Only successful model responses are cached
+    if cache:
+        cache.put(content, topic, url_type, version, MODEL_NAME, label)
+    return label
+
+def classify_topics(content, topics, url_type="-", url=None, error_logger=None):
+    """
+    Uses the Gemini model to classify website content against several topics
+    in a single structured request and returns a {topic: label} dict.
+    """
+    prompts = get_prompt_registry()
+    labels = {}
+    for topic in topics:
+        if topic not in prompts.topics:
+            if error_logger and url:
+                error_logger.log_error("configuration", url, f"Unknown topic: {topic}")
+            labels[topic] = 'u'  # Default to 'unrelated'
+
+    # Only ask the model about topics that are not already cached
+    cache = get_cache()
+    pending = []
+    for topic in topics:
+        if topic in labels:
+            continue
+        version = prompts.multi([topic], url_type).label_versions[topic]
+        label = cache.get(content, topic, url_type, version, MODEL_NAME) if cache else None
+        if label:
+            labels[topic] = label
+        else:
+            pending.append(topic)
+    if not pending:
+        return labels
+
+    template = prompts.multi(pending, url_type)
+    client = initialize_client()
+    contents = [
+        types.Content(
+            role="user",
+            parts=[
+                types.Part.from_text(text=f"WEBSITE CONTENT:\n{content}"),
+            ],
+        ),
+    ]
 
-def process_url(url, topic, url_type="-", error_logger=None):
-    """Process a single URL and return the result."""
-    # Ensure the URL has a valid scheme
-    parsed_url = urlparse(url)
-    if not parsed_url.scheme:
-        url = f"http://{url}"
-    
     try:
-        if not is_valid_website(url, error_logger):
-            return url, 'i'
+        response = call_model(
+            template, client,
+            lambda generate_content_config: client.models.generate_content(
+                model=MODEL_NAME,
+                contents=contents,
+                config=generate_content_config,
+            ),
+            template.prefix_tokens + estimate_tokens(content) + template.config.max_output_tokens,
+        )
+        verdicts = json.loads(response.text)
+    except Exception as e:
+        if error_logger and url:
+            error_logger.log_error("api", url, f"Gemini API error: {e}")
+        labels.update({topic: ERROR_LABEL for topic in pending})
+        return labels
+
+    for topic in pending:
+        verdict = verdicts.get(topic)
+        if not isinstance(verdict, bool):
+            if error_logger and url:
+                error_logger.log_error("api", url, f"Missing verdict for topic: {topic}")
+            labels[topic] = ERROR_LABEL
+            continue
+        labels[topic] = url_type if verdict else 'u'
+        if cache:
+            cache.put(content, topic, url_type, template.label_versions[topic], MODEL_NAME, labels[topic])
+    return labels
+
+def classify_batch(pages, topics, url_type="-", urls=None):
+    """
+    Uses the Gemini model to classify several pages against the given topics in
+    one request. Returns one {topic: label} dict per page, or None for a page the
+    model returned no verdict for. Raises on API errors.
+    """
+    prompts = get_prompt_registry()
+    template = prompts.batch(topics, url_type)
+    page_blocks = "\n\n".join(
+        f"WEBSITE {index} CONTENT:\n{content}" for index, content in enumerate(pages, start=1)
+    )
+
+    client = initialize_client()
+    contents = [
+        types.Content(
+            role="user",
+            parts=[
+                types.Part.from_text(text=page_blocks),
+            ],
+        ),
+    ]
+    max_output_tokens = (16 * len(topics) + 16) * len(pages) + 16
+
+    response = call_model(
+        template, client,
+        lambda generate_content_config: client.models.generate_content(
+            model=MODEL_NAME,
+            contents=contents,
+            config=generate_content_config,
+        ),
+        template.prefix_tokens + estimate_tokens(page_blocks) + max_output_tokens,
+        update={"max_output_tokens": max_output_tokens},
+    )
+    verdicts = {entry.get("index"): entry for entry in json.loads(response.text) if isinstance(entry, dict)}
+
+    # Route each verdict back to its page by index
+    results = []
+    for index in range(1, len(pages) + 1):
+        entry = verdicts.get(index)
+        if entry is None or not all(isinstance(entry.get(topic), bool) for topic in topics):
+            results.append(None)
+        else:
+            results.append({topic: url_type if entry[topic] else 'u' for topic in topics})
+    return results
+
+def classify_batched(content, topics, url_type="-", url=None, error_logger=None):
+    """
+    Classify a page through the shared batcher, which groups it with pages from
+    other workers into one request. Returns a {topic: label} dict.
+    """
+    prompts = get_prompt_registry()
+    labels = {}
+    for topic in topics:
+        if topic not in prompts.topics:
+            if error_logger and url:
+                error_logger.log_error("configuration", url, f"Unknown topic: {topic}")
+            labels[topic] = 'u'  # Default to 'unrelated'
+
+    cache = get_cache()
+    pending = []
+    for topic in topics:
+        if topic in labels:
+            continue
+        version = prompts.batch([topic], url_type).label_versions[topic]
+        label = cache.get(content, topic, url_type, version, MODEL_NAME) if cache else None
+        if label:
+            labels[topic] = label
         else:
-            content = extract_text(url, error_logger)
-            if content:
-                label = classify_website(content, topic, url_type, url, error_logger)
-            else:
-                label = 'i'
-        return url, label
+            pending.append(topic)
+    if not pending:
+        return labels
+
+    try:
+        verdicts = batcher.classify(content, pending, url_type, url)
+    except Exception as e:
+        if error_logger and url:
+            error_logger.log_error("api", url, f"Gemini API error: {e}")
+        labels.update({topic: ERROR_LABEL for topic in pending})
+        return labels
+
+    if verdicts is None:
+        if error_logger and url:
+            error_logger.log_error("api", url, "Missing verdict in batch response")
+        labels.update({topic: ERROR_LABEL for topic in pending})
+        return labels
+
+    labels.update(verdicts)
+    if cache:
+        template = prompts.batch(pending, url_type)
+        for topic in pending:
+            cache.put(content, topic, url_type, template.label_versions[topic], MODEL_NAME, verdicts[topic])
+    return labels
+
+def configure_batcher(batch_size=20, batch_tokens=100_000, batch_timeout=0.5):
+    """Enable request batching with the given size, token and latency bounds."""
+    global batcher
+    batcher = ClassificationBatcher(
+        classify_batch, max_batch_size=batch_size, max_batch_tokens=batch_tokens, flush_timeout=batch_timeout,
+    )
+    return batcher
+
+def close_batcher():
+    """Send pending batches and disable batching."""
+    global batcher
+    if batcher is not None:
+        batcher.close()
+        print(batcher.get_summary())
+        batcher = None
+
+def classify_content(content, topics, url_type="-", url=None, error_logger=None, versions=None):
+    """
+    Classify extracted page text against one or more topics and return a
+    {topic: label} dict, using the batcher when enabled and a single request
+    for several topics. When the pre-classifier is enabled, topics it is
+    confident about are labeled locally and only the rest go to the API.
+    If given, versions receives the version of each label (see label_version).
+    """
+    if not content:
+        return {topic: 'i' for topic in topics}
+    with get_metrics().span("classify", url):
+        return _classify_content(content, topics, url_type, url, error_logger, {} if versions is None else versions)
+
+def _classify_content(content, topics, url_type, url, error_logger, versions):
+    labels = {}
+    prefilter = get_preclassifier()
+    if prefilter is not None:
+        verdicts = prefilter.predict(content, topics)
+        labels = {topic: url_type if related else 'u' for topic, related in verdicts.items()}
+        versions.update(dict.fromkeys(labels, prefilter.version))
+        topics = [topic for topic in topics if topic not in labels]
+        if not topics:
+            return labels
+    kind = prompt_kind(topics)
+    versions.update({topic: label_version(kind, topic, url_type) for topic in topics})
+    if kind == "batch":
+        labels.update(classify_batched(content, topics, url_type, url, error_logger))
+    elif kind == "single":
+        labels[topics[0]] = classify_website(content, topics[0], url_type, url, error_logger)
+    else:
+        labels.update(classify_topics(content, topics, url_type, url, error_logger))
+    return labels
+
+def prompt_kind(topics):
+    """The prompt a page is sent to the model with for these topics: batch, single or multi."""
+    if batcher is not None:
+        return "batch"
+    return "single" if len(topics) == 1 else "multi"
+
+def prompt_version(kind, topic, url_type="-"):
+    """Version of the topic's prompt of the given kind (single, multi or batch)."""
+    registry = get_prompt_registry()
+    template = registry.single(topic, url_type) if kind == "single" else getattr(registry, kind)([topic], url_type)
+    return template.label_versions[topic]
+
+def label_version(kind, topic, url_type="-"):
+    """Version of a model label: the model, url_type and prompt it was made with."""
+    return f"{MODEL_NAME}:{url_type}:{prompt_version(kind, topic, url_type)}"
+
+def label_versions(topics, url_type="-"):
+    """
+    Versions of the labels this run may reuse for a page labeled for topics: those
+    of the prompt it would send the page with and, when the pre-classifier is
+    enabled, its own. As the pre-classifier leaves any subset of the topics to the
+    model, single and multi-topic labels are both accepted then.
+    """
+    prefilter = get_preclassifier()
+    kinds = {prompt_kind(topics)}
+    if prefilter is not None and batcher is None:
+        kinds = {"single", "multi"} if len(topics) > 1 else {"single"}
+    accepted = {}
+    for topic in topics:
+        accepted[topic] = {label_version(kind, topic, url_type) for kind in kinds}
+        if prefilter is not None:
+            accepted[topic].add(prefilter.version)
+    return accepted
+
+def start_results_run(input_file, topics, url_type="-", engine="threads", fold_www=False, input_files=None,
+                      resume=False):
+    """
+    Register a run in the results store with each topic's model and prompt version; None if it is disabled.
+    A resumed run is linked to the latest run of the same input, which holds the URLs it skips.
+    """
+    results = get_results_store()
+    if not results:
+        return None
+    kind = prompt_kind(topics)
+    versions = {topic: (MODEL_NAME, prompt_version(kind, topic, url_type)) for topic in topics}
+    parent_run = results.latest_run(input_file, input_files) if resume else None
+    return results.start_run(input_file, url_type, engine, versions, fold_www, input_files, parent_run)
+
+def reuse_stored_labels(page):
+    """
+    Return the previous run's labels for a page that has not changed since, because
+    the server answered 304 or sent an identical body, or None if it must be processed.
+    """
+    previous = page.previous if page is not None else None
+    if previous is None:
+        return None
+    if page.not_modified:
+        get_page_store().count_unchanged('not_modified')
+    elif page.ok and page.body_hash == previous.body_hash:
+        get_page_store().record(page.url, page.headers, page.body_hash, previous.fingerprint, previous.labels,
+                                previous.versions, reused='body')
+    else:
+        return None
+    get_metrics().inc("pages_unchanged")
+    return dict(previous.labels)
+
+def classify_page(page, content, topics, url_type="-", error_logger=None):
+    """
+    Classify a page's extracted text, reusing the previous run's labels if the text
+    is unchanged, and remember the labels in the page store.
+    """
+    store = get_page_store()
+    if store is None or not content:
+        return classify_content(content, topics, url_type, page.url, error_logger)
+    fingerprint = content_hash(content)
+    previous = page.previous
+    if previous is not None and previous.fingerprint == fingerprint:
+        labels = dict(previous.labels)
+        versions = previous.versions
+        reused = 'text'
+        get_metrics().inc("pages_unchanged")
+    else:
+        versions = {}
+        labels = classify_content(content, topics, url_type, page.url, error_logger, versions)
+        reused = None
+    # Failed classifications are retried on the next run rather than reused
+    store.record(page.url, page.headers, page.body_hash, fingerprint,
+                 {topic: label for topic, label in labels.items() if label not in ('i', ERROR_LABEL)}, versions, reused)
+    return labels
+
+def label_page_topics(url, page, topics, url_type="-", error_logger=None):
+    """
+    Validate, extract and classify an already fetched page against one or more
+    topics and return a {topic: label} dict. The page is parsed once and, for
+    several topics, classified with a single model request. Pages unchanged since
+    the previous run keep their stored labels.
+    """
+    try:
+        labels = reuse_stored_labels(page)
+        if labels is not None:
+            return labels
+        if not is_valid_website(page):
+            return {topic: 'i' for topic in topics}
+        content = extract_text(page, error_logger)
+        return classify_page(page, content, topics, url_type, error_logger)
     except Exception as e:
         if error_logger:
             error_logger.log_error("processing", url, f"Unexpected error: {e}")
-        return url, 'i'
+        return {topic: 'i' for topic in topics}
+
+def label_page(url, page, topic, url_type="-", error_logger=None):
+    """Validate, extract and classify an already fetched page and return its label."""
+    return label_page_topics(url, page, [topic], url_type, error_logger)[topic]
+
+def process_url(url, topic, url_type="-", error_logger=None):
+    """Process a single URL and return the result."""
+    url = ensure_scheme(url)
+    # Fetch once and share the response between validation and extraction
+    page = fetch_page(url, error_logger)
+    return url, label_page(url, page, topic, url_type, error_logger)
+
+def run_threads(urls, handle_page, on_result, error_logger, max_workers, window=None, deadline=None):
+    """
+    Fetch and label URLs with a ThreadPoolExecutor, keeping at most `window` tasks
+    in flight, and report each result through on_result(url, labels) as soon as it
+    completes. labels is None if the task itself failed. Once time.monotonic()
+    passes deadline, returns without waiting for the tasks still in flight.
+    """
+    window = window or max_workers * 4
+    urls = iter(urls)
+
+    def fetch_and_label(url):
+        # Fetch once and share the response between validation and extraction
+        return handle_page(url, fetch_page(url, error_logger))
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    future_to_url = {}
+    try:
+        while True:
+            # Top up the window of in-flight tasks from the lazy URL iterator
+            for url in urls:
+                future_to_url[executor.submit(fetch_and_label, url)] = url
+                if len(future_to_url) >= window:
+                    break
+            if not future_to_url:
+                break
+
+            # Process results as they complete
+            timeout = None if deadline is None else max(0, deadline - time.monotonic())
+            done, _ = concurrent.futures.wait(future_to_url, timeout=timeout,
+                                              return_when=concurrent.futures.FIRST_COMPLETED)
+            if not done:
+                # The run deadline passed; the caller labels the stragglers
+                break
+            for future in done:
+                url = future_to_url.pop(future)
+                try:
+                    on_result(url, future.result())
+                except Exception as e:
+                    error_logger.log_error("executor", url, f"Task execution error: {e}")
+                    on_result(url, None)
+    finally:
+        # Do not wait for stragglers left behind at the deadline
+        executor.shutdown(wait=not future_to_url, cancel_futures=True)
+
+def run_engine(urls, topics, url_type, on_result, error_logger, engine="threads", max_workers=50, concurrency=1000,
+               per_host=8, window=None, parse_workers=None, classify_workers=None, queue_size=100, topics_for=None,
+               run_deadline=None, results_run=None, fold_www=False):
+    """
+    Fetch, extract and classify URLs (already carrying a scheme) with the selected
+    engine, reporting each result through on_result(url, labels). When URLs need
+    different topics, topics_for(url) returns the subset of topics for each URL.
+    After run_deadline seconds, URLs still in flight or not started are reported
+    with labels None and a timeout error instead of being waited for. With
+    results_run (from start_results_run), every result is also recorded in the
+    results store under its canonical URL, with its latency and first error.
+    """
+    topics_of = topics_for or (lambda url: topics)
+    results = get_results_store()
+    tap = None
+    if results and results_run is not None:
+        tap = error_logger = ErrorTap(error_logger)
+    # Each page's content token counts are kept until its result is recorded
+    reduction_stats.track_urls = tap is not None
+
+    def record(url, labels, latency):
+        labels = labels or {}
+        results.record(results_run, normalize_url(url, fold_www),
+                       {topic: labels.get(topic, 'i') for topic in topics_of(url)}, latency, tap.pop(url),
+                       reduction_stats.pop(url))
+
+    run = RunDeadline(urls, on_result, run_deadline, error_logger, record if tap else None)
+    urls, on_result, deadline = iter(run), run.on_result, run.expires_at
+    handle_page = lambda url, page: label_page_topics(url, page, topics_of(url), url_type, error_logger)
+    configure_session(max_workers)
+    store = get_page_store()
+    if store:
+        store.set_label_versions(topics, lambda url_topics: label_versions(url_topics, url_type))
+        store.set_url_topics(topics_for)
+    if engine == "pipeline":
+        from pipeline import run_pipeline
+        run_pipeline(
+            urls, extract_text,
+            lambda url, content, page: classify_page(page, content, topics_of(url), url_type, error_logger),
+            on_result, {topic: 'i' for topic in topics}, error_logger, reuse=reuse_stored_labels,
+            fetch_workers=max_workers, parse_workers=parse_workers or os.cpu_count(),
+            classify_workers=classify_workers or max_workers, queue_size=queue_size, deadline=deadline,
+            initializer=configure_extraction, initargs=(get_extractor().name, get_token_budget()),
+        )
+    elif engine == "async":
+        from async_engine import run_async
+        run_async(
+            urls, handle_page, on_result, error_logger,
+            concurrency=concurrency, per_host=per_host, max_workers=max_workers, window=window, deadline=deadline,
+        )
+    else:
+        run_threads(urls, handle_page, on_result, error_logger, max_workers, window, deadline)
+    run.finish()
 
-def process_file(input_file, url_type="-", max_workers=50):
+def output_file_for(input_file, topic, multi_topic=False):
+    """Return the labeled output path for a topic."""
+    base = os.path.splitext(input_file)[0]
+    if multi_topic:
+        return f"{base}_{topic}_labeled.txt"
+    return base + "_labeled.txt"
+
+def write_output_in_order(input_file, output_file, journal, topic, flush_every=100, fold_www=False):
+    """
+    Rewrite the labeled output in input order from the journal, without reprocessing.
+    Every input line gets the label of its canonical URL, so duplicates share one result.
+    """
+    with ResultWriter(output_file, flush_every) as writer:
+        for line in iter_urls(input_file):
+            label = journal.get_label(normalize_url(line, fold_www), topic)
+            if label is not None:
+                writer.write(ensure_scheme(line), label)
+
+def reset_run_stats():
+    """Reset the fetch, extraction, cache, quota and stage statistics at the start of a run."""
+    fetch_counter.reset()
+    reduction_stats.reset()
+    get_metrics().reset()
+    get_latency_tracker().reset_stats()
+    for component in (get_cache(), get_host_cache(), get_page_store(), get_results_store(), get_preclassifier()):
+        if component:
+            component.reset_stats()
+    get_rate_limiter().reset_stats()
+
+def report_run_stats(stats_file):
+    """Commit the shared caches, print the run's statistics and write the stage metrics to stats_file."""
+    print(fetch_counter.get_summary())
+    print(reduction_stats.get_summary())
+    prefilter = get_preclassifier()
+    if prefilter:
+        print(prefilter.get_summary())
+    print(get_rate_limiter().get_summary())
+    for store in (get_cache(), get_host_cache(), get_page_store(), get_results_store()):
+        if store:
+            store.commit()
+            print(store.get_summary())
+    metrics = get_metrics()
+    print(metrics.get_summary())
+    print(get_latency_tracker().get_summary())
+    metrics.write_json(stats_file)
+    print(f"Run stats written to {stats_file}")
+
+def process_file(input_file, url_type="-", max_workers=50, engine="threads", concurrency=1000, per_host=8,
+                 window=None, flush_every=100, resume=False, topics=None,
+                 batch_size=1, batch_tokens=100_000, batch_timeout=0.5,
+                 parse_workers=None, classify_workers=None, queue_size=100, fold_www=False, stats_file=None,
+                 run_deadline=None):
     """
     Processes an input TXT file where each line is a URL.
-    Uses ThreadPoolExecutor for parallel processing.
+    Uses ThreadPoolExecutor for parallel processing, or a pooled asyncio
+    client when engine is "async". URLs are read lazily with at most `window`
+    in flight, and each label is appended to the output file as it completes.
+    Completed URLs are recorded in a journal; with resume=True, URLs finished
+    by a previous run are skipped.
+
+    Input URLs are normalized first (see url_normalizer; fold_www also merges
+    www. hosts) and each canonical URL is processed once. The final output has
+    one line per input line, each with the label of its canonical URL.
+
+    Stage timings and counters are written to stats_file (default
+    <input>_stats.json) as JSON at the end of the run.
+
+    The topic is derived from the input file name unless a list of topics is
+    given, in which case each URL is fetched once, classified against every
+    topic in one request, and one <input>_<topic>_labeled.txt is written per topic.
+
+    With batch_size > 1, pages from all workers are grouped into requests of up
+    to batch_size pages and batch_tokens estimated tokens, and a partial batch
+    is sent after batch_timeout seconds.
+
+    With engine "pipeline", fetching (max_workers threads), HTML extraction
+    (parse_workers processes) and classification (classify_workers threads)
+    run as separate stages connected by queues of queue_size items.
+
+    With run_deadline, URLs not finished run_deadline seconds after the engine
+    starts are labeled 'i' with a timeout error instead of being waited for.
     """
-    # Derive topic from the input file name
-    topic = os.path.splitext(os.path.basename(input_file))[0]
+    multi_topic = topics is not None
+    if not multi_topic:
+        # Derive topic from the input file name
+        topics = [os.path.splitext(os.path.basename(input_file))[0]]
     
     # Initialize error logger
     error_logger = ErrorLogger(input_file)
+    output_files = {topic: output_file_for(input_file, topic, multi_topic) for topic in topics}
     
-    # Read URLs from file
-    with open(input_file, 'r', encoding='utf-8') as f:
-        urls = [line.strip() for line in f if line.strip()]
-    
-    results = []
-    # Use a ThreadPoolExecutor for parallel processing
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # Submit all tasks and create a mapping of futures to URLs
-        future_to_url = {executor.submit(process_url, url, topic, url_type, error_logger): url for url in urls}
-        
-        # Process results as they complete
-        for future in tqdm(
-            concurrent.futures.as_completed(future_to_url),
-            total=len(urls),
-            desc="Processing URLs",
-            unit="url"
-        ):
-            url = future_to_url[future]
-            try:
-                result = future.result(timeout=60)
-                results.append(result)
-            except concurrent.futures.TimeoutError:
-                error_logger.log_error("timeout", url, "Task timed out")
-                results.append((url, 'i'))
-            except Exception as e:
-                error_logger.log_error("executor", url, f"Task execution error: {e}")
-                results.append((url, 'i'))
+    metrics = get_metrics()
+    reset_run_stats()
+    if batch_size > 1:
+        configure_batcher(batch_size, batch_tokens, batch_timeout)
+    with Journal(input_file, topics, resume=resume) as journal:
+        skipped = journal.count()
+        if skipped:
+            print(f"Resuming: {skipped} URLs already completed")
+
+        duplicates = 0
+
+        def unique_urls():
+            """Stream canonical URLs from the file, skipping finished and already queued ones."""
+            nonlocal duplicates
+            for line in iter_urls(input_file):
+                url = normalize_url(line)
+                key = normalize_url(url, fold_www)
+                if journal.is_done(key):
+                    progress.update(1)
+                elif not journal.claim(key):
+                    duplicates += 1
+                    progress.update(1)
+                else:
+                    yield url
+
+        # Stream URLs from the file instead of reading them all into memory
+        urls = unique_urls()
+
+        writers = {topic: ResultWriter(path, flush_every, mode='a' if resume else 'w')
+                   for topic, path in output_files.items()}
+        completed = 0
+        finished = False
+        results_run = start_results_run(input_file, topics, url_type, engine, fold_www, resume=resume)
+        try:
+            with tqdm(
+                total=count_urls(input_file),
+                desc="Processing URLs",
+                unit="url"
+            ) as progress:
+                def on_result(url, labels):
+                    nonlocal completed
+                    if labels is None:
+                        labels = {topic: 'i' for topic in topics}
+                    for topic, label in labels.items():
+                        writers[topic].write(url, label)
+                    journal.record(normalize_url(url, fold_www), labels)
+                    metrics.inc("urls_completed")
+                    completed += 1
+                    # Make the journal durable at the same cadence as the output files
+                    if completed % flush_every == 0:
+                        journal.commit()
+                        if results_run is not None:
+                            get_results_store().commit()
+                    progress.update(1)
+
+                run_engine(
+                    urls, topics, url_type, on_result, error_logger, engine=engine, max_workers=max_workers,
+                    concurrency=concurrency, per_host=per_host, window=window, parse_workers=parse_workers,
+                    classify_workers=classify_workers, queue_size=queue_size, run_deadline=run_deadline,
+                    results_run=results_run, fold_www=fold_www,
+                )
+            finished = True
+        finally:
+            close_batcher()
+            for writer in writers.values():
+                writer.close()
+            if results_run is not None:
+                get_results_store().finish_run(results_run, completed=finished)
+
+        journal.commit()
+        for topic, output_file in output_files.items():
+            write_output_in_order(input_file, output_file, journal, topic, flush_every, fold_www)
+            print(f"Results written to {output_file}")
     
-    # Write results to an output file
-    output_file = os.path.splitext(input_file)[0] + "_labeled.txt"
-    with open(output_file, 'w', encoding='utf-8') as f:
-        for url, label in results:
-            f.write(f"{url} {label}\n")
-    print(f"Results written to {output_file}")
+    if duplicates:
+        print(f"Deduplicated {duplicates} input lines that normalize to an already queued URL")
+    report_run_stats(stats_file or os.path.splitext(input_file)[0] + "_stats.json")
     
     # Write error summary
     error_logger.write_log()
 
+def add_run_arguments(parser):
+    """Add the engine, fetch, extraction, cache, prompt, batching, metrics and quota options."""
+    parser.add_argument("--engine", choices=["threads", "async", "pipeline"], default="threads",
+                        help="Thread-per-URL executor, pooled asyncio client, or staged "
+                             "fetch/extract/classify pipeline")
+    parser.add_argument("--concurrency", type=int, default=1000,
+                        help="Async engine: global limit on fetches in flight (default: 1000)")
+    parser.add_argument("--per-host", type=int, default=8,
+                        help="Async engine: connections per host (default: 8)")
+    parser.add_argument("--parse-workers", type=int, default=None,
+                        help="Pipeline engine: extraction processes (default: CPU count)")
+    parser.add_argument("--classify-workers", type=int, default=None,
+                        help="Pipeline engine: classifier threads (default: max_workers)")
+    parser.add_argument("--queue-size", type=int, default=100,
+                        help="Pipeline engine: capacity of each stage's queue (default: 100)")
+    parser.add_argument("--parser", choices=["auto", *available_extractors()], default="auto",
+                        help="HTML extraction backend (default: auto, the fastest available)")
+    parser.add_argument("--token-budget", type=int, default=DEFAULT_TOKEN_BUDGET,
+                        help="Estimated content tokens sent per page after deduplication and ranking; "
+                             f"0 for no limit (default: {DEFAULT_TOKEN_BUDGET})")
+    parser.add_argument("--adaptive-timeouts", action="store_true",
+                        help="Set each request's socket timeout to 3x its host's observed p95 latency (between "
+                             "--min-timeout and 10s) instead of a fixed 10s")
+    parser.add_argument("--min-timeout", type=float, default=2.0,
+                        help="Shortest adaptive socket timeout in seconds (default: 2)")
+    parser.add_argument("--hedge", action="store_true",
+                        help="When a fetch is slower than its host's p95, race it against the other scheme, "
+                             "then the www/non-www host, and keep the first page to arrive")
+    parser.add_argument("--max-bytes", type=int, default=2_000_000,
+                        help="Stop downloading a page body after this many bytes (default: 2000000)")
+    parser.add_argument("--fetch-deadline", type=float, default=30,
+                        help="Total wall-clock seconds allowed for one page download (default: 30)")
+    parser.add_argument("--window", type=int, default=None,
+                        help="Maximum URLs in flight at once (default: 4x workers, or 2x concurrency for async)")
+    parser.add_argument("--cache-file", default=DEFAULT_CACHE_FILE,
+                        help=f"Classification cache shared across runs (default: {DEFAULT_CACHE_FILE})")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Disable the classification cache")
+    parser.add_argument("--cache-max-entries", type=int, default=1_000_000,
+                        help="Maximum number of cached labels (default: 1000000)")
+    parser.add_argument("--cache-max-age", type=float, default=30,
+                        help="Days before a cached label expires (default: 30)")
+    parser.add_argument("--host-cache-file", default=DEFAULT_HOST_CACHE_FILE,
+                        help=f"Cache of dead and parked hosts shared across runs (default: {DEFAULT_HOST_CACHE_FILE})")
+    parser.add_argument("--no-host-cache", action="store_true",
+                        help="Disable the dead/parked host cache")
+    parser.add_argument("--page-store-file", default=DEFAULT_PAGE_STORE_FILE,
+                        help="ETags, Last-Modified dates, fingerprints and labels of fetched pages, used to skip "
+                             f"unchanged pages on re-runs (default: {DEFAULT_PAGE_STORE_FILE})")
+    parser.add_argument("--no-page-store", action="store_true",
+                        help="Disable incremental re-crawls; always download, parse and classify every page")
+    parser.add_argument("--results-file", default=DEFAULT_RESULTS_FILE,
+                        help="Queryable store of every run's labels, hosts, latencies and errors "
+                             f"(default: {DEFAULT_RESULTS_FILE})")
+    parser.add_argument("--no-results-store", action="store_true",
+                        help="Do not record results beyond the _labeled.txt files")
+    parser.add_argument("--host-ttl", action="append", default=[], metavar="KIND=SECONDS",
+                        help="Override how long a host failure is remembered; kinds: "
+                             f"{', '.join(f'{kind} ({ttl})' for kind, ttl in DEFAULT_TTLS.items())}")
+    parser.add_argument("--prompt-detail", choices=list(DETAIL_LEVELS), default="medium",
+                        help="Topic description detail in prompts: small is cheapest and fastest, max is "
+                             "most specific (default: medium)")
+    parser.add_argument("--context-cache-ttl", type=int, default=None,
+                        help="Store each prompt's instruction prefix with Gemini context caching for this many "
+                             "seconds instead of resending it (default: off)")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="Pages classified per model request; 1 disables batching (default: 1)")
+    parser.add_argument("--batch-tokens", type=int, default=100_000,
+                        help="Maximum estimated content tokens per batched request (default: 100000)")
+    parser.add_argument("--batch-timeout", type=float, default=0.5,
+                        help="Seconds before a partial batch is sent (default: 0.5)")
+    parser.add_argument("--prefilter", action="store_true",
+                        help="Label confident pages with the local keyword pre-classifier instead of the API")
+    parser.add_argument("--prefilter-positive", type=int, default=3,
+                        help="Pre-classifier: distinct topic keywords needed to label a page on-topic "
+                             "(default: 3, 0 disables)")
+    parser.add_argument("--prefilter-negative", type=int, default=0,
+                        help="Pre-classifier: label pages of at least this many tokens with no topic keywords "
+                             "unrelated (default: 0, disabled)")
+    parser.add_argument("--prefilter-model", default=None,
+                        help="Pre-classifier: hashed n-gram model from `python preclassifier.py train`")
+    parser.add_argument("--prefilter-thresholds", default="0.05,0.95",
+                        help="Pre-classifier: model probabilities LOW,HIGH outside which pages are labeled locally "
+                             "(default: 0.05,0.95)")
+    parser.add_argument("--metrics-file", default=None,
+                        help="Prometheus text file rewritten every --metrics-interval seconds during the run")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Serve Prometheus metrics at http://0.0.0.0:PORT/metrics during the run")
+    parser.add_argument("--metrics-interval", type=float, default=5.0,
+                        help="Seconds between --metrics-file updates (default: 5)")
+    parser.add_argument("--trace-file", default=None,
+                        help="Append one JSON line per fetch/extract/classify span with its URL")
+    parser.add_argument("--rpm", type=float, default=2000,
+                        help="Gemini requests per minute quota (default: 2000)")
+    parser.add_argument("--tpm", type=float, default=4_000_000,
+                        help="Gemini tokens per minute quota (default: 4000000)")
+    parser.add_argument("--max-retries", type=int, default=5,
+                        help="Retries for throttled or transient Gemini errors (default: 5)")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Classify a list of URLs against the topic named by the input file.")
+    parser.add_argument("input_file", help="Text file with one URL per line; its name is the topic. A directory "
+                                           "or quoted glob of <topic>.txt files shares one worker pool")
+    parser.add_argument("url_type", help="Label to assign to related URLs (h/p)")
+    parser.add_argument("max_workers", nargs="?", type=int, default=20,
+                        help="Worker threads (default: 20)")
+    parser.add_argument("--flush-every", type=int, default=100,
+                        help="Flush labeled output to disk every N results (default: 100)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip URLs completed by a previous run of the same input file")
+    parser.add_argument("--fold-www", action="store_true",
+                        help="Treat www.example.com and example.com as the same URL when deduplicating")
+    parser.add_argument("--topics", default=None,
+                        help="Comma-separated topics, or 'all', to classify in one pass instead of "
+                             "the topic named by the input file")
+    parser.add_argument("--stats-file", default=None,
+                        help="JSON file for stage latency histograms and counters (default: <input>_stats.json)")
+    parser.add_argument("--run-deadline", type=float, default=None,
+                        help="Seconds after which URLs still unfinished are labeled 'i' with a timeout "
+                             "reason instead of waited for (default: none)")
+    add_run_arguments(parser)
+    return parser.parse_args(argv)
+
+def apply_run_arguments(args):
+    """
+    Configure the global prompt registry, rate limiter, extractor, caches and
+    tracing from the options added by add_run_arguments. Exits on invalid options.
+    """
+    configure_prompts(args.prompt_detail, args.context_cache_ttl)
+    configure_rate_limiter(args.rpm, args.tpm, args.max_retries)
+    configure_extraction(args.parser, args.token_budget)
+    if args.prefilter:
+        low, high = (float(value) for value in args.prefilter_thresholds.split(","))
+        configure_preclassifier(args.prefilter_positive, args.prefilter_negative, args.prefilter_model, low, high)
+    configure_fetch_limits(args.max_bytes, args.fetch_deadline)
+    configure_latency(args.adaptive_timeouts, args.hedge, args.min_timeout)
+    if not args.no_cache:
+        configure_cache(args.cache_file, args.cache_max_entries, args.cache_max_age)
+    if not args.no_host_cache:
+        host_ttls = {}
+        for override in args.host_ttl:
+            kind, _, seconds = override.partition("=")
+            try:
+                if kind not in DEFAULT_TTLS:
+                    raise ValueError(kind)
+                host_ttls[kind] = float(seconds)
+            except ValueError:
+                print(f"Invalid --host-ttl: {override} (expected KIND=SECONDS, kinds: {', '.join(DEFAULT_TTLS)})")
+                sys.exit(1)
+        configure_host_cache(args.host_cache_file, host_ttls)
+    if not args.no_page_store:
+        configure_page_store(args.page_store_file)
+    if not args.no_results_store:
+        configure_results_store(args.results_file)
+    if args.trace_file:
+        get_metrics().start_trace(args.trace_file)
+
+def start_metrics_exporter(args):
+    """Start publishing metrics if --metrics-file or --metrics-port was given; returns the exporter or None."""
+    if args.metrics_file or args.metrics_port is not None:
+        return MetricsExporter(get_metrics(), args.metrics_file, args.metrics_port, args.metrics_interval)
+    return None
+
+def parse_topics(spec):
+    """Resolve a --topics value ('all' or comma-separated names) to a list, exiting on unknown topics."""
+    if not spec:
+        return None
+    known_topics = get_prompt_registry().topics
+    topics = list(known_topics) if spec == "all" else spec.split(",")
+    unknown = [topic for topic in topics if topic not in known_topics]
+    if unknown:
+        print(f"Unknown topics: {', '.join(unknown)}")
+        sys.exit(1)
+    return topics
+
 if __name__ == '__main__':
     configure()
-    if len(sys.argv) < 3:
-        print("Usage: python script.py <input_file.txt> <url_type: h/p> [max_workers]")
+    args = parse_args()
+    apply_run_arguments(args)
+    topics = parse_topics(args.topics)
+    # A directory or glob of <topic>.txt files is processed through one shared pool
+    multi_file = os.path.isdir(args.input_file) or any(char in args.input_file for char in "*?[")
+    if multi_file and topics:
+        print("--topics cannot be combined with a directory of topic files; topics come from the file names")
         sys.exit(1)
-    
-    input_file = sys.argv[1]
-    url_type = sys.argv[2]
-    max_workers = int(sys.argv[3]) if len(sys.argv) > 3 else 20
-    
-    process_file(input_file, url_type, max_workers)
+    exporter = start_metrics_exporter(args)
+    run_options = dict(
+        engine=args.engine, concurrency=args.concurrency, per_host=args.per_host,
+        window=args.window, flush_every=args.flush_every, resume=args.resume,
+        batch_size=args.batch_size, batch_tokens=args.batch_tokens, batch_timeout=args.batch_timeout,
+        parse_workers=args.parse_workers, classify_workers=args.classify_workers, queue_size=args.queue_size,
+        fold_www=args.fold_www, stats_file=args.stats_file, run_deadline=args.run_deadline,
+    )
+    try:
+        if multi_file:
+            from multi_file import find_topic_files, process_files
+            process_files(find_topic_files(args.input_file), args.url_type, args.max_workers, **run_options)
+        else:
+            process_file(args.input_file, args.url_type, args.max_workers, topics=topics, **run_options)
+    finally:
+        if exporter:
+            exporter.close()
+        get_metrics().close()
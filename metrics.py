@@ -0,0 +1,267 @@
+# metrics.py
+"""
+Lightweight metrics and tracing shared by every stage.
+
+Counters and fixed-bucket latency histograms are updated under a single lock with
+O(buckets) work per observation, so they are cheap enough to leave on. They can be
+exported while the run is in progress as Prometheus text (a file rewritten every
+few seconds, or an HTTP endpoint) and are written as a JSON stats file at the end.
+With a trace file, every span is also appended as one JSON line with its URL.
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+METRIC_PREFIX = "classifier"
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram of observed values.
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        # One extra slot for values above the last bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Estimate a quantile by linear interpolation inside its bucket."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else lower * 2 or 1.0
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else 0.0,
+            "p50": round(self.quantile(0.5), 6),
+            "p95": round(self.quantile(0.95), 6),
+            "p99": round(self.quantile(0.99), 6),
+            "buckets": {str(bound): count for bound, count in zip((*self.buckets, "+Inf"), self.counts)},
+        }
+
+
+class _Span:
+    __slots__ = ("metrics", "name", "url", "cpu", "start", "cpu_start")
+
+    def __init__(self, metrics, name, url, cpu):
+        self.metrics = metrics
+        self.name = name
+        self.url = url
+        self.cpu = cpu
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        if self.cpu:
+            self.cpu_start = time.thread_time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.cpu:
+            self.metrics.add_cpu(self.name, time.thread_time() - self.cpu_start)
+        self.metrics.observe(self.name, time.monotonic() - self.start, self.url, error=exc_type is not None)
+        return False
+
+
+class Metrics:
+    """
+    Thread-safe registry of counters and latency histograms.
+    """
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        # CPU seconds spent by the recording threads inside each stage's spans
+        self.cpu_seconds = {}
+        self.started = time.time()
+        self._trace = None
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1):
+        """Add to a counter."""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, seconds, url=None, error=False):
+        """Record one duration for a stage, and trace it if tracing is enabled."""
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+            if self._trace is not None and url is not None:
+                record = {"ts": round(time.time(), 3), "url": url, "span": name, "seconds": round(seconds, 6)}
+                if error:
+                    record["error"] = True
+                self._trace.write(json.dumps(record) + "\n")
+
+    def add_cpu(self, name, seconds):
+        """Add CPU time spent in a stage."""
+        with self._lock:
+            self.cpu_seconds[name] = self.cpu_seconds.get(name, 0.0) + seconds
+
+    def span(self, name, url=None, cpu=True):
+        """
+        Context manager timing a block as one observation of the named stage.
+
+        With cpu=True the thread's CPU time inside the block is added to the stage;
+        pass False for blocks that yield to other coroutines, which would be counted too.
+        """
+        return _Span(self, name, url, cpu)
+
+    def start_trace(self, trace_file):
+        """Append every span with a URL to trace_file as JSON lines."""
+        with self._lock:
+            self._trace = open(trace_file, "a", encoding="utf-8", buffering=1 << 16)
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.cpu_seconds.clear()
+            self.started = time.time()
+
+    def close(self):
+        with self._lock:
+            if self._trace is not None:
+                self._trace.close()
+                self._trace = None
+
+    def snapshot(self):
+        """Return all counters and histogram statistics as a JSON-serializable dict."""
+        with self._lock:
+            return {
+                "started": self.started,
+                "elapsed_seconds": round(time.time() - self.started, 3),
+                "counters": dict(self.counters),
+                "histograms": {name: histogram.to_dict() for name, histogram in self.histograms.items()},
+                "cpu_seconds": {name: round(seconds, 6) for name, seconds in self.cpu_seconds.items()},
+            }
+
+    def render_prometheus(self):
+        """Render the metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name, value in sorted(self.counters.items()):
+                metric = f"{METRIC_PREFIX}_{name}_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {value}")
+            for name, seconds in sorted(self.cpu_seconds.items()):
+                metric = f"{METRIC_PREFIX}_{name}_cpu_seconds_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {seconds}")
+            for name, histogram in sorted(self.histograms.items()):
+                metric = f"{METRIC_PREFIX}_{name}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                for bound, count in zip((*histogram.buckets, "+Inf"), histogram.counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+                lines.append(f"{metric}_sum {histogram.sum}")
+                lines.append(f"{metric}_count {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, path):
+        """Write the final stats file."""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+    def get_summary(self):
+        """Return a one-line p50/p95 latency summary per stage."""
+        with self._lock:
+            parts = [f"{name} p50 {histogram.quantile(0.5) * 1000:.0f}ms p95 {histogram.quantile(0.95) * 1000:.0f}ms"
+                     for name, histogram in sorted(self.histograms.items())]
+        return "Stage latency: " + ("; ".join(parts) if parts else "no spans recorded")
+
+
+class MetricsExporter:
+    """
+    Publishes Prometheus text while a run is in progress, to a file and/or an HTTP port.
+    """
+    def __init__(self, metrics, metrics_file=None, port=None, interval=5.0):
+        """
+        Args:
+            metrics (Metrics): Registry to export
+            metrics_file (str): File rewritten atomically every interval seconds
+            port (int): Serve the metrics at http://0.0.0.0:<port>/metrics
+            interval (float): Seconds between file updates
+        """
+        self.metrics = metrics
+        self.metrics_file = metrics_file
+        self.interval = interval
+        self.server = None
+        self._stop = threading.Event()
+        self._thread = None
+        if port is not None:
+            handler = type("Handler", (_MetricsHandler,), {"metrics": metrics})
+            self.server = ThreadingHTTPServer(("0.0.0.0", port), handler)
+            self.server.daemon_threads = True
+            threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        if metrics_file:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write_file()
+
+    def write_file(self):
+        temp_file = self.metrics_file + ".tmp"
+        with open(temp_file, "w", encoding="utf-8") as f:
+            f.write(self.metrics.render_prometheus())
+        os.replace(temp_file, self.metrics_file)
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self.write_file()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    metrics = None
+
+    def do_GET(self):
+        body = self.metrics.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Global registry shared by every stage
+metrics = Metrics()
+
+def get_metrics():
+    """Return the global metrics registry."""
+    return metrics
@@ -0,0 +1,266 @@
+# multi_file.py
+"""
+Process a directory (or glob) of <topic>.txt files through one shared worker pool.
+
+Running process_file once per file leaves most workers idle on small files and
+refetches URLs that appear in several files. Here every file's URLs are indexed
+by canonical URL first (UrlIndex), then scheduled round-robin across the files so
+each file gets a fair share of the pool whatever its size. Each canonical URL is
+fetched once and classified in one request against the topics of every file it
+appears in. Every file still gets its own journal, <topic>_labeled.txt and error
+logs next to it, in the layout cleanup.sh sorts into results/ and log/.
+
+Usage:
+    python main.py <directory or 'glob*.txt'> <url_type> [max_workers] [main.py run options]
+"""
+
+import glob
+import os
+import sqlite3
+import sys
+import threading
+from collections import deque
+from tqdm import tqdm
+from error_logger import ErrorLogger
+from journal import Journal
+from streaming import iter_urls, count_urls, ResultWriter
+from url_normalizer import normalize_url
+
+
+def find_topic_files(spec):
+    """
+    Resolve a directory or glob to a sorted list of (input_file, topic) pairs,
+    exiting if there are none or two files name the same topic. Files whose
+    names contain an underscore are outputs or raw lists, not topic files, and
+    files not named after a known topic are skipped.
+    """
+    from main import get_prompt_registry
+
+    paths = glob.glob(os.path.join(spec, "*.txt")) if os.path.isdir(spec) else glob.glob(spec)
+    known_topics = get_prompt_registry().topics
+    files = []
+    topics = {}
+    for path in sorted(paths):
+        topic = os.path.splitext(os.path.basename(path))[0]
+        if not os.path.isfile(path) or "_" in topic:
+            continue
+        if topic not in known_topics:
+            print(f"Skipping {path}: no topic named {topic}")
+            continue
+        if topic in topics:
+            print(f"Both {topics[topic]} and {path} name the topic {topic}")
+            sys.exit(1)
+        topics[topic] = path
+        files.append((path, topic))
+    if not files:
+        print(f"No topic files found in {spec}")
+        sys.exit(1)
+    return files
+
+
+class UrlIndex:
+    """
+    Temporary SQLite index of canonical URL -> topics of the files it appears in.
+    """
+    def __init__(self, index_file):
+        """
+        Args:
+            index_file (str): SQLite file rebuilt for this run and removed on close
+        """
+        self.index_file = index_file
+        self._lock = threading.Lock()
+        if os.path.exists(index_file):
+            os.remove(index_file)
+        self.conn = sqlite3.connect(index_file, check_same_thread=False)
+        # Rebuilt on every run, so durability is not needed
+        self.conn.execute("PRAGMA journal_mode=OFF")
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.conn.execute(
+            "CREATE TABLE urls (url TEXT NOT NULL, topic TEXT NOT NULL, PRIMARY KEY (url, topic)) WITHOUT ROWID"
+        )
+
+    def add_file(self, input_file, topic, fold_www=False):
+        """Index the canonical URLs of one topic file."""
+        rows = []
+        for line in iter_urls(input_file):
+            rows.append((normalize_url(line, fold_www), topic))
+            # Bound memory on very large inputs
+            if len(rows) >= 10_000:
+                self._insert(rows)
+                rows = []
+        self._insert(rows)
+
+    def _insert(self, rows):
+        with self._lock:
+            self.conn.executemany("INSERT OR IGNORE INTO urls (url, topic) VALUES (?, ?)", rows)
+            self.conn.commit()
+
+    def topics(self, url):
+        """Topics of every file the canonical URL appears in."""
+        with self._lock:
+            return [row[0] for row in self.conn.execute("SELECT topic FROM urls WHERE url = ?", (url,))]
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+        os.remove(self.index_file)
+
+
+class _ErrorRouter:
+    """
+    Error logger that files each URL's errors in the logs of the topics it is labeled for.
+    """
+    def __init__(self, error_loggers, topics_for):
+        self.error_loggers = error_loggers
+        self.topics_for = topics_for
+
+    def log_error(self, error_type, url, error_message):
+        topics = self.topics_for(url) or self.error_loggers
+        for topic in topics:
+            self.error_loggers[topic].log_error(error_type, url, error_message)
+
+
+def process_files(input_files, url_type="-", max_workers=50, engine="threads", concurrency=1000, per_host=8,
+                  window=None, flush_every=100, resume=False, batch_size=1, batch_tokens=100_000, batch_timeout=0.5,
+                  parse_workers=None, classify_workers=None, queue_size=100, fold_www=False, stats_file=None,
+                  run_deadline=None):
+    """
+    Process several topic files through one shared engine run.
+
+    Args:
+        input_files (list): (input_file, topic) pairs, as returned by find_topic_files
+        stats_file (str): Stage metrics for the whole run (default: batch_stats.json
+            in the directory of the first file)
+
+    The other arguments are as in process_file. Each file gets its own journal
+    (so resume works per file), <topic>_labeled.txt and error logs.
+    """
+    import main
+
+    topics = [topic for _, topic in input_files]
+    base_dir = os.path.dirname(input_files[0][0])
+    error_loggers = {topic: ErrorLogger(input_file) for input_file, topic in input_files}
+    output_files = {topic: main.output_file_for(input_file, topic) for input_file, topic in input_files}
+    metrics = main.get_metrics()
+    main.reset_run_stats()
+    if batch_size > 1:
+        main.configure_batcher(batch_size, batch_tokens, batch_timeout)
+
+    index = UrlIndex(os.path.join(base_dir, "batch_index.sqlite"))
+    for input_file, topic in input_files:
+        index.add_file(input_file, topic, fold_www)
+    journals = {topic: Journal(input_file, [topic], resume=resume) for input_file, topic in input_files}
+    skipped = sum(journal.count() for journal in journals.values())
+    if skipped:
+        print(f"Resuming: {skipped} URLs already completed")
+    # url handed to the engine -> topics it is labeled for, while in flight
+    jobs = {}
+    jobs_lock = threading.Lock()
+    duplicates = shared = 0
+
+    def topics_for(url):
+        with jobs_lock:
+            return jobs.get(url)
+
+    def unique_urls(input_file, topic):
+        """
+        Stream the file's canonical URLs that start a job, skipping lines that are
+        finished, duplicated or already queued by another file. A job covers every
+        topic whose file lists the URL and has not labeled it yet.
+        """
+        nonlocal duplicates, shared
+        journal = journals[topic]
+        for line in iter_urls(input_file):
+            url = normalize_url(line)
+            key = normalize_url(url, fold_www)
+            if journal.is_done(key):
+                progress.update(1)
+                continue
+            if not journal.claim(key):
+                duplicates += 1
+                progress.update(1)
+                continue
+            job = [topic]
+            for other in index.topics(key):
+                if other != topic and not journals[other].is_done(key) and journals[other].claim(key):
+                    job.append(other)
+            if len(job) > 1:
+                shared += 1
+            with jobs_lock:
+                jobs[url] = job
+            yield url
+
+    def round_robin():
+        """Interleave the files' URLs so each file gets an equal share of the pool."""
+        streams = deque(unique_urls(input_file, topic) for input_file, topic in input_files)
+        while streams:
+            url = next(streams[0], None)
+            if url is None:
+                streams.popleft()
+                continue
+            streams.rotate(-1)
+            yield url
+
+    writers = {topic: ResultWriter(path, flush_every, mode='a' if resume else 'w')
+               for topic, path in output_files.items()}
+    completed = 0
+    finished = False
+    results_run = main.start_results_run(
+        None, topics, url_type, engine, fold_www, {topic: input_file for input_file, topic in input_files},
+        resume=resume)
+    try:
+        with tqdm(
+            total=sum(count_urls(input_file) for input_file, _ in input_files),
+            desc="Processing URLs",
+            unit="url"
+        ) as progress:
+            def on_result(url, labels):
+                nonlocal completed
+                with jobs_lock:
+                    job = jobs.pop(url)
+                labels = labels or {}
+                key = normalize_url(url, fold_www)
+                for topic in job:
+                    label = labels.get(topic, 'i')
+                    writers[topic].write(url, label)
+                    journals[topic].record(key, {topic: label})
+                metrics.inc("urls_completed")
+                completed += 1
+                if completed % flush_every == 0:
+                    for journal in journals.values():
+                        journal.commit()
+                    if results_run is not None:
+                        main.get_results_store().commit()
+                # Lines of other files covered by this job were counted when they were skipped
+                progress.update(1)
+
+            main.run_engine(
+                round_robin(), topics, url_type, on_result, _ErrorRouter(error_loggers, topics_for),
+                engine=engine, max_workers=max_workers, concurrency=concurrency, per_host=per_host,
+                window=window, parse_workers=parse_workers, classify_workers=classify_workers,
+                queue_size=queue_size, topics_for=topics_for, run_deadline=run_deadline,
+                results_run=results_run, fold_www=fold_www,
+            )
+        finished = True
+    finally:
+        main.close_batcher()
+        for writer in writers.values():
+            writer.close()
+        index.close()
+        if results_run is not None:
+            main.get_results_store().finish_run(results_run, completed=finished)
+
+    for input_file, topic in input_files:
+        journal = journals[topic]
+        journal.commit()
+        main.write_output_in_order(input_file, output_files[topic], journal, topic, flush_every, fold_www)
+        journal.close()
+        print(f"Results written to {output_files[topic]}")
+
+    if duplicates:
+        print(f"Deduplicated {duplicates} input lines that normalize to an already queued URL")
+    print(f"{len(input_files)} topic files: {shared} URLs fetched once for several topics")
+    main.report_run_stats(stats_file or os.path.join(base_dir, "batch_stats.json"))
+
+    for error_logger in error_loggers.values():
+        error_logger.write_log()
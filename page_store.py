@@ -0,0 +1,202 @@
+# page_store.py
+"""
+Per-URL store of HTTP validators, page fingerprints and labels for incremental re-crawls.
+
+For every labeled page the store keeps its ETag and Last-Modified headers, a hash
+of the downloaded body, a fingerprint of the extracted text and the labels with the
+version of what made them: the model and prompt (single, multi or batch), or the
+pre-classifier's rules. On the next run the fetcher sends If-None-Match/If-Modified-Since;
+a 304 or an identical body reuses the labels without parsing, and identical extracted
+text reuses them without calling the model, as long as the run accepts their versions.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+
+DEFAULT_PAGE_STORE_FILE = "page_store.sqlite"
+
+
+def body_hash(content):
+    """Hash a downloaded page body."""
+    return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+
+class PageRecord:
+    """
+    What the previous run stored for a URL, with its labels for the current topics
+    and the version each label was made with.
+    """
+    __slots__ = ("etag", "last_modified", "body_hash", "fingerprint", "labels", "versions")
+
+    def __init__(self, etag, last_modified, body_hash, fingerprint, labels, versions):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.body_hash = body_hash
+        self.fingerprint = fingerprint
+        self.labels = labels
+        self.versions = versions
+
+    def request_headers(self):
+        """Conditional request headers for the stored validators."""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class PageStore:
+    """
+    Thread-safe SQLite store of url -> validators, fingerprints and versioned labels.
+    """
+    def __init__(self, store_file=DEFAULT_PAGE_STORE_FILE):
+        """
+        Args:
+            store_file (str): SQLite file shared across runs
+        """
+        self.store_file = store_file
+        # Topics of the run, and versions_for(topics) -> {topic: versions of labels that may be reused}
+        self.topics = []
+        self.versions_for = None
+        # url -> topics the URL is labeled for, when URLs in a run need different topics
+        self.topics_for = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.conn = sqlite3.connect(store_file, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            " url TEXT PRIMARY KEY,"
+            " etag TEXT,"
+            " last_modified TEXT,"
+            " body_hash TEXT,"
+            " fingerprint TEXT,"
+            " labels TEXT NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        self.conn.commit()
+        self.reset_stats()
+
+    def set_label_versions(self, topics, versions_for):
+        """
+        Set the run's topics, and versions_for(topics) returning the {topic: versions}
+        a page labeled for those topics accepts for reuse.
+        """
+        self.topics = list(topics)
+        self.versions_for = versions_for
+
+    def set_url_topics(self, topics_for):
+        """Only require labels for topics_for(url) in lookups, or for every topic if topics_for is None."""
+        self.topics_for = topics_for
+
+    def lookup(self, url):
+        """
+        Return the PageRecord for a URL if it has a label for every current topic
+        made with a version the run accepts, otherwise None.
+        """
+        topics = self.topics
+        if self.topics_for is not None:
+            topics = [topic for topic in self.topics_for(url) or () if topic in self.topics]
+        if not topics or self.versions_for is None:
+            return None
+        accepted = self.versions_for(topics)
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT etag, last_modified, body_hash, fingerprint, labels FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        stored = json.loads(row[4])
+        labels = {}
+        versions = {}
+        for topic in topics:
+            entry = stored.get(topic)
+            if entry is None or entry[1] not in accepted[topic]:
+                return None
+            labels[topic], versions[topic] = entry
+        return PageRecord(row[0], row[1], row[2], row[3], labels, versions)
+
+    def record(self, url, headers, page_hash, fingerprint, labels, versions, reused=None):
+        """
+        Store a page's validators, hashes and labels. Labels for other topics are kept
+        while the fingerprint is unchanged and dropped once the text changes.
+
+        Args:
+            headers (dict): Response headers carrying ETag and Last-Modified
+            page_hash (str): body_hash of the downloaded body
+            fingerprint (str): Hash of the extracted text
+            labels (dict): {topic: label}; only labels with a version are stored
+            versions (dict): {topic: version} of what made each label
+            reused (str): How unchanged labels were reused ('not_modified', 'body' or 'text'), or None
+        """
+        headers = {key.lower(): value for key, value in (headers or {}).items()}
+        with self._lock:
+            if reused:
+                self.unchanged[reused] += 1
+            row = self.conn.execute("SELECT fingerprint, labels FROM pages WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                self.new += 1
+            elif not reused:
+                self.changed += 1
+            stored = json.loads(row[1]) if row and row[0] == fingerprint else {}
+            for topic, label in labels.items():
+                if topic in versions:
+                    stored[topic] = [label, versions[topic]]
+            self.conn.execute(
+                "INSERT OR REPLACE INTO pages (url, etag, last_modified, body_hash, fingerprint, labels, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, headers.get('etag'), headers.get('last-modified'), page_hash, fingerprint,
+                 json.dumps(stored), time.time()),
+            )
+            self._pending += 1
+            if self._pending >= 100:
+                self.conn.commit()
+                self._pending = 0
+
+    def count_unchanged(self, reused):
+        """Count a page whose stored labels were reused without writing the store."""
+        with self._lock:
+            self.unchanged[reused] += 1
+
+    def commit(self):
+        with self._lock:
+            self.conn.commit()
+            self._pending = 0
+
+    def reset_stats(self):
+        with self._lock:
+            self.unchanged = {'not_modified': 0, 'body': 0, 'text': 0}
+            self.changed = 0
+            self.new = 0
+
+    def get_summary(self):
+        """Return a one-line summary of unchanged, changed and new pages."""
+        unchanged = self.unchanged
+        return (f"Incremental re-crawl: {sum(unchanged.values())} URLs skipped as unchanged "
+                f"({unchanged['not_modified']} not modified, {unchanged['body']} same body, "
+                f"{unchanged['text']} same text), {self.changed} changed, {self.new} new")
+
+    def close(self):
+        with self._lock:
+            self.conn.commit()
+            self.conn.close()
+
+
+# Create a global page store shared by all workers; None disables incremental re-crawls
+page_store = None
+
+def configure_page_store(store_file=DEFAULT_PAGE_STORE_FILE):
+    """Open the global page store."""
+    global page_store
+    page_store = PageStore(store_file)
+    return page_store
+
+def get_page_store():
+    """Return the global page store, or None if it is disabled."""
+    return page_store
@@ -0,0 +1,216 @@
+# pipeline.py
+"""
+Staged pipeline engine: fetch, extract and classify run as separately sized
+stages connected by bounded queues.
+
+- Fetch: I/O-bound threads that download each page once.
+- Extract: HTML parsing in a process pool, so it does not hold the GIL that the
+  fetch and classify threads need.
+- Classify: threads calling the rate-limited model API.
+
+Bounded queues between the stages provide backpressure, and each stage reports
+its worker count, throughput and queue depth at the end of the run.
+"""
+
+import concurrent.futures
+import queue
+import threading
+import time
+from fetcher import fetch_page
+from content_reducer import reduction_stats
+from metrics import metrics
+from error_logger import ErrorCollector
+
+
+_DONE = object()
+
+
+def _warm_up():
+    pass
+
+
+def _extract_job(extract, page):
+    collector = ErrorCollector()
+    cpu_start = time.thread_time()
+    content = extract(page, collector)
+    # Token counts and CPU time recorded in the worker process are merged into the parent's stats
+    return content, collector.errors, reduction_stats.drain(), time.thread_time() - cpu_start
+
+
+class Stage:
+    """
+    A pool of worker threads reading from a bounded input queue.
+    """
+    def __init__(self, name, workers, queue_size):
+        self.name = name
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.processed = 0
+        self.max_depth = 0
+        self._depth_total = 0
+        self._samples = 0
+        self._lock = threading.Lock()
+
+    def sample_depth(self):
+        depth = self.queue.qsize()
+        with self._lock:
+            self.max_depth = max(self.max_depth, depth)
+            self._depth_total += depth
+            self._samples += 1
+        return depth
+
+    def start(self, handle, on_close):
+        """Start the workers; once all of them have finished, call on_close()."""
+        threads = [threading.Thread(target=self._work, args=(handle,), daemon=True) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+
+        def close():
+            for thread in threads:
+                thread.join()
+            on_close()
+
+        threading.Thread(target=close, daemon=True).start()
+
+    def close_input(self):
+        """Tell every worker there is no more input."""
+        for _ in range(self.workers):
+            self.queue.put(_DONE)
+
+    def _work(self, handle):
+        while True:
+            item = self.queue.get()
+            if item is _DONE:
+                return
+            handle(item)
+            with self._lock:
+                self.processed += 1
+
+    def get_summary(self):
+        mean = self._depth_total / self._samples if self._samples else 0.0
+        return (f"  {self.name:<9} {self.workers:>4} workers {self.processed:>8} items   "
+                f"queue depth max {self.max_depth:>4} / {self.queue.maxsize:<4} mean {mean:.1f}")
+
+
+def run_pipeline(urls, extract, classify, on_result, inaccessible, error_logger=None, fetch_workers=20,
+                 parse_workers=4, classify_workers=20, queue_size=100, reuse=None, deadline=None,
+                 initializer=None, initargs=()):
+    """
+    Run URLs through the fetch, extract and classify stages.
+
+    Args:
+        urls (iterable): URLs to process (already carrying a scheme), read lazily
+        extract (callable): extract(page, error_logger) -> text; run in worker processes,
+            so it must be a picklable module-level function
+        classify (callable): classify(url, content, page) -> labels, run in classifier threads;
+            page is the fetched page without its body
+        on_result (callable): on_result(url, labels), called in the calling thread;
+            labels is None if a stage failed for the URL
+        inaccessible: Labels reported for pages that fail to load or have no text
+        reuse (callable): Optional reuse(page) -> labels or None, called after fetching;
+            pages it returns labels for skip extraction and classification
+        error_logger (ErrorLogger): Optional error logger
+        fetch_workers, parse_workers, classify_workers (int): Workers per stage
+        queue_size (int): Capacity of each stage's input queue
+        deadline (float): time.monotonic() at which to stop and drop the URLs still in
+            the stages, or None
+        initializer (callable): Optional initializer(*initargs) run in each worker process,
+            e.g. to apply the parent's extraction settings, which are not inherited
+            when processes are spawned rather than forked
+    """
+    fetch = Stage("fetch", fetch_workers, queue_size)
+    parse = Stage("extract", parse_workers, queue_size)
+    model = Stage("classify", classify_workers, queue_size)
+    stages = (fetch, parse, model)
+    results = queue.Queue()
+    # Set at the deadline: the stages drop whatever they still hold
+    stopped = threading.Event()
+
+    def fail(url, stage, error):
+        if stopped.is_set():
+            return
+        if error_logger:
+            error_logger.log_error("executor", url, f"{stage} stage error: {error}")
+        results.put((url, None))
+
+    def handle_fetch(url):
+        if stopped.is_set():
+            return
+        try:
+            page = fetch_page(url, error_logger)
+            labels = reuse(page) if reuse else None
+        except Exception as e:
+            return fail(url, "Fetch", e)
+        if labels is not None:
+            results.put((url, labels))
+        elif page is None or not page.ok:
+            results.put((url, inaccessible))
+        else:
+            parse.queue.put((url, page))
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=parse_workers, initializer=initializer,
+                                                initargs=initargs) as processes:
+        # Start every worker process before the stage threads, so none is forked while a thread holds a lock
+        for future in [processes.submit(_warm_up) for _ in range(parse_workers)]:
+            future.result()
+
+        def handle_parse(item):
+            url, page = item
+            if stopped.is_set():
+                return
+            try:
+                # Timed here because spans recorded inside worker processes are not shipped back
+                with metrics.span("extract", url, cpu=False):
+                    content, errors, reduction, cpu = processes.submit(_extract_job, extract, page).result()
+            except Exception as e:
+                return fail(url, "Extract", e)
+            reduction_stats.merge(reduction, url)
+            metrics.add_cpu("extract", cpu)
+            if error_logger:
+                for error in errors:
+                    error_logger.log_error(*error)
+            if content:
+                model.queue.put((url, content, page.without_body()))
+            else:
+                results.put((url, inaccessible))
+
+        def handle_classify(item):
+            url, content, page = item
+            if stopped.is_set():
+                return
+            try:
+                labels = classify(url, content, page)
+            except Exception as e:
+                return fail(url, "Classify", e)
+            results.put((url, labels))
+
+        fetch.start(handle_fetch, on_close=parse.close_input)
+        parse.start(handle_parse, on_close=model.close_input)
+        model.start(handle_classify, on_close=lambda: results.put(_DONE))
+
+        def feed():
+            for url in urls:
+                if stopped.is_set():
+                    break
+                fetch.queue.put(url)
+            fetch.close_input()
+
+        threading.Thread(target=feed, daemon=True).start()
+
+        # Results are handed back in the calling thread so on_result needs no locking
+        while True:
+            try:
+                item = results.get(timeout=None if deadline is None else max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                # The run deadline passed; the caller labels the stragglers
+                stopped.set()
+                break
+            if item is _DONE:
+                break
+            for stage in stages:
+                stage.sample_depth()
+            on_result(*item)
+
+    print("Pipeline stages:")
+    for stage in stages:
+        print(stage.get_summary())
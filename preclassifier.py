@@ -0,0 +1,354 @@
+# preclassifier.py
+"""
+Local first-stage classifier that labels confident pages without calling Gemini.
+
+Page text is scanned once with an Aho-Corasick automaton built from keywords derived
+from the topic descriptions in topics.topic_dict_medium. A page matching enough
+distinct keywords of a topic (plural and singular forms count once) is labeled
+on-topic; optionally, a long page matching none is labeled unrelated. An optional
+hashed n-gram logistic model (trained with `python preclassifier.py train`) can
+decide the middle band as well. Anything still uncertain is sent to the API.
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import re
+import sys
+import threading
+import zlib
+from collections import Counter, deque
+from topics import topic_dict_medium
+from tokens import estimate_tokens
+from metrics import metrics
+
+
+# Description words that do not point to any one topic, e.g. "content" or "methods"
+GENERIC_TERMS = frozenset("""
+    accessory addiction adult advocacy and appeal behavior chance clinic clothing combat community content context
+    creator debate depicting development discussing disorder eating education entertainment etc excessive explicit
+    featuring for gender glorification graphic guide harm health home identity illegal in include including injury
+    instruction issue manufacturing marketed marketing material may method modification monetization money of online
+    or other physical platform procedure product production promoting promotion providing provocative recreational
+    related relationship right sale selling service sexually sport strategy substance technique termination to topic
+    underage use venue video work
+""".split())
+
+
+def keyword_form(word):
+    """Lower-case singular form of a keyword, so "drugs" and "drug" count as one keyword."""
+    word = word.lower()
+    if not word.isascii():
+        return word
+    if word.endswith('ies') and len(word) > 4:
+        return word[:-3] + 'y'
+    if word.endswith('ves') and len(word) <= 6:
+        return word[:-3] + 'fe'
+    if word.endswith('s') and len(word) > 3 and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
+
+
+def keyword_variants(form):
+    """Spellings of a keyword form that are matched in page text."""
+    if not form.isascii():
+        return [form]
+    if form.endswith('y'):
+        return [form, form[:-1] + 'ies']
+    if form.endswith('fe'):
+        return [form, form[:-2] + 'ves']
+    return [form, form + 's']
+
+
+def keywords_from_descriptions(descriptions):
+    """
+    Derive {topic: [keyword form, ...]} from topic descriptions: the English words of each
+    description and the terms listed after "In Chinese context:". Generic terms and words
+    in the descriptions of several topics are left out, as they say little about a page.
+    """
+    keywords = {}
+    for topic, description in descriptions.items():
+        english, _, chinese = description.partition("In Chinese context:")
+        words = {keyword_form(word) for word in re.findall(r"[a-z][a-z-]*[a-z]", english.lower())}
+        terms = {keyword_form(term.strip()) for term in chinese.split(",")}
+        keywords[topic] = (words, terms - {"", "etc."})
+    shared = Counter(word for words, _ in keywords.values() for word in words)
+    return {
+        topic: sorted(word for word in words if shared[word] == 1 and word not in GENERIC_TERMS) + sorted(terms)
+        for topic, (words, terms) in keywords.items()
+    }
+
+
+# Keywords per topic for the local pre-classifier
+topic_keywords = keywords_from_descriptions(topic_dict_medium)
+
+
+class KeywordMatcher:
+    """
+    Aho-Corasick automaton matching every topic's keywords in one pass over the text.
+    """
+    def __init__(self, keywords):
+        """
+        Args:
+            keywords (dict): {topic: [keyword, ...]}; matching is case-insensitive, and the
+                singular and plural of a keyword are matched as the same keyword
+        """
+        self.patterns = []
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for topic, words in keywords.items():
+            for form in sorted({keyword_form(word) for word in words}):
+                for word in keyword_variants(form):
+                    self._add(word, form, topic)
+        self._build()
+
+    def _add(self, word, form, topic):
+        state = 0
+        for ch in word:
+            if ch not in self.goto[state]:
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+                self.goto[state][ch] = len(self.goto) - 1
+            state = self.goto[state][ch]
+        # ASCII keywords must match whole words, so "gun" does not match "begun"
+        self.patterns.append((word, form, topic, word.isascii()))
+        self.output[state].append(len(self.patterns) - 1)
+
+    def _build(self):
+        # Breadth-first, so every state's failure link is set before its children's
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and ch not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(ch, 0)
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def match(self, text):
+        """Return {topic: Counter(keyword form -> hits)} for the keywords found in the text."""
+        text = text.lower()
+        found = {}
+        state = 0
+        for end, ch in enumerate(text):
+            while state and ch not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(ch, 0)
+            for index in self.output[state]:
+                word, form, topic, whole_word = self.patterns[index]
+                if whole_word:
+                    start = end - len(word) + 1
+                    if (start > 0 and _is_word_char(text[start - 1])) or \
+                            (end + 1 < len(text) and _is_word_char(text[end + 1])):
+                        continue
+                found.setdefault(topic, Counter())[form] += 1
+        return found
+
+
+def _is_word_char(ch):
+    return ch.isascii() and ch.isalnum()
+
+
+_TOKEN_PATTERN = re.compile(r'[a-z0-9]+|[\u3400-\u9fff\uf900-\ufaff]')
+
+
+def _sigmoid(score):
+    return 1 / (1 + math.exp(-max(-30.0, min(30.0, score))))
+
+
+def _dot(weights, features):
+    # Scaled by the feature count so long pages do not saturate the sigmoid
+    return sum(weights.get(bucket, 0.0) for bucket in features) / math.sqrt(max(1, len(features)))
+
+
+class HashedNgramModel:
+    """
+    Per-topic logistic regression over hashed word and CJK-character uni/bigrams.
+    """
+    def __init__(self, dim_bits=18, topics=None):
+        self.dim_bits = dim_bits
+        # {topic: (bias, {bucket: weight})}
+        self.topics = topics or {}
+
+    def features(self, text):
+        """Hashed bucket indices of the text's unigrams and bigrams."""
+        tokens = _TOKEN_PATTERN.findall(text.lower())
+        grams = tokens + [a + ' ' + b for a, b in zip(tokens, tokens[1:])]
+        mask = (1 << self.dim_bits) - 1
+        return {zlib.crc32(gram.encode('utf-8')) & mask for gram in grams}
+
+    def probability(self, text, topic, features=None):
+        """Probability that the text is on-topic, or None if the model has no weights for the topic."""
+        if topic not in self.topics:
+            return None
+        bias, weights = self.topics[topic]
+        features = self.features(text) if features is None else features
+        return _sigmoid(bias + _dot(weights, features))
+
+    def train(self, topic, samples, epochs=5, learning_rate=0.5, l2=1e-6):
+        """
+        Fit the topic's weights with SGD.
+
+        Args:
+            samples (list): (text, label) pairs, label 1 for on-topic and 0 otherwise
+        """
+        data = [(self.features(text), label) for text, label in samples]
+        bias, weights = 0.0, {}
+        for _ in range(epochs):
+            random.shuffle(data)
+            for features, label in data:
+                norm = math.sqrt(max(1, len(features)))
+                error = _sigmoid(bias + _dot(weights, features)) - label
+                bias -= learning_rate * error
+                for bucket in features:
+                    weight = weights.get(bucket, 0.0)
+                    weights[bucket] = weight - learning_rate * (error / norm + l2 * weight)
+        self.topics[topic] = (bias, {bucket: weight for bucket, weight in weights.items() if abs(weight) > 1e-4})
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'dim_bits': self.dim_bits,
+                'topics': {topic: {'bias': bias, 'weights': weights} for topic, (bias, weights) in self.topics.items()},
+            }, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        topics = {
+            topic: (entry['bias'], {int(bucket): weight for bucket, weight in entry['weights'].items()})
+            for topic, entry in data['topics'].items()
+        }
+        return cls(data['dim_bits'], topics)
+
+
+class PreClassifier:
+    """
+    Labels pages locally when the keyword matcher or model is confident.
+    """
+    def __init__(self, positive_keywords=3, negative_tokens=0, model=None, low=0.05, high=0.95,
+                 keywords=topic_keywords):
+        """
+        Args:
+            positive_keywords (int): Distinct topic keywords needed to label a page on-topic; 0 disables
+            negative_tokens (int): Minimum page size in tokens to label a page with no keyword hits
+                unrelated; 0 (the default) disables, as pages about a topic often use none of its keywords
+            model (HashedNgramModel): Optional model deciding pages between the keyword thresholds
+            low, high (float): Model probabilities at or below/above which a page is labeled locally
+            keywords (dict): {topic: [keyword, ...]}
+        """
+        self.positive_keywords = positive_keywords
+        self.negative_tokens = negative_tokens
+        self.model = model
+        self.low = low
+        self.high = high
+        self.matcher = KeywordMatcher(keywords)
+        # Identifies these rules, so stored labels they made are not taken for model labels
+        settings = json.dumps([positive_keywords, negative_tokens, low, high, keywords], sort_keys=True)
+        if model is not None:
+            settings += json.dumps([model.dim_bits, sorted((topic, bias, sorted(weights.items()))
+                                                           for topic, (bias, weights) in model.topics.items())])
+        self.version = "prefilter-" + hashlib.sha256(settings.encode('utf-8')).hexdigest()[:12]
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def predict(self, content, topics):
+        """
+        Return {topic: True/False} for the topics decided locally (True meaning on-topic);
+        topics left out need the API.
+        """
+        found = self.matcher.match(content)
+        tokens = None
+        features = None
+        verdicts = {}
+        for topic in topics:
+            distinct = len(found.get(topic, ()))
+            if self.positive_keywords and distinct >= self.positive_keywords:
+                verdicts[topic] = True
+                continue
+            if self.model is not None:
+                if features is None:
+                    features = self.model.features(content)
+                probability = self.model.probability(content, topic, features)
+                if probability is not None:
+                    if probability >= self.high:
+                        verdicts[topic] = True
+                    elif probability <= self.low and not distinct:
+                        verdicts[topic] = False
+                    continue
+            if self.negative_tokens and not distinct:
+                if tokens is None:
+                    tokens = estimate_tokens(content)
+                if tokens >= self.negative_tokens:
+                    verdicts[topic] = False
+        with self._lock:
+            self.pages += 1
+            self.positive += sum(verdicts.values())
+            self.negative += len(verdicts) - sum(verdicts.values())
+            self.skipped_api += len(verdicts) == len(topics)
+        if len(verdicts) == len(topics):
+            metrics.inc("prefilter_skipped_api")
+        return verdicts
+
+    def reset_stats(self):
+        with self._lock:
+            self.pages = self.positive = self.negative = self.skipped_api = 0
+
+    def get_summary(self):
+        """Return a one-line summary of pages labeled without the API."""
+        share = self.skipped_api / self.pages if self.pages else 0.0
+        return (f"Pre-classifier: {self.skipped_api} of {self.pages} pages ({share:.1%}) labeled without an API call; "
+                f"{self.positive} on-topic and {self.negative} unrelated topic verdicts made locally")
+
+
+# Create a global pre-classifier shared by all workers; None disables it
+preclassifier = None
+
+def configure_preclassifier(positive_keywords=3, negative_tokens=0, model_file=None, low=0.05, high=0.95):
+    """Enable the global pre-classifier, loading the n-gram model if a file is given."""
+    global preclassifier
+    model = HashedNgramModel.load(model_file) if model_file else None
+    preclassifier = PreClassifier(positive_keywords, negative_tokens, model, low, high)
+    return preclassifier
+
+def get_preclassifier():
+    """Return the global pre-classifier, or None if it is disabled."""
+    return preclassifier
+
+
+def train_main(argv=None):
+    """Train a hashed n-gram model from JSON lines of {"topic", "text", "label"} (label 1 or 0)."""
+    parser = argparse.ArgumentParser(description="Train the pre-classifier's hashed n-gram model.")
+    parser.add_argument("data", help="JSON lines file with topic, text and label (1 on-topic, 0 unrelated)")
+    parser.add_argument("output", help="Model file to write")
+    parser.add_argument("--dim-bits", type=int, default=18, help="Log2 of the number of hash buckets (default: 18)")
+    parser.add_argument("--epochs", type=int, default=5, help="Passes over the data (default: 5)")
+    args = parser.parse_args(argv)
+
+    samples = {}
+    with open(args.data, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                samples.setdefault(row['topic'], []).append((row['text'], int(row['label'])))
+
+    model = HashedNgramModel(args.dim_bits)
+    for topic, rows in samples.items():
+        model.train(topic, rows, epochs=args.epochs)
+        print(f"{topic}: trained on {len(rows)} samples, {len(model.topics[topic][1])} weights")
+    model.save(args.output)
+    print(f"Model written to {args.output}")
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] != ['train']:
+        print("Usage: python preclassifier.py train <data.jsonl> <model.json> [--dim-bits N] [--epochs N]")
+        sys.exit(1)
+    train_main(sys.argv[2:])
@@ -0,0 +1,299 @@
+# prompts.py
+"""
+Registry of precompiled classification prompts.
+
+The static instruction prefix for each (prompt kind, topics, detail level, url_type)
+is rendered once, together with its GenerateContentConfig, and reused for every
+request; only the page content is sent as the user turn. The prefix is passed as
+the system instruction, so it can also be stored with the provider's context
+caching and referenced by name instead of being resent.
+
+Every template carries version IDs derived from its text, so the classification
+cache never reuses labels produced by a different prompt.
+"""
+
+import hashlib
+import threading
+import time
+from google.genai import types
+from tokens import estimate_tokens
+from topics import topic_dict_small, topic_dict_medium, topic_dict_max
+
+
+# Bump to invalidate cached labels when prompt handling changes outside the template text
+PROMPT_REVISION = "2"
+
+# A context cache is recreated this fraction of its TTL after it was created, before it lapses
+CACHE_REFRESH_FRACTION = 0.9
+
+# Seconds before retrying a context cache upload that failed with a transient error,
+# doubled after each consecutive failure up to CACHE_RETRY_MAX_SECONDS
+CACHE_RETRY_SECONDS = 30
+CACHE_RETRY_MAX_SECONDS = 1800
+
+DETAIL_LEVELS = {
+    'small': topic_dict_small,
+    'medium': topic_dict_medium,
+    'max': topic_dict_max,
+}
+
+_GUIDELINES = """    INSTRUCTIONS:
+    - Analyze the entire content including titles, headings, links, text, and metadata
+    - Pay special attention to both explicit mentions and implicit references
+    - Consider both English and Chinese language content (including Simplified and Traditional Chinese)
+    - Look for cultural-specific terms and euphemisms commonly used in Chinese websites
+    - Evaluate images based on their descriptions or surrounding context if available
+"""
+
+SINGLE_INSTRUCTIONS = """
+    You are a specialized content classifier analyzing website content for sensitive or restricted topics.
+
+    CLASSIFICATION TASK:
+    Determine if the website content relates to: {description}
+
+""" + _GUIDELINES + """
+    RESPONSE FORMAT:
+    Reply with EXACTLY ONE character:
+    - "{url_type}" if the content IS related to the topic
+    - "u" if the content is NOT related to the topic
+"""
+
+MULTI_INSTRUCTIONS = """
+    You are a specialized content classifier analyzing website content for sensitive or restricted topics.
+
+    CLASSIFICATION TASK:
+    For EACH of the following topics, determine if the website content relates to it:
+{topic_lines}
+
+""" + _GUIDELINES + """
+    RESPONSE FORMAT:
+    Reply with a JSON object mapping every topic name above to true if the content
+    IS related to that topic, or false if it is NOT.
+"""
+
+BATCH_INSTRUCTIONS = """
+    You are a specialized content classifier analyzing website content for sensitive or restricted topics.
+
+    CLASSIFICATION TASK:
+    For EACH numbered website in the message, determine if its content relates to each of these topics:
+{topic_lines}
+
+    - Classify every website independently of the others
+""" + _GUIDELINES + """
+    RESPONSE FORMAT:
+    Reply with a JSON array containing one object per website. Each object has
+    "index" set to the website number and, for every topic name above, true if
+    the content IS related to that topic or false if it is NOT.
+"""
+
+
+def describe_topic(topic, detail="medium"):
+    """Render a topic's description at the given detail level as prompt text."""
+    entry = DETAIL_LEVELS[detail][topic]
+    if isinstance(entry, dict):
+        includes = "; ".join(entry['includes'])
+        examples = ", ".join(entry['examples'])
+        return f"{entry['name']}: {entry['description']}. Includes: {includes}. Examples: {examples}"
+    return entry
+
+
+def _digest(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:12]
+
+
+class PromptTemplate:
+    """
+    A compiled instruction prefix and the request config that carries it.
+    """
+    def __init__(self, kind, topics, detail, url_type, instructions, skeleton, config):
+        self.kind = kind
+        self.topics = list(topics)
+        self.detail = detail
+        self.url_type = url_type
+        self.instructions = instructions
+        self.config = config
+        self.prefix_tokens = estimate_tokens(instructions)
+        # Identifies the whole compiled prompt, e.g. as a context cache display name
+        self.version = f"{kind}-{detail}-{PROMPT_REVISION}-{_digest(instructions)}"
+        # Per-topic versions for the label cache; they only depend on the template and the
+        # topic's own description, so labels are reused whatever other topics share the request
+        self.label_versions = {
+            topic: f"{kind}-{detail}-{PROMPT_REVISION}-{_digest(skeleton + describe_topic(topic, detail))}"
+            for topic in self.topics
+        }
+        # Config referencing the context cache, and time.monotonic() after which it is recreated
+        self.cached_config = None
+        self.cache_refresh_at = 0.0
+        # Consecutive transient failures to create the context cache
+        self.cache_failures = 0
+        # Held while the context cache is created, so one slow upload does not block other templates
+        self.cache_lock = threading.Lock()
+
+
+class PromptRegistry:
+    """
+    Thread-safe cache of compiled prompt templates for one detail level.
+    """
+    def __init__(self, detail="medium", context_cache_ttl=None):
+        """
+        Args:
+            detail (str): Topic description detail level: small, medium or max
+            context_cache_ttl (int): If set, store each instruction prefix with the provider's
+                context caching for this many seconds and reference it by name
+        """
+        if detail not in DETAIL_LEVELS:
+            raise ValueError(f"Unknown prompt detail level: {detail}")
+        self.detail = detail
+        self.topics = DETAIL_LEVELS[detail]
+        self.context_cache_ttl = context_cache_ttl
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key, build):
+        with self._lock:
+            template = self._templates.get(key)
+            if template is None:
+                template = self._templates[key] = build()
+            return template
+
+    def single(self, topic, url_type="-"):
+        """Template answering with one character for a single topic."""
+        def build():
+            instructions = SINGLE_INSTRUCTIONS.format(description=describe_topic(topic, self.detail),
+                                                      url_type=url_type)
+            config = types.GenerateContentConfig(
+                system_instruction=instructions,
+                temperature=0.1,
+                max_output_tokens=1,
+                response_mime_type="text/plain",
+            )
+            return PromptTemplate("single", [topic], self.detail, url_type, instructions, SINGLE_INSTRUCTIONS, config)
+        return self._get(("single", topic, url_type), build)
+
+    def multi(self, topics, url_type="-"):
+        """Template returning a JSON object of booleans, one per topic."""
+        topics = tuple(topics)
+
+        def build():
+            instructions = MULTI_INSTRUCTIONS.format(topic_lines=self._topic_lines(topics))
+            config = types.GenerateContentConfig(
+                system_instruction=instructions,
+                temperature=0.1,
+                max_output_tokens=16 * len(topics) + 16,
+                response_mime_type="application/json",
+                response_schema=types.Schema(
+                    type=types.Type.OBJECT,
+                    properties={topic: types.Schema(type=types.Type.BOOLEAN) for topic in topics},
+                    required=list(topics),
+                ),
+            )
+            return PromptTemplate("multi", topics, self.detail, url_type, instructions, MULTI_INSTRUCTIONS, config)
+        return self._get(("multi", topics, url_type), build)
+
+    def batch(self, topics, url_type="-"):
+        """Template returning a JSON array of indexed verdict objects, one per page."""
+        topics = tuple(topics)
+
+        def build():
+            instructions = BATCH_INSTRUCTIONS.format(topic_lines=self._topic_lines(topics))
+            properties = {topic: types.Schema(type=types.Type.BOOLEAN) for topic in topics}
+            properties["index"] = types.Schema(type=types.Type.INTEGER)
+            # max_output_tokens depends on the batch size and is set per request
+            config = types.GenerateContentConfig(
+                system_instruction=instructions,
+                temperature=0.1,
+                response_mime_type="application/json",
+                response_schema=types.Schema(
+                    type=types.Type.ARRAY,
+                    items=types.Schema(type=types.Type.OBJECT, properties=properties, required=["index", *topics]),
+                ),
+            )
+            return PromptTemplate("batch", topics, self.detail, url_type, instructions, BATCH_INSTRUCTIONS, config)
+        return self._get(("batch", topics, url_type), build)
+
+    def _topic_lines(self, topics):
+        return "\n".join(f"    - {topic}: {describe_topic(topic, self.detail)}" for topic in topics)
+
+    def request_config(self, template, client, model):
+        """
+        Return the config to send with a request. With context caching enabled, the
+        instruction prefix is uploaded once and referenced by name, and uploaded again
+        shortly before its TTL lapses. If the provider does not support caching the
+        prefix (e.g. it is below the minimum size) the inline prefix is used from then
+        on; after a transient error it is used until the upload is retried.
+        """
+        if not self.context_cache_ttl:
+            return template.config
+        if template.cached_config is not None and time.monotonic() < template.cache_refresh_at:
+            return template.cached_config
+        # While another thread refreshes a cache that has not lapsed yet, keep using it
+        if not template.cache_lock.acquire(blocking=template.cached_config is None):
+            return template.cached_config
+        try:
+            if template.cached_config is None or time.monotonic() >= template.cache_refresh_at:
+                self._create_cache(template, client, model)
+            return template.cached_config
+        finally:
+            template.cache_lock.release()
+
+    def _create_cache(self, template, client, model):
+        ttl = int(self.context_cache_ttl)
+        try:
+            cached = client.caches.create(
+                model=model,
+                config=types.CreateCachedContentConfig(
+                    system_instruction=template.instructions,
+                    display_name=template.version,
+                    ttl=f"{ttl}s",
+                ),
+            )
+            if not cached.name:
+                raise ValueError("no cache name returned")
+            template.cached_config = template.config.model_copy(
+                update={"system_instruction": None, "cached_content": cached.name}
+            )
+            template.cache_refresh_at = time.monotonic() + ttl * CACHE_REFRESH_FRACTION
+            template.cache_failures = 0
+        except Exception as e:
+            template.cached_config = template.config
+            if is_unsupported_cache_error(e):
+                print(f"Context caching unavailable for prompt {template.version}: {e}")
+                template.cache_refresh_at = float('inf')
+                return
+            delay = min(CACHE_RETRY_SECONDS * 2 ** template.cache_failures, CACHE_RETRY_MAX_SECONDS)
+            template.cache_failures += 1
+            print(f"Context cache upload failed for prompt {template.version}, retrying in {delay}s: {e}")
+            template.cache_refresh_at = time.monotonic() + delay
+
+    def drop_cache(self, template, cache_name):
+        """Forget a context cache the provider no longer has; the next request creates a new one."""
+        with template.cache_lock:
+            if template.cached_config is not None and template.cached_config.cached_content == cache_name:
+                template.cached_config = None
+                template.cache_refresh_at = 0.0
+
+
+# Create a global registry shared by all workers
+prompt_registry = PromptRegistry()
+
+def configure_prompts(detail="medium", context_cache_ttl=None):
+    """Select the topic detail level and context caching for every prompt."""
+    global prompt_registry
+    prompt_registry = PromptRegistry(detail, context_cache_ttl)
+    return prompt_registry
+
+def get_prompt_registry():
+    """Return the global prompt registry."""
+    return prompt_registry
+
+def is_unsupported_cache_error(error):
+    """
+    True if a context cache upload failed for a reason retrying will not fix, e.g.
+    the model does not support caching or the prefix is below the minimum size.
+    Rate limits, server errors and network failures are transient.
+    """
+    return isinstance(error, ValueError) or getattr(error, 'code', None) in (400, 403, 404)
+
+def is_missing_cache_error(error):
+    """True if the API rejected a request because its context cache expired or was deleted."""
+    return getattr(error, 'code', None) in (400, 403, 404) and 'cache' in str(error).lower()
@@ -0,0 +1,188 @@
+# rate_limiter.py
+"""
+Shared, adaptive rate limiter and retry scheduler for model API calls.
+
+Requests pass through two token buckets, one for requests per minute and one for
+tokens per minute. Both rates shrink multiplicatively when the API answers 429 and
+recover additively with each success. Transient failures (429, 5xx, timeouts and
+connection errors) are retried with jittered exponential backoff; a call that
+still fails after max_retries raises RetriesExhaustedError.
+"""
+
+import random
+import threading
+import time
+import httpx
+from metrics import metrics
+from tail_latency import deadline_remaining
+
+
+TRANSIENT_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class RetriesExhaustedError(Exception):
+    """Raised when a transient error persists after every retry."""
+    def __init__(self, attempts, last_error):
+        super().__init__(f"Gave up after {attempts} attempts: {last_error}")
+        self.attempts = attempts
+        self.last_error = last_error
+
+
+def is_throttle(error):
+    """True if the API rejected the request for exceeding its quota."""
+    return getattr(error, 'code', None) == 429
+
+
+def is_transient(error):
+    """True if the request may succeed when retried."""
+    return (
+        getattr(error, 'code', None) in TRANSIENT_STATUS_CODES
+        or isinstance(error, (httpx.TimeoutException, httpx.TransportError, TimeoutError, ConnectionError))
+    )
+
+
+class _TokenBucket:
+    def __init__(self, per_minute):
+        self.per_minute = per_minute
+        # Allow up to one second's worth of burst
+        self.capacity = max(1.0, per_minute / 60.0)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now, scale):
+        rate = self.per_minute * scale / 60.0
+        self.level = min(self.capacity, self.level + (now - self.updated) * rate)
+        self.updated = now
+
+    def wait_time(self, amount, scale):
+        """Seconds until `amount` is available at the current rate."""
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / (self.per_minute * scale / 60.0)
+
+
+class AdaptiveRateLimiter:
+    """
+    Thread-safe requests/min and tokens/min limiter that backs off on 429 responses.
+    """
+    def __init__(self, requests_per_minute=2000, tokens_per_minute=4_000_000, max_retries=5,
+                 base_delay=1.0, max_delay=60.0, min_scale=0.05, recovery_step=0.002):
+        """
+        Args:
+            requests_per_minute (float): Request quota
+            tokens_per_minute (float): Token quota (prompt plus output tokens)
+            max_retries (int): Retries for a transient failure before giving up
+            base_delay (float): Initial backoff in seconds, doubled on each retry
+            max_delay (float): Upper bound on a single backoff
+            min_scale (float): Lowest fraction of the configured rates to throttle down to
+            recovery_step (float): Fraction of the configured rates regained per success
+        """
+        self.requests = _TokenBucket(requests_per_minute)
+        self.tokens = _TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.min_scale = min_scale
+        self.recovery_step = recovery_step
+        self.scale = 1.0
+        self.calls = 0
+        self.throttled = 0
+        self.retries = 0
+        self.exhausted = 0
+        self._last_backoff = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """Block until a request of the given token size fits within both quotas."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.requests.refill(now, self.scale)
+                self.tokens.refill(now, self.scale)
+                wait = max(self.requests.wait_time(1, self.scale), self.tokens.wait_time(tokens, self.scale))
+                if wait == 0.0:
+                    self.requests.level -= 1
+                    self.tokens.level -= min(tokens, self.tokens.capacity)
+                    return
+            time.sleep(wait)
+
+    def on_success(self):
+        with self._lock:
+            self.calls += 1
+            self.scale = min(1.0, self.scale + self.recovery_step)
+
+    def on_throttle(self):
+        with self._lock:
+            self.throttled += 1
+            now = time.monotonic()
+            # Concurrent 429s from the same burst only halve the rate once
+            if now - self._last_backoff >= 1.0:
+                self.scale = max(self.min_scale, self.scale / 2)
+                # Drop the burst allowance so the new rate takes effect immediately
+                self.requests.level = min(self.requests.level, 0.0)
+                self._last_backoff = now
+
+    def call(self, fn, tokens=1):
+        """
+        Call fn() within the quotas, retrying transient failures with jittered
+        exponential backoff. Non-transient errors are raised immediately. No call or
+        retry is started once the run deadline has passed.
+        """
+        for attempt in range(self.max_retries + 1):
+            if deadline_remaining() == 0:
+                metrics.inc("gemini_gave_up")
+                with self._lock:
+                    self.exhausted += 1
+                raise RetriesExhaustedError(attempt, TimeoutError("run deadline passed"))
+            with metrics.span("rate_limit_wait"):
+                self.acquire(tokens)
+            metrics.inc("gemini_requests")
+            metrics.inc("gemini_tokens_estimated", tokens)
+            try:
+                with metrics.span("gemini_request"):
+                    result = fn()
+            except Exception as e:
+                if not is_transient(e):
+                    raise
+                if is_throttle(e):
+                    metrics.inc("gemini_throttled")
+                    self.on_throttle()
+                if attempt == self.max_retries:
+                    metrics.inc("gemini_gave_up")
+                    with self._lock:
+                        self.exhausted += 1
+                    raise RetriesExhaustedError(attempt + 1, e) from e
+                metrics.inc("gemini_retries")
+                with self._lock:
+                    self.retries += 1
+                # Full jitter keeps retrying workers from synchronizing
+                backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                remaining = deadline_remaining()
+                time.sleep(backoff if remaining is None else min(backoff, remaining))
+                continue
+            self.on_success()
+            return result
+
+    def reset_stats(self):
+        with self._lock:
+            self.calls = self.throttled = self.retries = self.exhausted = 0
+
+    def get_summary(self):
+        """Return a one-line summary of API calls, throttling and retries."""
+        return (f"Gemini API: {self.calls} successful calls, {self.throttled} throttled (429), "
+                f"{self.retries} retries, {self.exhausted} gave up; rate at {self.scale:.0%} of quota")
+
+
+# Create a global limiter shared by every worker thread
+rate_limiter = AdaptiveRateLimiter()
+
+def configure_rate_limiter(requests_per_minute=2000, tokens_per_minute=4_000_000, max_retries=5):
+    """Replace the global rate limiter with the given quotas."""
+    global rate_limiter
+    rate_limiter = AdaptiveRateLimiter(requests_per_minute, tokens_per_minute, max_retries)
+    return rate_limiter
+
+def get_rate_limiter():
+    """Return the global rate limiter."""
+    return rate_limiter
@@ -0,0 +1,458 @@
+# results_store.py
+"""
+Queryable SQLite store of every run's labels, shared across runs and topics.
+
+Each run gets a row in runs, and each topic labeled in it a row in run_topics with
+the model and prompt version its labels were made with. Every (url, topic) result
+is one compact row in results with the host, label, completion time, latency from
+dispatch to result and the category of the URL's first error. Rows are buffered
+and written with one executemany per batch, and are indexed by run, host and
+label, so questions such as "which hosts were labeled p for any topic in the last
+5 runs" are a single indexed query instead of a grep across _labeled.txt files.
+The labels view joins the three tables into one row per result.
+
+A --resume run only processes the URLs its interrupted predecessor left, so it
+is linked to that run (parent_run) and exports follow the chain back to the
+first run. Runs that stopped early are marked incomplete.
+
+Usage:
+    python results_store.py runs [--limit 20]
+    python results_store.py lookup --host example.com [--topic drugs] [--runs 5]
+    python results_store.py hosts --label p [--topic drugs] [--runs 5]
+    python results_store.py export <run_id|latest> --topic drugs [--output drugs_labeled.txt] [--input drugs.txt]
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from host_cache import host_of
+from streaming import iter_urls, ResultWriter
+from url_normalizer import ensure_scheme, normalize_url
+
+
+DEFAULT_RESULTS_FILE = "results.sqlite"
+
+# Result rows buffered before one bulk insert
+BULK_SIZE = 1000
+
+
+class ErrorTap:
+    """
+    Error logger wrapper that remembers the first error category of each URL until
+    its result is recorded.
+    """
+    def __init__(self, error_logger):
+        self.error_logger = error_logger
+        self.categories = {}
+        self._lock = threading.Lock()
+
+    def log_error(self, error_type, url, error_message):
+        with self._lock:
+            self.categories.setdefault(url, error_type)
+        self.error_logger.log_error(error_type, url, error_message)
+
+    def pop(self, url):
+        """Return and forget the URL's first error category, or None."""
+        with self._lock:
+            return self.categories.pop(url, None)
+
+
+class ResultsStore:
+    """
+    Thread-safe SQLite store of runs and their per-URL, per-topic results.
+    """
+    def __init__(self, results_file=DEFAULT_RESULTS_FILE, bulk_size=BULK_SIZE):
+        """
+        Args:
+            results_file (str): SQLite file shared across runs
+            bulk_size (int): Result rows buffered before they are inserted
+        """
+        self.results_file = results_file
+        self.bulk_size = bulk_size
+        self._rows = []
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(results_file, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            " id INTEGER PRIMARY KEY,"
+            " input_file TEXT,"
+            " url_type TEXT,"
+            " engine TEXT,"
+            " fold_www INTEGER NOT NULL DEFAULT 0,"
+            " started_at REAL NOT NULL,"
+            " finished_at REAL,"
+            " completed INTEGER NOT NULL DEFAULT 0,"
+            " parent_run INTEGER)"
+        )
+        # Stores created before runs could be resumed lack the last two columns
+        if "completed" in self._add_columns("runs", {"completed": "INTEGER NOT NULL DEFAULT 0",
+                                                     "parent_run": "INTEGER"}):
+            self.conn.execute("UPDATE runs SET completed = 1 WHERE finished_at IS NOT NULL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS run_topics ("
+            " run_id INTEGER NOT NULL,"
+            " topic TEXT NOT NULL,"
+            " model TEXT,"
+            " prompt_version TEXT,"
+            " input_file TEXT,"
+            " PRIMARY KEY (run_id, topic))"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " run_id INTEGER NOT NULL,"
+            " url TEXT NOT NULL,"
+            " host TEXT NOT NULL,"
+            " topic TEXT NOT NULL,"
+            " label TEXT NOT NULL,"
+            " completed_at REAL NOT NULL,"
+            " latency REAL,"
+            " error TEXT,"
+            " tokens_extracted INTEGER,"
+            " tokens_sent INTEGER)"
+        )
+        self._add_columns("results", {"tokens_extracted": "INTEGER", "tokens_sent": "INTEGER"})
+        self.conn.execute("CREATE INDEX IF NOT EXISTS results_run ON results (run_id, topic, url)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS results_host ON results (host, topic)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS results_label ON results (label, topic, run_id)")
+        # Recreated so stores from before the token columns get them too
+        self.conn.execute("DROP VIEW IF EXISTS labels")
+        self.conn.execute(
+            "CREATE VIEW labels AS"
+            " SELECT r.run_id, r.url, r.host, r.topic, r.label, t.model, t.prompt_version, s.url_type,"
+            " s.started_at, r.completed_at, r.latency, r.error, r.tokens_extracted, r.tokens_sent"
+            " FROM results r JOIN runs s ON s.id = r.run_id"
+            " LEFT JOIN run_topics t ON t.run_id = r.run_id AND t.topic = r.topic"
+        )
+        self.conn.commit()
+        self.reset_stats()
+
+    def _add_columns(self, table, columns):
+        """Add the {name: definition} columns a table created by an older version lacks; return the added names."""
+        existing = {row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+        added = [name for name in columns if name not in existing]
+        for name in added:
+            self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {columns[name]}")
+        return added
+
+    def start_run(self, input_file, url_type, engine, versions, fold_www=False, input_files=None, parent_run=None):
+        """
+        Register a run and return its id.
+
+        Args:
+            input_file (str): Input file of the run, or None
+            versions (dict): {topic: (model, prompt_version)} of the labels made in this run
+            input_files (dict): {topic: input file} when each topic has its own file
+            parent_run (int): Run this one resumes, whose results it does not repeat
+        """
+        input_files = input_files or {}
+        with self._lock:
+            cursor = self.conn.execute(
+                "INSERT INTO runs (input_file, url_type, engine, fold_www, started_at, parent_run)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (os.path.abspath(input_file) if input_file else None, url_type, engine, int(fold_www), time.time(),
+                 parent_run),
+            )
+            run_id = cursor.lastrowid
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO run_topics (run_id, topic, model, prompt_version, input_file)"
+                " VALUES (?, ?, ?, ?, ?)",
+                [(run_id, topic, model, version, os.path.abspath(input_files[topic]) if topic in input_files else None)
+                 for topic, (model, version) in versions.items()],
+            )
+            self.conn.commit()
+        return run_id
+
+    def record(self, run_id, url, labels, latency=None, error=None, tokens=(None, None)):
+        """
+        Buffer one URL's {topic: label} results; they are inserted in bulk.
+
+        Args:
+            url (str): Canonical URL, as keyed in the journal
+            latency (float): Seconds from dispatch to result, if known
+            error (str): Category of the URL's first error, if any
+            tokens (tuple): Content tokens (extracted, sent to the model), if the page was extracted
+        """
+        now = time.time()
+        host = host_of(url)
+        with self._lock:
+            self._rows.extend((run_id, url, host, topic, label, now, latency, error, *tokens)
+                              for topic, label in labels.items())
+            self.recorded += len(labels)
+            if len(self._rows) >= self.bulk_size:
+                self._flush()
+
+    def _flush(self):
+        if self._rows:
+            self.conn.executemany(
+                "INSERT INTO results (run_id, url, host, topic, label, completed_at, latency, error,"
+                " tokens_extracted, tokens_sent) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                self._rows,
+            )
+            self._rows = []
+        self.conn.commit()
+
+    def finish_run(self, run_id, completed=True):
+        """Insert the buffered results and mark the run finished, and whether it processed every URL."""
+        with self._lock:
+            self._flush()
+            self.conn.execute("UPDATE runs SET finished_at = ?, completed = ? WHERE id = ?",
+                              (time.time(), int(completed), run_id))
+            self.conn.commit()
+
+    def latest_run(self, input_file=None, input_files=None):
+        """
+        Id of the latest run of the same input file, or of the same {topic: input file}
+        set when each topic has its own file, or None.
+        """
+        with self._lock:
+            if input_file:
+                row = self.conn.execute("SELECT id FROM runs WHERE input_file = ? ORDER BY id DESC LIMIT 1",
+                                        (os.path.abspath(input_file),)).fetchone()
+            else:
+                files = "\n".join(sorted(f"{topic}={os.path.abspath(path)}"
+                                         for topic, path in (input_files or {}).items()))
+                row = self.conn.execute(
+                    "SELECT id FROM runs WHERE input_file IS NULL AND (SELECT GROUP_CONCAT(entry, char(10)) FROM"
+                    " (SELECT topic || '=' || input_file AS entry FROM run_topics WHERE run_id = runs.id"
+                    " ORDER BY entry)) = ? ORDER BY id DESC LIMIT 1",
+                    (files,),
+                ).fetchone()
+        return row[0] if row else None
+
+    def run_chain(self, run_id):
+        """The run and the runs it resumes, newest first."""
+        chain = []
+        with self._lock:
+            while run_id is not None and run_id not in chain:
+                chain.append(run_id)
+                row = self.conn.execute("SELECT parent_run FROM runs WHERE id = ?", (run_id,)).fetchone()
+                run_id = row[0] if row else None
+        return chain
+
+    def commit(self):
+        with self._lock:
+            self._flush()
+
+    def recent_runs(self, limit):
+        """Ids of the most recent runs, newest first."""
+        with self._lock:
+            return [row[0] for row in self.conn.execute("SELECT id FROM runs ORDER BY id DESC LIMIT ?", (limit,))]
+
+    def get_run(self, run_id, topic=None):
+        """Return (input_file, fold_www) of a run, with the topic's own input file if it has one, or None."""
+        with self._lock:
+            return self.conn.execute(
+                "SELECT COALESCE(t.input_file, r.input_file), r.fold_www FROM runs r"
+                " LEFT JOIN run_topics t ON t.run_id = r.id AND t.topic = ? WHERE r.id = ?",
+                (topic, run_id),
+            ).fetchone()
+
+    def list_runs(self, limit=20):
+        """
+        Return (id, input_file, started_at, status, parent_run, topics, {label: count}) for the
+        latest runs; status is 'done', 'incomplete', or 'running' for a run not finished (or killed).
+        """
+        runs = []
+        for run_id in self.recent_runs(limit):
+            with self._lock:
+                input_file, started, finished, completed, parent_run = self.conn.execute(
+                    "SELECT COALESCE(input_file, (SELECT GROUP_CONCAT(input_file, ',') FROM run_topics"
+                    " WHERE run_id = runs.id)), started_at, finished_at, completed, parent_run FROM runs WHERE id = ?",
+                    (run_id,)
+                ).fetchone()
+                topics = [row[0] for row in self.conn.execute(
+                    "SELECT topic FROM run_topics WHERE run_id = ? ORDER BY topic", (run_id,))]
+                counts = dict(self.conn.execute(
+                    "SELECT label, COUNT(*) FROM results WHERE run_id = ? GROUP BY label", (run_id,)))
+            status = 'running' if finished is None else 'done' if completed else 'incomplete'
+            runs.append((run_id, input_file, started, status, parent_run, topics, counts))
+        return runs
+
+    def lookup_host(self, host, topic=None, runs=None):
+        """Rows of the labels view for a host, newest first, optionally for one topic and the last `runs` runs."""
+        query = ("SELECT run_id, url, topic, label, model, prompt_version, completed_at, latency, error,"
+                 " tokens_extracted, tokens_sent FROM labels WHERE host = ?")
+        params = [host.lower()]
+        if topic:
+            query += " AND topic = ?"
+            params.append(topic)
+        if runs:
+            query += " AND run_id >= ?"
+            params.append(min(self.recent_runs(runs), default=0))
+        with self._lock:
+            return self.conn.execute(query + " ORDER BY run_id DESC, url", params).fetchall()
+
+    def hosts_with_label(self, label, topic=None, runs=None):
+        """Return (host, topics, URL count) of hosts with the label, optionally for one topic and the last runs."""
+        query = "SELECT host, GROUP_CONCAT(DISTINCT topic), COUNT(DISTINCT url) FROM results WHERE label = ?"
+        params = [label]
+        if topic:
+            query += " AND topic = ?"
+            params.append(topic)
+        if runs:
+            query += " AND run_id >= ?"
+            params.append(min(self.recent_runs(runs), default=0))
+        with self._lock:
+            return self.conn.execute(query + " GROUP BY host ORDER BY COUNT(DISTINCT url) DESC, host", params).fetchall()
+
+    def run_labels(self, run_ids, topic):
+        """Yield (url, label) of the runs' results for a topic, oldest run first, in the order they completed."""
+        seen = set()
+        for run_id in sorted(run_ids):
+            with self._lock:
+                rows = self.conn.execute(
+                    "SELECT url, label FROM results WHERE run_id = ? AND topic = ? ORDER BY rowid", (run_id, topic)
+                ).fetchall()
+            for url, label in rows:
+                if url not in seen:
+                    seen.add(url)
+                    yield url, label
+
+    def get_label(self, run_ids, topic, url):
+        """The URL's label for a topic from the newest of the runs that has one, or None."""
+        with self._lock:
+            row = self.conn.execute(
+                f"SELECT label FROM results WHERE run_id IN ({', '.join('?' * len(run_ids))}) AND topic = ?"
+                " AND url = ? ORDER BY run_id DESC, rowid DESC LIMIT 1",
+                (*run_ids, topic, url),
+            ).fetchone()
+        return row[0] if row else None
+
+    def reset_stats(self):
+        with self._lock:
+            self.recorded = 0
+
+    def get_summary(self):
+        """Return a one-line summary of the results recorded in this run."""
+        return f"Results store: {self.recorded} labels recorded in {self.results_file}"
+
+    def close(self):
+        with self._lock:
+            self._flush()
+            self.conn.close()
+
+
+def export_run(store, run_id, topic, output_file, input_file=None):
+    """
+    Write a run's labels for a topic in the _labeled.txt format, including those of
+    the runs it resumes. When the run's input file (or input_file) is available,
+    lines follow the input order with one line per input line, like process_file;
+    otherwise each canonical URL is written once. Returns the number of lines written.
+    """
+    stored_input, fold_www = store.get_run(run_id, topic)
+    input_file = input_file or stored_input
+    chain = store.run_chain(run_id)
+    with ResultWriter(output_file, flush_every=1000) as writer:
+        if input_file and os.path.exists(input_file):
+            for line in iter_urls(input_file):
+                label = store.get_label(chain, topic, normalize_url(line, bool(fold_www)))
+                if label is not None:
+                    writer.write(ensure_scheme(line), label)
+        else:
+            for url, label in store.run_labels(chain, topic):
+                writer.write(url, label)
+        return writer.count
+
+
+# Create a global results store shared by all runs; None disables it
+results_store = None
+
+def configure_results_store(results_file=DEFAULT_RESULTS_FILE):
+    """Open the global results store."""
+    global results_store
+    results_store = ResultsStore(results_file)
+    return results_store
+
+def get_results_store():
+    """Return the global results store, or None if it is disabled."""
+    return results_store
+
+
+def _format_time(timestamp):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp)) if timestamp else "-"
+
+
+def runs_main(argv=None):
+    parser = argparse.ArgumentParser(description="List the latest runs in the results store.")
+    parser.add_argument("--results-file", default=DEFAULT_RESULTS_FILE)
+    parser.add_argument("--limit", type=int, default=20, help="Runs listed (default: 20)")
+    args = parser.parse_args(argv)
+    store = ResultsStore(args.results_file)
+    for run_id, input_file, started, status, parent_run, topics, counts in store.list_runs(args.limit):
+        labels = ", ".join(f"{label}={count}" for label, count in sorted(counts.items()))
+        resumes = f"  (resumes {parent_run})" if parent_run else ""
+        print(f"{run_id:>5}  {_format_time(started)}  {status:<10}  "
+              f"{','.join(topics)}  {input_file or '-'}  {labels}{resumes}")
+    store.close()
+
+
+def lookup_main(argv=None):
+    parser = argparse.ArgumentParser(description="Show the stored labels of a host.")
+    parser.add_argument("--host", required=True, help="Host name, with the port if it is not the default")
+    parser.add_argument("--topic", default=None)
+    parser.add_argument("--runs", type=int, default=None, help="Only the last N runs")
+    parser.add_argument("--results-file", default=DEFAULT_RESULTS_FILE)
+    parser.add_argument("--json", action="store_true", help="Print one JSON object per row")
+    args = parser.parse_args(argv)
+    store = ResultsStore(args.results_file)
+    columns = ("run_id", "url", "topic", "label", "model", "prompt_version", "completed_at", "latency", "error",
+               "tokens_extracted", "tokens_sent")
+    for row in store.lookup_host(args.host, args.topic, args.runs):
+        if args.json:
+            print(json.dumps(dict(zip(columns, row))))
+        else:
+            run_id, url, topic, label, model, version, completed, latency, error, extracted, sent = row
+            tokens = f"{extracted}->{sent} tokens" if extracted is not None else "-"
+            print(f"{run_id:>5}  {url}  {topic}  {label}  {model}:{version}  {_format_time(completed)}  "
+                  f"{f'{latency:.2f}s' if latency is not None else '-'}  {tokens}  {error or ''}")
+    store.close()
+
+
+def hosts_main(argv=None):
+    parser = argparse.ArgumentParser(description="List hosts with a label for any (or one) topic.")
+    parser.add_argument("--label", required=True, help="Label, e.g. p")
+    parser.add_argument("--topic", default=None)
+    parser.add_argument("--runs", type=int, default=None, help="Only the last N runs")
+    parser.add_argument("--results-file", default=DEFAULT_RESULTS_FILE)
+    args = parser.parse_args(argv)
+    store = ResultsStore(args.results_file)
+    for host, topics, urls in store.hosts_with_label(args.label, args.topic, args.runs):
+        print(f"{host}  {topics}  {urls} URLs")
+    store.close()
+
+
+def export_main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a run's labels for a topic in the _labeled.txt format.")
+    parser.add_argument("run", help="Run id, or 'latest'")
+    parser.add_argument("--topic", required=True)
+    parser.add_argument("--output", default=None, help="Output file (default: <topic>_labeled.txt)")
+    parser.add_argument("--input", default=None,
+                        help="Input file giving the line order (default: the run's input file, if it still exists)")
+    parser.add_argument("--results-file", default=DEFAULT_RESULTS_FILE)
+    args = parser.parse_args(argv)
+    store = ResultsStore(args.results_file)
+    run_id = (store.recent_runs(1) or [None])[0] if args.run == "latest" else int(args.run)
+    if run_id is None or store.get_run(run_id) is None:
+        print(f"No run {args.run} in {args.results_file}")
+        sys.exit(1)
+    output_file = args.output or f"{args.topic}_labeled.txt"
+    count = export_run(store, run_id, args.topic, output_file, args.input)
+    print(f"Wrote {count} labels of run {run_id} to {output_file}")
+    store.close()
+
+
+if __name__ == '__main__':
+    commands = {"runs": runs_main, "lookup": lookup_main, "hosts": hosts_main, "export": export_main}
+    if len(sys.argv) < 2 or sys.argv[1] not in commands:
+        print("Usage: python results_store.py runs [--limit N]\n"
+              "       python results_store.py lookup --host <host> [--topic T] [--runs N]\n"
+              "       python results_store.py hosts --label <label> [--topic T] [--runs N]\n"
+              "       python results_store.py export <run_id|latest> --topic T [--output F] [--input F]")
+        sys.exit(1)
+    commands[sys.argv[1]](sys.argv[2:])
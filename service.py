@@ -0,0 +1,276 @@
+# service.py
+"""
+Long-running HTTP/JSON classification service.
+
+The Gemini client, compiled prompt templates, HTTP connection pool and the label,
+host and page caches stay warm between requests, so a verdict costs one fetch and
+at most one model call instead of a batch job. Concurrent requests for the same URL
+and topics share one evaluation, and model calls from concurrent requests are
+micro-batched through the shared batcher.
+
+Endpoints:
+    GET  /classify?url=<url>[&topics=a,b]    -> {"url", "labels", "seconds"}
+    POST /classify       {"url", "topics"}   -> {"url", "labels", "seconds"}
+    POST /classify/bulk  {"urls", "topics"}  -> {"results": [{"url", "labels"}, ...], "seconds"}
+    GET  /health                             -> {"status": "ok", ...}
+    GET  /metrics                            -> Prometheus text
+
+Usage:
+    python service.py [--port 8080] [--topics drugs,tobacco] [--url-type p] [main.py run options]
+"""
+
+import argparse
+import concurrent.futures
+import json
+import signal
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import main
+from error_logger import ErrorLogger
+from fetcher import configure_session, fetch_counter, fetch_page
+from metrics import metrics
+from url_normalizer import normalize_url
+
+
+DEFAULT_PORT = 8080
+
+# URLs accepted by one bulk request
+MAX_BULK_URLS = 1000
+
+
+class ClassificationService:
+    """
+    Classifies single URLs on demand, sharing in-flight evaluations between callers.
+    """
+    def __init__(self, topics, url_type="p", max_workers=50, error_logger=None):
+        """
+        Args:
+            topics (list): Topics served; requests may ask for any subset
+            url_type (str): Label for related URLs (h/p)
+            max_workers (int): URLs evaluated at once
+            error_logger (ErrorLogger): Optional error logger
+        """
+        self.topics = list(topics)
+        self.url_type = url_type
+        self.error_logger = error_logger
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        # (url, sorted topics) -> Future of the evaluation in flight
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.coalesced = 0
+        self.started = time.time()
+        # Topics of the evaluation running in each worker thread, for page store lookups
+        self._evaluating = threading.local()
+        configure_session(max_workers)
+        # The service sees an unbounded stream of URLs; keep only fetch totals
+        fetch_counter.track_urls = False
+
+    def warm(self):
+        """Create the model client and compile the prompt templates before the first request."""
+        main.initialize_client()
+        registry = main.get_prompt_registry()
+        for topic in self.topics:
+            registry.single(topic, self.url_type)
+        if len(self.topics) > 1:
+            registry.multi(self.topics, self.url_type)
+        store = main.get_page_store()
+        if store:
+            store.set_label_versions(self.topics, lambda topics: main.label_versions(topics, self.url_type))
+            # A request for some topics reuses stored labels for those topics alone
+            store.set_url_topics(lambda url: getattr(self._evaluating, "topics", self.topics))
+
+    def check_topics(self, topics):
+        """Return the requested topics as a tuple without repeats, or raise ValueError for topics not served."""
+        if not topics:
+            return tuple(self.topics)
+        unknown = [topic for topic in topics if topic not in self.topics]
+        if unknown:
+            raise ValueError(f"Unknown topics: {', '.join(unknown)}")
+        return tuple(dict.fromkeys(topics))
+
+    def submit(self, url, topics=None):
+        """
+        Start (or join) the evaluation of a URL and return its future of (url, labels).
+        Requests for the same topics in any order share one evaluation.
+        """
+        topics = tuple(sorted(self.check_topics(topics)))
+        url = normalize_url(url)
+        key = (url, topics)
+        with self._lock:
+            self.requests += 1
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                metrics.inc("service_coalesced")
+                return future
+            future = self._inflight[key] = self.executor.submit(self._evaluate, url, topics)
+        future.add_done_callback(lambda _: self._forget(key))
+        return future
+
+    def _forget(self, key):
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def _evaluate(self, url, topics):
+        self._evaluating.topics = topics
+        try:
+            page = fetch_page(url, self.error_logger)
+            labels = main.label_page_topics(url, page, list(topics), self.url_type, self.error_logger)
+        finally:
+            del self._evaluating.topics
+        return url, {topic: labels.get(topic, 'i') for topic in topics}
+
+    def classify(self, url, topics=None):
+        """Classify one URL and return (url, {topic: label}) with the topics in the order requested."""
+        topics = self.check_topics(topics)
+        url, labels = self.submit(url, topics).result()
+        return url, {topic: labels[topic] for topic in topics}
+
+    def classify_many(self, urls, topics=None):
+        """Classify URLs concurrently and return a list of (url, {topic: label}) in order."""
+        topics = self.check_topics(topics)
+        futures = [self.submit(url, topics) for url in urls]
+        return [(url, {topic: labels[topic] for topic in topics})
+                for url, labels in (future.result() for future in futures)]
+
+    def get_status(self):
+        return {"status": "ok", "uptime_seconds": round(time.time() - self.started, 1), "topics": self.topics,
+                "requests": self.requests, "coalesced": self.coalesced}
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+class _ServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    service = None
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        if parsed.path == "/health":
+            return self._send_json(200, self.service.get_status())
+        if parsed.path == "/metrics":
+            return self._send(200, metrics.render_prometheus().encode("utf-8"), "text/plain; version=0.0.4")
+        if parsed.path == "/classify":
+            query = parse_qs(parsed.query)
+            topics = query["topics"][0].split(",") if "topics" in query else None
+            return self._classify(query.get("url", [None])[0], topics)
+        self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        except ValueError:
+            return self._send_json(400, {"error": "invalid JSON"})
+        if not isinstance(request, dict):
+            return self._send_json(400, {"error": "request body must be a JSON object"})
+        if self.path == "/classify":
+            return self._classify(request.get("url"), request.get("topics"))
+        if self.path == "/classify/bulk":
+            return self._classify_bulk(request.get("urls"), request.get("topics"))
+        self._send_json(404, {"error": "not found"})
+
+    def _classify(self, url, topics):
+        if not url or not isinstance(url, str):
+            return self._send_json(400, {"error": "url must be a non-empty string"})
+        started = time.monotonic()
+        try:
+            with metrics.span("service_request", url):
+                url, labels = self.service.classify(url, topics)
+        except ValueError as e:
+            return self._send_json(400, {"error": str(e)})
+        except Exception as e:
+            return self._send_error(url, e)
+        self._send_json(200, {"url": url, "labels": labels, "seconds": round(time.monotonic() - started, 4)})
+
+    def _classify_bulk(self, urls, topics):
+        if not isinstance(urls, list) or not urls or not all(isinstance(url, str) and url for url in urls):
+            return self._send_json(400, {"error": "urls must be a non-empty list of strings"})
+        if len(urls) > MAX_BULK_URLS:
+            return self._send_json(400, {"error": f"at most {MAX_BULK_URLS} urls per request"})
+        started = time.monotonic()
+        try:
+            results = self.service.classify_many(urls, topics)
+        except ValueError as e:
+            return self._send_json(400, {"error": str(e)})
+        except Exception as e:
+            return self._send_error(urls[0], e)
+        self._send_json(200, {"results": [{"url": url, "labels": labels} for url, labels in results],
+                              "seconds": round(time.monotonic() - started, 4)})
+
+    def _send_error(self, url, error):
+        """Log an unexpected classification error and answer 500 instead of dropping the connection."""
+        if self.service.error_logger:
+            self.service.error_logger.log_error("processing", url, f"Service request error: {error}")
+        self._send_json(500, {"error": f"internal error: {type(error).__name__}"})
+
+    def _send_json(self, status, payload):
+        self._send(status, json.dumps(payload).encode("utf-8"), "application/json")
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ServiceServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve URL classifications over HTTP/JSON.")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Port to listen on (default: {DEFAULT_PORT})")
+    parser.add_argument("--topics", default="all", help="Comma-separated topics served, or 'all' (default: all)")
+    parser.add_argument("--url-type", default="p", help="Label to assign to related URLs (h/p, default: p)")
+    parser.add_argument("--max-workers", type=int, default=50, help="URLs evaluated at once (default: 50)")
+    parser.add_argument("--error-log", default="service",
+                        help="Base name of the error logs (default: service -> service_error_messages.log)")
+    main.add_run_arguments(parser)
+    # Micro-batch model calls from concurrent requests without holding a lone request for long
+    parser.set_defaults(batch_size=8, batch_timeout=0.02)
+    # Verdicts are returned to the caller, not recorded per run
+    parser.set_defaults(no_results_store=True)
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    main.configure()
+    args = parse_args()
+    main.apply_run_arguments(args)
+    topics = main.parse_topics(args.topics)
+    if args.batch_size > 1:
+        main.configure_batcher(args.batch_size, args.batch_tokens, args.batch_timeout)
+    error_logger = ErrorLogger(args.error_log)
+    service = ClassificationService(topics, args.url_type, args.max_workers, error_logger)
+    service.warm()
+    handler = type("Handler", (_ServiceHandler,), {"service": service})
+    server = ServiceServer((args.host, args.port), handler)
+    print(f"Serving {', '.join(topics)} at http://{args.host}:{args.port}")
+    # Shut down cleanly on SIGTERM as well as Ctrl-C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+        main.close_batcher()
+        for store in (main.get_cache(), main.get_host_cache(), main.get_page_store()):
+            if store:
+                store.commit()
+        print(f"{service.requests} requests, {service.coalesced} coalesced with one in flight")
+        print(main.get_metrics().get_summary())
+        error_logger.write_log()
+        main.get_metrics().close()
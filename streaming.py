@@ -0,0 +1,61 @@
+# streaming.py
+"""
+Helpers for processing URL lists without holding them in memory: a lazy line reader
+and an output writer that appends each label as soon as it is known.
+"""
+
+
+def iter_urls(input_file):
+    """Yield the non-empty, stripped lines of the input file one at a time."""
+    with open(input_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            url = line.strip()
+            if url:
+                yield url
+
+
+def count_urls(input_file):
+    """Count the URLs in the input file without keeping them in memory."""
+    return sum(1 for _ in iter_urls(input_file))
+
+
+class ResultWriter:
+    """
+    Appends "url label" lines to the output file and flushes them in batches.
+    """
+    def __init__(self, output_file, flush_every=100, mode='w'):
+        """
+        Args:
+            output_file (str): Path of the labeled output file
+            flush_every (int): Number of results to buffer before flushing to disk
+            mode (str): File mode, 'w' to start a new file or 'a' to append
+        """
+        self.output_file = output_file
+        self.flush_every = max(1, flush_every)
+        self.count = 0
+        self._buffer = []
+        self._file = open(output_file, mode, encoding='utf-8')
+
+    def write(self, url, label):
+        """Buffer a single result, flushing once the batch is full."""
+        self._buffer.append(f"{url} {label}\n")
+        self.count += 1
+        if len(self._buffer) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """Write buffered results and flush them to disk."""
+        if self._buffer:
+            self._file.writelines(self._buffer)
+            self._buffer.clear()
+        self._file.flush()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,309 @@
+# tail_latency.py
+"""
+Tail-latency control: adaptive per-host timeouts, hedged fetches and a run deadline.
+
+LatencyTracker keeps a short window of time-to-headers samples per host. With
+adaptive timeouts, each request's socket timeout is a multiple of its host's p95
+(or of the p95 across all hosts for a host not seen yet), clamped between
+min_timeout and the fetch limits' timeout, so a slow host fails fast once it is
+known to be slow while a fast host is not cut off. With hedging, a fetch still
+waiting for headers after its host's p95 is raced against the same URL over the
+other scheme, then the www/non-www host; the first page to arrive wins.
+
+RunDeadline stops handing URLs to the engine once the run deadline passes, and
+labels URLs still in flight or never started 'i' with a timeout reason, so a few
+stragglers cannot hold up the whole run. Socket timeouts and download deadlines
+are capped by the time left (deadline_remaining), and no fetch starts and no
+model call is retried once it has passed, so the stragglers' work ends with the
+run. The tracker also reports the tail of the per-URL latency distribution at
+the end of a run, measured from the moment a URL is handed to the engine to its
+result, so it includes time queued behind the window of URLs in flight.
+"""
+
+import heapq
+import ipaddress
+import threading
+import time
+from collections import OrderedDict, deque
+from urllib.parse import urlsplit
+from host_cache import host_of
+from metrics import Histogram, metrics
+
+
+# Hosts whose recent latencies are kept; the least recently fetched are forgotten
+MAX_HOSTS = 10_000
+
+# Latency samples kept per host, and across all hosts
+HOST_SAMPLES = 20
+GLOBAL_SAMPLES = 1000
+
+# Samples needed before a host's (or the global) percentile is trusted
+MIN_HOST_SAMPLES = 3
+MIN_GLOBAL_SAMPLES = 20
+
+# Slowest URLs listed in the tail report
+SLOWEST_URLS = 5
+
+
+def _percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def alternate_urls(url):
+    """
+    Return variants of a URL that usually serve the same page: the other scheme,
+    then the www. or bare host. IP addresses and single-label hosts get no www variant.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        return []
+    variants = [parts._replace(scheme='https' if parts.scheme == 'http' else 'http').geturl()]
+    host = parts.hostname
+    try:
+        ipaddress.ip_address(host)
+        return variants
+    except ValueError:
+        pass
+    if host.startswith('www.'):
+        other = host[4:]
+    elif '.' in host:
+        other = 'www.' + host
+    else:
+        return variants
+    netloc = parts.netloc.replace(host, other, 1) if host in parts.netloc else other
+    variants.append(parts._replace(netloc=netloc).geturl())
+    return variants
+
+
+class LatencyTracker:
+    """
+    Thread-safe per-host latency windows, hedge counts and the run's per-URL latency tail.
+    """
+    def __init__(self, adaptive=False, hedge=False, min_timeout=2.0, multiplier=3.0, min_hedge_delay=0.25):
+        """
+        Args:
+            adaptive (bool): Derive each request's socket timeout from observed latency
+            hedge (bool): Race slow fetches against alternate scheme and www variants
+            min_timeout (float): Shortest adaptive socket timeout in seconds
+            multiplier (float): Adaptive timeout as a multiple of the p95 latency
+            min_hedge_delay (float): Shortest wait before a hedged request is sent
+        """
+        self.adaptive = adaptive
+        self.hedge = hedge
+        self.min_timeout = min_timeout
+        self.multiplier = multiplier
+        self.min_hedge_delay = min_hedge_delay
+        self._lock = threading.Lock()
+        self._hosts = OrderedDict()
+        self._samples = deque(maxlen=GLOBAL_SAMPLES)
+        self.reset_stats()
+
+    def observe_fetch(self, url, seconds):
+        """Record the time to response headers (or to a timeout) for the URL's host."""
+        host = host_of(url)
+        with self._lock:
+            samples = self._hosts.get(host)
+            if samples is None:
+                samples = self._hosts[host] = deque(maxlen=HOST_SAMPLES)
+                if len(self._hosts) > MAX_HOSTS:
+                    self._hosts.popitem(last=False)
+            else:
+                self._hosts.move_to_end(host)
+            samples.append(seconds)
+            self._samples.append(seconds)
+
+    def _p95(self, url):
+        """The host's p95 latency, else the p95 across hosts, else None."""
+        with self._lock:
+            samples = self._hosts.get(host_of(url))
+            if samples is not None and len(samples) >= MIN_HOST_SAMPLES:
+                return _percentile(samples, 0.95)
+            if len(self._samples) >= MIN_GLOBAL_SAMPLES:
+                return _percentile(self._samples, 0.95)
+        return None
+
+    def timeout_for(self, url, ceiling):
+        """Socket timeout for a request to the URL, at most ceiling seconds."""
+        if not self.adaptive:
+            return ceiling
+        p95 = self._p95(url)
+        if p95 is None:
+            return ceiling
+        return min(ceiling, max(self.min_timeout, p95 * self.multiplier))
+
+    def hedge_delay_for(self, url, ceiling):
+        """Seconds to wait for headers before sending a hedged request, at most ceiling."""
+        p95 = self._p95(url)
+        return min(ceiling, max(self.min_hedge_delay, p95 if p95 is not None else ceiling / 4))
+
+    def record_hedge(self):
+        """Count a hedged request sent."""
+        with self._lock:
+            self.hedges += 1
+        metrics.inc("hedged_fetches")
+
+    def record_hedge_win(self):
+        """Count a hedged request whose page was the one used."""
+        with self._lock:
+            self.hedge_wins += 1
+        metrics.inc("hedge_wins")
+
+    def observe_url(self, url, seconds):
+        """Record one URL's latency from dispatch to result."""
+        metrics.observe("url", seconds)
+        with self._lock:
+            self.url_latency.observe(seconds)
+            self.max_latency = max(self.max_latency, seconds)
+            if len(self.slowest) < SLOWEST_URLS:
+                heapq.heappush(self.slowest, (seconds, url))
+            elif seconds > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, (seconds, url))
+
+    def record_deadline(self, in_flight, not_started):
+        """Count URLs labeled 'i' because the run deadline passed."""
+        with self._lock:
+            self.deadline_in_flight += in_flight
+            self.deadline_not_started += not_started
+        metrics.inc("deadline_expired", in_flight + not_started)
+
+    def reset_stats(self):
+        with self._lock:
+            self.url_latency = Histogram()
+            self.max_latency = 0.0
+            self.slowest = []
+            self.hedges = 0
+            self.hedge_wins = 0
+            self.deadline_in_flight = 0
+            self.deadline_not_started = 0
+
+    def get_summary(self):
+        """Return the per-URL latency tail, hedging and deadline counts."""
+        with self._lock:
+            # Bucket interpolation can overshoot the largest value seen
+            quantiles = {q: min(self.url_latency.quantile(q), self.max_latency) for q in (0.5, 0.9, 0.99, 0.999)}
+            lines = [
+                f"URL latency tail: p50 {quantiles[0.5]:.2f}s, p90 {quantiles[0.9]:.2f}s, "
+                f"p99 {quantiles[0.99]:.2f}s, p99.9 {quantiles[0.999]:.2f}s, "
+                f"max {self.max_latency:.2f}s over {self.url_latency.count} URLs"
+            ]
+            if self.slowest:
+                lines.append("  slowest: " + ", ".join(f"{url} ({seconds:.1f}s)"
+                                                      for seconds, url in sorted(self.slowest, reverse=True)))
+            if self.hedge:
+                lines.append(f"  hedged fetches: {self.hedges} sent, {self.hedge_wins} won")
+            if self.deadline_in_flight or self.deadline_not_started:
+                lines.append(f"  run deadline: {self.deadline_in_flight} URLs in flight and "
+                             f"{self.deadline_not_started} not started labeled 'i'")
+        return "\n".join(lines)
+
+
+class RunDeadline:
+    """
+    Hands URLs to an engine until the deadline, timing each one, and labels the rest 'i'.
+    """
+    def __init__(self, urls, on_result, seconds=None, error_logger=None, record=None):
+        """
+        Args:
+            urls (iterable): URLs to process, read lazily
+            on_result (callable): on_result(url, labels) of the run
+            seconds (float): Wall-clock seconds from now until the deadline, or None for no deadline
+            error_logger (ErrorLogger): Receives a timeout error for every URL cut off
+            record (callable): Optional record(url, labels, latency), called before each result is forwarded
+        """
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds if seconds else None
+        self.error_logger = error_logger
+        global active_deadline
+        # Work still running for this run, even after finish(), stops at its deadline
+        active_deadline = self
+        self._urls = iter(urls)
+        self._on_result = on_result
+        self._record = record
+        self._lock = threading.Lock()
+        # url -> monotonic time it was handed to the engine
+        self._started = {}
+        self._closed = False
+
+    def expired(self):
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def remaining(self):
+        """Seconds left until the deadline (0 once it has passed), or None for no deadline."""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def __iter__(self):
+        while True:
+            with self._lock:
+                # Engines may read URLs from a feeder thread, so the iterator is only advanced under the lock
+                if self._closed or self.expired():
+                    return
+                url = next(self._urls, None)
+                if url is None:
+                    return
+                self._started[url] = time.monotonic()
+            yield url
+
+    def on_result(self, url, labels):
+        """Forward a result to the run, recording its latency; results after finish() are dropped."""
+        with self._lock:
+            if self._closed:
+                return
+            started = self._started.pop(url, None)
+        latency = time.monotonic() - started if started is not None else None
+        if latency is not None:
+            latency_tracker.observe_url(url, latency)
+        self._forward(url, labels, latency)
+
+    def _forward(self, url, labels, latency=None):
+        if self._record:
+            self._record(url, labels, latency)
+        self._on_result(url, labels)
+
+    def finish(self):
+        """
+        Call once the engine has returned: label URLs still in flight and URLs never
+        handed out 'i', with a timeout error. Does nothing if every URL completed.
+        """
+        with self._lock:
+            self._closed = True
+            stragglers = list(self._started.items())
+            self._started.clear()
+        not_started = 0
+        now = time.monotonic()
+        for url, started in stragglers:
+            if self.error_logger:
+                self.error_logger.log_error("timeout", url, f"Run deadline of {self.seconds}s passed while in flight")
+            self._forward(url, None, now - started)
+        for url in self._urls:
+            if self.error_logger:
+                self.error_logger.log_error("timeout", url, f"Run deadline of {self.seconds}s passed before it started")
+            self._forward(url, None)
+            not_started += 1
+        if stragglers or not_started:
+            latency_tracker.record_deadline(len(stragglers), not_started)
+
+
+# The deadline of the latest run; fetches and model retries do not outlive it
+active_deadline = None
+
+def deadline_remaining():
+    """Seconds left until the current run's deadline (0 once it has passed), or None if it has none."""
+    run = active_deadline
+    return run.remaining() if run is not None else None
+
+
+# Global tracker shared by all fetchers; adaptive timeouts and hedging are off until configured
+latency_tracker = LatencyTracker()
+
+def configure_latency(adaptive=False, hedge=False, min_timeout=2.0):
+    """Enable adaptive per-host timeouts and/or hedged fetches."""
+    global latency_tracker
+    latency_tracker = LatencyTracker(adaptive, hedge, min_timeout)
+    return latency_tracker
+
+def get_latency_tracker():
+    """Return the global latency tracker."""
+    return latency_tracker
@@ -0,0 +1,38 @@
+# tests/test_fetch_once.py
+"""Every engine fetches each URL exactly once on its way through fetch, extract and classify."""
+
+import pytest
+import main
+from benchmarks.corpus_server import start_corpus_server
+from error_logger import ErrorCollector
+from fetcher import fetch_counter
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    server, state, base_url = start_corpus_server(page_size=2000)
+    yield state, base_url
+    server.shutdown()
+
+
+@pytest.mark.parametrize("engine", ["threads", "async", "pipeline"])
+def test_each_url_is_fetched_once(corpus, engine, monkeypatch):
+    state, base_url = corpus
+    urls = [f"{base_url}/page/{i}" for i in range(20)]
+    classified = []
+
+    def classify_content(content, topics, url_type="-", url=None, error_logger=None, versions=None):
+        classified.append(url)
+        return {topic: 'p' for topic in topics}
+
+    monkeypatch.setattr(main, "classify_content", classify_content)
+    fetch_counter.reset()
+    requests_before = state.requests
+    results = {}
+    main.run_engine(urls, ["drugs", "tobacco"], "p", results.__setitem__, ErrorCollector(), engine=engine,
+                    max_workers=4, parse_workers=2, classify_workers=2)
+
+    assert results == {url: {"drugs": "p", "tobacco": "p"} for url in urls}
+    assert sorted(classified) == sorted(urls)
+    assert fetch_counter.counts == {url: 1 for url in urls}
+    assert state.requests - requests_before == len(urls)
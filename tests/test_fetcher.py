@@ -0,0 +1,42 @@
+# tests/test_fetcher.py
+"""Tests for detect_encoding and the header checks every engine runs on a response."""
+
+import codecs
+import pytest
+from fetcher import Page, declared_length, detect_encoding, is_html_content_type
+
+
+CHINESE = '<html><head><title>毒品 新闻</title></head><body>' + '中文内容测试 ' * 50 + '</body></html>'
+
+
+@pytest.mark.parametrize("headers, content, encoding", [
+    # No charset anywhere: UTF-8, not the ISO-8859-1 that requests assumes for text/*
+    ({'Content-Type': 'text/html'}, CHINESE.encode('utf-8'), 'utf-8'),
+    ({'content-type': 'text/html; charset="GBK"'}, CHINESE.encode('gbk'), 'gb18030'),
+    ({'Content-Type': 'text/html'}, ('<meta charset="gb2312">' + CHINESE).encode('gbk'), 'gb18030'),
+    ({'Content-Type': 'text/html'},
+     ('<meta http-equiv="Content-Type" content="text/html; charset=big5">' + '中文內容測試').encode('big5'), 'big5'),
+    ({'Content-Type': 'text/html; charset=utf-8'}, codecs.BOM_UTF8 + CHINESE.encode('utf-8'), 'utf-8-sig'),
+    # An unknown declared charset is ignored
+    ({'Content-Type': 'text/html; charset=bogus'}, CHINESE.encode('utf-8'), 'utf-8'),
+    ({'Content-Type': 'text/html; charset=ISO-8859-1'}, 'café'.encode('cp1252'), 'cp1252'),
+])
+def test_detect_encoding(headers, content, encoding):
+    assert detect_encoding(headers, content) == encoding
+
+
+def test_body_truncated_inside_a_character_is_still_utf8():
+    body = CHINESE.encode('utf-8')
+    assert detect_encoding({}, body[:body.index('中'.encode('utf-8')) + 1]) == 'utf-8'
+
+
+def test_undeclared_non_utf8_body_is_detected():
+    page = Page('http://example.com/', 200, 'http://example.com/', {}, CHINESE.encode('gb18030'))
+    assert '毒品 新闻' in page.text
+
+
+def test_headers_are_matched_case_insensitively():
+    headers = {'content-type': 'application/pdf', 'content-length': '1024'}
+    assert not is_html_content_type(headers)
+    assert declared_length(headers) == 1024
+    assert is_html_content_type({'CONTENT-TYPE': 'text/html; charset=utf-8'})
@@ -0,0 +1,58 @@
+# tests/test_journal.py
+"""Tests for the checkpoint journal that lets a killed run resume where it stopped."""
+
+import pytest
+from journal import Journal
+
+
+@pytest.fixture
+def input_file(tmp_path):
+    path = tmp_path / "drugs.txt"
+    path.write_text("http://a.com/\nhttp://b.com/\nhttp://c.com/\n")
+    return str(path)
+
+
+def test_claim_skips_duplicates_within_a_run(input_file):
+    with Journal(input_file, ["drugs"]) as journal:
+        assert journal.claim("http://a.com/")
+        assert not journal.claim("http://a.com/")
+        assert journal.claim("http://b.com/")
+
+
+def test_resume_keeps_recorded_urls(input_file):
+    with Journal(input_file, ["drugs", "tobacco"]) as journal:
+        journal.claim("http://a.com/")
+        journal.claim("http://b.com/")
+        journal.record("http://a.com/", {"drugs": "p", "tobacco": "u"})
+        # Killed before b.com was labeled for every topic
+        journal.record("http://b.com/", {"drugs": "u"})
+
+    with Journal(input_file, ["drugs", "tobacco"], resume=True) as journal:
+        assert journal.is_done("http://a.com/")
+        assert not journal.is_done("http://b.com/")
+        assert not journal.is_done("http://c.com/")
+        assert journal.get_label("http://a.com/", "tobacco") == "u"
+        assert journal.count() == 1
+        # Claims from the killed run are dropped, so unfinished URLs are handed out again
+        assert journal.claim("http://b.com/")
+        journal.record("http://b.com/", {"drugs": "u", "tobacco": "p"})
+        assert journal.is_done("http://b.com/")
+        assert journal.count() == 2
+
+
+def test_without_resume_previous_entries_are_dropped(input_file):
+    with Journal(input_file, ["drugs"]) as journal:
+        journal.record("http://a.com/", {"drugs": "p"})
+
+    with Journal(input_file, ["drugs"]) as journal:
+        assert not journal.is_done("http://a.com/")
+        assert journal.get_label("http://a.com/", "drugs") is None
+
+
+def test_resume_for_a_new_topic_relabels_every_url(input_file):
+    with Journal(input_file, ["drugs"]) as journal:
+        journal.record("http://a.com/", {"drugs": "p"})
+
+    with Journal(input_file, ["drugs", "tobacco"], resume=True) as journal:
+        assert not journal.is_done("http://a.com/")
+        assert journal.get_label("http://a.com/", "drugs") == "p"
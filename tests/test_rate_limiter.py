@@ -0,0 +1,136 @@
+# tests/test_rate_limiter.py
+"""
+Tests for the adaptive rate limiter and retry scheduler, on their own and through
+classify_website against the fake Gemini endpoint injecting throttling and errors.
+"""
+
+import concurrent.futures
+import pytest
+import classification_cache
+import main
+import rate_limiter
+from benchmarks.fake_gemini import start_fake_gemini
+from rate_limiter import AdaptiveRateLimiter, RetriesExhaustedError
+
+
+class ApiError(Exception):
+    """Stands in for the client's API errors, which carry the HTTP status as code."""
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+def failing(codes, result="ok"):
+    """A callable raising ApiError for each code in turn, then returning result."""
+    codes = list(codes)
+    calls = []
+
+    def fn():
+        calls.append(None)
+        if codes:
+            raise ApiError(codes.pop(0))
+        return result
+    fn.calls = calls
+    return fn
+
+
+@pytest.fixture
+def backoffs(monkeypatch):
+    """Record the upper bound of each jittered backoff and retry without waiting."""
+    bounds = []
+
+    def uniform(low, high):
+        bounds.append((low, high))
+        return 0.0
+    monkeypatch.setattr(rate_limiter.random, "uniform", uniform)
+    return bounds
+
+
+def test_throttle_halves_rate_once_per_burst_and_success_recovers():
+    limiter = AdaptiveRateLimiter(recovery_step=0.1)
+    limiter.on_throttle()
+    limiter.on_throttle()
+    assert limiter.scale == 0.5
+    assert limiter.throttled == 2
+    limiter.on_success()
+    assert limiter.scale == pytest.approx(0.6)
+
+
+def test_rate_never_drops_below_min_scale():
+    limiter = AdaptiveRateLimiter(min_scale=0.2)
+    for _ in range(5):
+        limiter._last_backoff = 0.0
+        limiter.on_throttle()
+    assert limiter.scale == 0.2
+
+
+def test_transient_errors_are_retried_with_jittered_backoff(backoffs):
+    limiter = AdaptiveRateLimiter(base_delay=1.0, max_delay=3.0)
+    fn = failing([503, 429, 500, 502])
+    assert limiter.call(fn) == "ok"
+    assert len(fn.calls) == 5
+    assert limiter.retries == 4
+    assert limiter.throttled == 1
+    assert limiter.calls == 1
+    # Full jitter: each backoff is drawn from [0, min(max_delay, base_delay * 2 ** attempt)]
+    assert backoffs == [(0, 1.0), (0, 2.0), (0, 3.0), (0, 3.0)]
+
+
+def test_non_transient_error_is_raised_without_retry(backoffs):
+    limiter = AdaptiveRateLimiter()
+    fn = failing([400])
+    with pytest.raises(ApiError):
+        limiter.call(fn)
+    assert len(fn.calls) == 1
+    assert limiter.retries == 0
+    assert backoffs == []
+
+
+def test_persistent_error_exhausts_retries(backoffs):
+    limiter = AdaptiveRateLimiter(max_retries=3)
+    fn = failing([503] * 10)
+    with pytest.raises(RetriesExhaustedError) as raised:
+        limiter.call(fn)
+    assert raised.value.attempts == 4
+    assert raised.value.last_error.code == 503
+    assert len(fn.calls) == 4
+    assert limiter.exhausted == 1
+
+
+@pytest.fixture
+def fake_gemini(monkeypatch):
+    """Start a fake endpoint with the given settings and point a fresh client and limiter at it."""
+    servers = []
+
+    def start(max_retries=8, **settings):
+        server, state, base_url = start_fake_gemini(answer="p", **settings)
+        servers.append(server)
+        monkeypatch.setenv("GEMINI_BASE_URL", base_url)
+        monkeypatch.setenv("GOOGLE_API_KEY", "fake")
+        monkeypatch.setattr(main, "client", None)
+        monkeypatch.setattr(classification_cache, "label_cache", None)
+        limiter = AdaptiveRateLimiter(6000, 100_000_000, max_retries, base_delay=0.05, max_delay=0.5)
+        monkeypatch.setattr(rate_limiter, "rate_limiter", limiter)
+        return state, limiter
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_throttled_endpoint_still_labels_every_page(fake_gemini):
+    state, limiter = fake_gemini(quota_per_second=10)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=20) as executor:
+        labels = list(executor.map(lambda i: main.classify_website(f"page {i}", "drugs", "p"), range(30)))
+    assert labels == ["p"] * 30
+    assert state.throttled > 0
+    assert limiter.throttled == state.throttled
+    assert limiter.scale < 1.0
+
+
+def test_exhausted_retries_get_the_error_label(fake_gemini):
+    state, limiter = fake_gemini(max_retries=2, error_rate=1.0)
+    assert main.classify_website("page", "drugs", "p") == main.ERROR_LABEL
+    assert state.errors == 3
+    assert limiter.exhausted == 1
@@ -0,0 +1,52 @@
+# tests/test_url_normalizer.py
+"""Tests for normalize_url, which decides when two input lines are the same page."""
+
+import pytest
+from url_normalizer import ensure_scheme, normalize_url
+
+
+@pytest.mark.parametrize("url, canonical", [
+    # Scheme: added when missing, lower-cased otherwise
+    ("example.com", "http://example.com/"),
+    ("HTTPS://example.com/", "https://example.com/"),
+    ("example.com:8080/a", "http://example.com:8080/a"),
+    # Case: the host is lower-cased, the path is not
+    ("http://WWW.Example.COM/Path", "http://www.example.com/Path"),
+    ("http://example.com./", "http://example.com/"),
+    # Default ports are dropped, others kept
+    ("http://example.com:80/a", "http://example.com/a"),
+    ("https://example.com:443/a", "https://example.com/a"),
+    ("https://example.com:80/a", "https://example.com:80/a"),
+    # Fragments are dropped, queries kept without tracking parameters
+    ("http://example.com/a#top", "http://example.com/a"),
+    ("http://example.com/a?id=1&utm_source=x&gclid=y#top", "http://example.com/a?id=1"),
+    # Trailing slashes are removed from non-root paths only
+    ("http://example.com", "http://example.com/"),
+    ("http://example.com/a/b/", "http://example.com/a/b"),
+    ("http://example.com//", "http://example.com/"),
+    ("  http://example.com/a/  ", "http://example.com/a"),
+])
+def test_normalize_url(url, canonical):
+    assert normalize_url(url) == canonical
+
+
+def test_www_is_kept_unless_folded():
+    assert normalize_url("http://www.example.com/a") == "http://www.example.com/a"
+    assert normalize_url("http://www.example.com/a", fold_www=True) == "http://example.com/a"
+    assert normalize_url("www.example.com", fold_www=True) == normalize_url("http://example.com/", fold_www=True)
+    # Only a leading "www." label is folded
+    assert normalize_url("http://wwwexample.com/", fold_www=True) == "http://wwwexample.com/"
+
+
+def test_variants_share_one_canonical_url():
+    variants = ["Example.com", "http://example.com:80", "HTTP://EXAMPLE.COM/#main", "http://example.com/?utm_medium=x"]
+    assert {normalize_url(url) for url in variants} == {"http://example.com/"}
+
+
+def test_malformed_url_is_left_alone():
+    assert normalize_url("http://example.com:99999/") == "http://example.com:99999/"
+
+
+def test_ensure_scheme_keeps_host_port_urls():
+    assert ensure_scheme("example.com:8080/a") == "http://example.com:8080/a"
+    assert ensure_scheme("https://example.com") == "https://example.com"
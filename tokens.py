@@ -0,0 +1,14 @@
+# tokens.py
+"""
+Cheap local token estimate for Gemini requests, used to bound batch and prompt sizes
+without calling the count_tokens API.
+"""
+
+
+def estimate_tokens(text):
+    """
+    Estimate the token count of mixed Chinese/English text: roughly one token per
+    CJK character and one per four other characters.
+    """
+    cjk = sum(1 for ch in text if '\u3000' <= ch <= '\u9fff' or '\uf900' <= ch <= '\ufaff')
+    return cjk + (len(text) - cjk + 3) // 4
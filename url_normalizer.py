@@ -0,0 +1,78 @@
+# url_normalizer.py
+"""
+Canonical form of input URLs, so that spelling variants of the same page are
+fetched and classified once.
+
+normalize_url lower-cases the scheme and host, adds http:// when the scheme is
+missing, drops default ports, fragments and tracking parameters, and removes the
+trailing slash from non-root paths. With fold_www, a leading "www." is dropped
+from the host as well.
+"""
+
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# Query parameters that only track the visitor and never change the page
+TRACKING_PARAMS = frozenset([
+    'gclid', 'dclid', 'gbraid', 'wbraid', 'fbclid', 'msclkid', 'yclid', 'twclid', 'igshid',
+    'mc_cid', 'mc_eid', '_ga', '_gl', '_hsenc', '_hsmi', 'mkt_tok', 'spm', 'share_source',
+])
+TRACKING_PREFIXES = ('utm_',)
+
+
+def _is_tracking(name):
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+
+def ensure_scheme(url):
+    """Ensure the URL has a valid scheme."""
+    # urlparse reads "host:port/path" as scheme "host", so look for "://" instead
+    if '://' not in url:
+        url = f"http://{url}"
+    return url
+
+
+def normalize_url(url, fold_www=False):
+    """
+    Return the canonical form of a URL.
+
+    Args:
+        url (str): URL as it appears in the input, with or without a scheme
+        fold_www (bool): Treat www.example.com and example.com as the same host
+    """
+    url = ensure_scheme(url.strip())
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        # Leave malformed URLs alone; the fetch will report them
+        return url
+
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').rstrip('.')
+    if fold_www and host.startswith('www.'):
+        host = host[4:]
+    if ':' in host:
+        host = f"[{host}]"
+    netloc = host
+    if port is not None and port != DEFAULT_PORTS.get(scheme):
+        netloc = f"{netloc}:{port}"
+    if parts.username is not None:
+        userinfo = parts.username if parts.password is None else f"{parts.username}:{parts.password}"
+        netloc = f"{userinfo}@{netloc}"
+
+    path = parts.path or '/'
+    if len(path) > 1:
+        path = path.rstrip('/') or '/'
+
+    query = parts.query
+    if query:
+        params = parse_qsl(query, keep_blank_values=True)
+        kept = [(name, value) for name, value in params if not _is_tracking(name)]
+        if len(kept) != len(params):
+            query = urlencode(kept)
+
+    return urlunsplit((scheme, netloc, path, query, ''))